@@ -0,0 +1,186 @@
+"""
+Microbenchmark of every augmentation of AudioDataModule, built from augmentation_registry with
+get_augmentation_defaults (and p=1, so that every example is transformed), on random audio.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.augmentations --sample_rates 16000 44100 --batch_sizes 8 32 --len_s 5 --output augs.csv
+    python -m benchmarks.augmentations --augs delay reverb --compare augs.csv
+
+Reports microseconds per second of audio (lower is better) and the peak memory above the
+baseline of each run (allocated CUDA memory on GPU, sampled resident set size on CPU, so
+approximate). With --compare, rows more than --tolerance slower than the baseline CSV are
+flagged and the exit status is 1.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import torch
+
+from mulooc.dataloading.datamodule import augmentation_registry, get_augmentation_defaults
+
+
+def make_noise_bank(path, sample_rate, len_s=30, n_clips=4):
+    # a synthetic bank in the format of prepare_noise_bank, so that "background" needs no audio files
+    lengths = [int(len_s * sample_rate)] * n_clips
+    np.random.randn(sum(lengths)).astype(np.float32).tofile(os.path.join(path, "noise.f32"))
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump({"sample_rate": sample_rate, "offsets": list(np.cumsum([0] + lengths[:-1]).tolist()), "lengths": lengths, "files": []}, f)
+    return path
+
+
+def get_kwargs(name, sample_rate, noise_bank):
+    kwargs = get_augmentation_defaults(sample_rate)[name]
+    if name == "filtering":
+        return {key: {**value, "p": 1.0} for key, value in kwargs.items()}
+    kwargs = {**kwargs, "p": 1.0}
+    if name == "background":
+        kwargs.pop("background_paths")
+        kwargs["noise_bank"] = noise_bank
+    return kwargs
+
+
+def set_mode(tfm, mode):
+    # OneOf and other compositions hold their transforms in .transforms
+    for child in getattr(tfm, "transforms", [tfm]):
+        if mode not in child.supported_modes:
+            return False
+        child.mode = mode
+        child.p_mode = mode
+        child._mode = mode
+    return True
+
+
+def get_rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakMemory:
+    # peak memory above the value at entry, in bytes
+    def __init__(self, device):
+        self.device = device
+        self.peak = 0
+
+    def __enter__(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            self.baseline = torch.cuda.memory_allocated(self.device)
+        else:
+            self.baseline = get_rss()
+            self.running = True
+            self.thread = threading.Thread(target=self.poll, daemon=True)
+            self.thread.start()
+        return self
+
+    def poll(self):
+        while self.running:
+            self.peak = max(self.peak, get_rss() - self.baseline)
+            time.sleep(0.001)
+
+    def __exit__(self, *args):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+            self.peak = torch.cuda.max_memory_allocated(self.device) - self.baseline
+        else:
+            self.running = False
+            self.thread.join()
+            self.peak = max(self.peak, get_rss() - self.baseline)
+
+
+def run(tfm, samples, sample_rate, n_runs, device):
+    # one warmup call, e.g. for kernel caches and thread pools
+    tfm(samples.clone(), sample_rate=sample_rate)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+    with PeakMemory(device) as memory:
+        start = time.perf_counter()
+        for _ in range(n_runs):
+            tfm(samples.clone(), sample_rate=sample_rate)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        elapsed = (time.perf_counter() - start) / n_runs
+    return elapsed, memory.peak
+
+
+def compare(results, path, tolerance):
+    with open(path) as f:
+        baseline = {tuple(row[key] for key in ["aug", "sample_rate", "batch_size", "len_s", "mode", "device"]): row for row in csv.DictReader(f)}
+
+    regressions = []
+    print(f"{'aug':<26}{'sr':>7}{'batch':>7}{'len_s':>7}{'mode':>13}{'us/s':>12}{'baseline':>12}{'ratio':>8}")
+    for row in results:
+        key = tuple(str(row[key]) for key in ["aug", "sample_rate", "batch_size", "len_s", "mode", "device"])
+        if key not in baseline:
+            continue
+        ratio = row["us_per_audio_s"] / float(baseline[key]["us_per_audio_s"])
+        flag = " !" if ratio > 1 + tolerance else ""
+        if flag:
+            regressions.append(key)
+        print(f"{key[0]:<26}{key[1]:>7}{key[2]:>7}{key[3]:>7}{key[4]:>13}{row['us_per_audio_s']:>12.1f}{float(baseline[key]['us_per_audio_s']):>12.1f}{ratio:>7.2f}x{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--augs", type=str, nargs="+", default=list(augmentation_registry))
+    parser.add_argument("--sample_rates", type=int, nargs="+", default=[16000, 44100])
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--len_s", type=float, nargs="+", default=[1, 5])
+    parser.add_argument("--modes", type=str, nargs="+", default=["per_example", "per_batch"])
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--n_runs", type=int, default=3)
+    parser.add_argument("--noise_bank", type=str, default=None, help="noise bank for background, a synthetic one by default")
+    parser.add_argument("--output", type=str, default=None, help="write the results to this CSV")
+    parser.add_argument("--compare", type=str, default=None, help="CSV of a previous run to flag regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    np.random.seed(0)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'aug':<26}{'sr':>7}{'batch':>7}{'len_s':>7}{'mode':>13}{'us/s':>12}{'peak MB':>10}")
+        for sample_rate in args.sample_rates:
+            noise_bank = args.noise_bank
+            if noise_bank is None and "background" in args.augs:
+                noise_bank = make_noise_bank(tempfile.mkdtemp(dir=tmp), sample_rate, len_s=max(args.len_s) + 1)
+            for name in args.augs:
+                for mode in args.modes:
+                    tfm = augmentation_registry[name](get_kwargs(name, sample_rate, noise_bank))
+                    if not set_mode(tfm, mode):
+                        continue
+                    tfm = tfm.to(device)
+                    for batch_size in args.batch_sizes:
+                        for len_s in args.len_s:
+                            samples = (torch.randn(batch_size, 1, int(len_s * sample_rate)) * 0.1).to(device)
+                            elapsed, peak = run(tfm, samples, sample_rate, args.n_runs, device)
+                            row = {
+                                "aug": name, "sample_rate": sample_rate, "batch_size": batch_size, "len_s": len_s, "mode": mode, "device": device.type,
+                                "us_per_audio_s": elapsed * 1e6 / (batch_size * len_s), "peak_mb": peak / 1e6,
+                            }
+                            results.append(row)
+                            print(f"{name:<26}{sample_rate:>7}{batch_size:>7}{len_s:>7}{mode:>13}{row['us_per_audio_s']:>12.1f}{row['peak_mb']:>10.1f}")
+
+    if args.output is not None:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+    if args.compare is not None:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions above {args.tolerance:.0%}")
+            sys.exit(1)
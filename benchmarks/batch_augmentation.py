@@ -0,0 +1,95 @@
+"""
+Compares input pipeline steps/s of per-item augmentation (inside AudioDataset workers) with
+the batch-level stage of AudioDataModule (``batch_augment``), which runs the chains on the
+collated [B*N, 1, T] batch before or after the transfer to the device.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.batch_augmentation --audio_dir /data/fma_medium --var_augs gain polarity_inversion --device cuda
+
+A step is one batch loaded, moved to the device and augmented; no model is run, so the numbers
+are an upper bound on training throughput for each path.
+"""
+import argparse
+import time
+
+import torch
+
+from mulooc.dataloading.datamodule import AudioDataModule
+from mulooc.models.encoders.frontend import Melgram
+
+
+def measure(dm, n_batches, device):
+    dm.setup()
+    loader = dm.train_dataloader()
+
+    steps = 0
+    start = None
+    for batch in loader:
+        if dm.batch_augment == "before_transfer":
+            batch = dm.augment_batch(batch)
+        batch["audio"] = batch["audio"].to(device, non_blocking=True)
+        if dm.batch_augment == "after_transfer":
+            batch = dm.augment_batch(batch)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+
+        # the first batch includes worker startup
+        if start is None:
+            start = time.perf_counter()
+            continue
+        steps += 1
+        if steps == n_batches:
+            break
+
+    elapsed = time.perf_counter() - start
+    return {"steps_per_s": steps / elapsed, "elapsed_s": elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--task", type=str, default=None)
+    parser.add_argument("--audio_dir", type=str, default=None)
+    parser.add_argument("--target_len_s", type=float, default=5)
+    parser.add_argument("--target_sr", type=int, default=16000)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_workers", type=int, default=8)
+    parser.add_argument("--n_augmentations", type=int, default=2)
+    parser.add_argument("--n_batches", type=int, default=50)
+    parser.add_argument("--base_augs", type=str, nargs="*", default=["gain"])
+    parser.add_argument("--var_augs", type=str, nargs="*", default=[])
+    parser.add_argument("--frontend", action="store_true", help="include the Melgram frontend in the measured path")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--modes", type=str, nargs="+", default=["per_item", "before_transfer", "after_transfer"])
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    augmentations = {
+        "base": {"augs": {aug: {} for aug in args.base_augs}, "p": 0.75},
+        "var": {"augs": {aug: {} for aug in args.var_augs}, "p": 0.75},
+    }
+
+    results = {}
+    for mode in args.modes:
+        dm = AudioDataModule(
+            task=args.task,
+            audio_dir=args.audio_dir,
+            target_len_s=args.target_len_s,
+            target_sr=args.target_sr,
+            target_n_samples=int(args.target_len_s * args.target_sr),
+            augmentations=augmentations,
+            batch_size=args.batch_size,
+            num_workers=args.num_workers,
+            transform=True,
+            n_augmentations=args.n_augmentations,
+            frontend=Melgram(sample_rate=args.target_sr) if args.frontend else None,
+            batch_augment=None if mode == "per_item" else mode,
+        )
+        results[mode] = measure(dm, args.n_batches, device)
+        print(mode, results[mode])
+
+    baseline = results.get("per_item")
+    print(f"{'mode':<20}{'steps/s':>12}{'vs per_item':>14}")
+    for mode, result in results.items():
+        speedup = result["steps_per_s"] / baseline["steps_per_s"] if baseline else float("nan")
+        print(f"{mode:<20}{result['steps_per_s']:>12.2f}{speedup:>13.2f}x")
@@ -0,0 +1,106 @@
+"""
+Measures training read throughput of AudioDataModule under different sampling orders.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.loader_throughput --audio_dir /data/fma_medium --samplers shuffle block:window=1 block:window=16
+
+Each sampler spec is ``name`` or ``name:key=value,key=value`` with a name from
+mulooc.dataloading.samplers, ``shuffle`` being the plain ``shuffle=True`` order.
+Page cache state matters: run each configuration on a cold cache (or with a different
+--seed so that they read different files) for a fair comparison.
+"""
+import argparse
+import os
+import time
+
+import torch
+
+from mulooc.dataloading.datamodule import AudioDataModule
+from mulooc.dataloading.samplers import samplers
+
+
+def parse_value(value):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_sampler(spec):
+    name, _, args = spec.partition(":")
+    kwargs = {}
+    for arg in filter(None, args.split(",")):
+        key, value = arg.split("=")
+        kwargs[key] = parse_value(value)
+    return name, kwargs
+
+
+def get_plan(dataset, name, kwargs, n_items, seed):
+    if name == "shuffle":
+        generator = torch.Generator().manual_seed(seed)
+        plan = torch.randperm(len(dataset), generator=generator).tolist()
+    else:
+        sampler = samplers[name](dataset, seed=seed, **kwargs)
+        plan = list(sampler)
+    return plan[:n_items]
+
+
+def measure(dataset, plan, batch_size, num_workers):
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, num_workers=num_workers, sampler=plan)
+
+    start = time.perf_counter()
+    for _ in loader:
+        pass
+    elapsed = time.perf_counter() - start
+
+    indices = [idx[0] if isinstance(idx, tuple) else idx for idx in plan]
+    paths = [dataset.get_path(i) for i in indices]
+    n_bytes = sum(os.path.getsize(path) for path in paths)
+
+    return {
+        "files_per_s": len(plan) / elapsed,
+        "mb_per_s": n_bytes / elapsed / 1e6,
+        "elapsed_s": elapsed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--task", type=str, default=None)
+    parser.add_argument("--audio_dir", type=str, default=None)
+    parser.add_argument("--target_len_s", type=float, default=5)
+    parser.add_argument("--target_sr", type=int, default=16000)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_workers", type=int, default=8)
+    parser.add_argument("--n_batches", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--samplers", type=str, nargs="+", default=["shuffle", "block"])
+    args = parser.parse_args()
+
+    dm = AudioDataModule(
+        task=args.task,
+        audio_dir=args.audio_dir,
+        target_len_s=args.target_len_s,
+        target_sr=args.target_sr,
+        target_n_samples=int(args.target_len_s * args.target_sr),
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        n_augmentations=1,
+    )
+    dm.setup()
+
+    results = {}
+    for spec in args.samplers:
+        name, kwargs = parse_sampler(spec)
+        plan = get_plan(dm.train_dataset, name, kwargs, args.n_batches * args.batch_size, args.seed)
+        results[spec] = measure(dm.train_dataset, plan, args.batch_size, args.num_workers)
+        print(spec, results[spec])
+
+    baseline = results.get("shuffle")
+    print(f"{'sampler':<32}{'files/s':>12}{'MB/s':>12}{'vs shuffle':>12}")
+    for spec, result in results.items():
+        speedup = result["files_per_s"] / baseline["files_per_s"] if baseline else float("nan")
+        print(f"{spec:<32}{result['files_per_s']:>12.1f}{result['mb_per_s']:>12.1f}{speedup:>11.2f}x")
@@ -0,0 +1,90 @@
+"""
+Accuracy and speed of Melgram(native_sr=True), which computes the mel spectrogram at the
+audio's own sample rate, against resampling to Melgram.sample_rate first (the default path),
+on synthetic harmonic tones over noise or on the first seconds of --files.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.native_sr_mel --native_srs 22050 44100 48000 --batch_size 16 --device cuda
+
+Reports milliseconds per batch of each path (the resampling is part of the default path) and
+the difference between their log-mel outputs in dB: mean over all bins, and over the bins
+within 60 dB of the peak of their example, where the noise floor does not weigh in.
+"""
+import argparse
+import math
+import time
+
+import soundfile as sf
+import torch
+import torchaudio
+
+from mulooc.models.encoders.frontend import Melgram
+
+
+def make_signal(batch_size, n_samples, sample_rate):
+    # a random harmonic tone per example over low noise
+    t = torch.arange(n_samples) / sample_rate
+    f0 = 110 * 2 ** (torch.rand(batch_size, 1) * 3)
+    signal = sum(torch.sin(2 * math.pi * k * f0 * t) / k for k in range(1, 9))
+    return (0.2 * signal + 0.01 * torch.randn(batch_size, n_samples)).unsqueeze(1)
+
+
+def load_files(files, batch_size, n_samples, sample_rate):
+    audio = []
+    for path in files[:batch_size]:
+        data, sr = sf.read(path, frames = int(n_samples * sf.info(path).samplerate / sample_rate), always_2d = True, dtype = "float32")
+        data = torch.from_numpy(data.T).mean(dim = 0)
+        audio.append(torchaudio.functional.resample(data, sr, sample_rate) if sr != sample_rate else data)
+    n_samples = min(a.shape[-1] for a in audio)
+    return torch.stack([a[:n_samples] for a in audio]).unsqueeze(1)
+
+
+def run(frontend, audio, sample_rate, n_runs, device):
+    with torch.no_grad():
+        out = frontend(audio, sample_rate = sample_rate)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        for _ in range(n_runs):
+            out = frontend(audio, sample_rate = sample_rate)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / n_runs, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--native_srs", type=int, nargs="+", default=[22050, 44100, 48000])
+    parser.add_argument("--frontend_sr", type=int, default=16000)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--len_s", type=float, default=5)
+    parser.add_argument("--files", type=str, nargs="+", default=None, help="audio files to use instead of synthetic tones, resampled to each native rate")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--n_runs", type=int, default=5)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    resampled = Melgram(sample_rate=args.frontend_sr).to(device)
+    native = Melgram(sample_rate=args.frontend_sr, native_sr=True).to(device)
+
+    print(f"{'native sr':>10}{'resample ms':>14}{'native ms':>12}{'speedup':>10}{'dB err':>10}{'dB err (top 60 dB)':>20}")
+    for sample_rate in args.native_srs:
+        n_samples = int(args.len_s * sample_rate)
+        if args.files is not None:
+            audio = load_files(args.files, args.batch_size, n_samples, sample_rate)
+        else:
+            audio = make_signal(args.batch_size, n_samples, sample_rate)
+        audio = audio.to(device)
+
+        resampled_s, reference = run(resampled, audio, sample_rate, args.n_runs, device)
+        native_s, out = run(native, audio, sample_rate, args.n_runs, device)
+
+        error = (out - reference).abs()
+        peaks = reference.amax(dim=(-2, -1), keepdim=True)
+        top = reference > peaks - 60
+        print(
+            f"{sample_rate:>10}{resampled_s * 1000:>14.1f}{native_s * 1000:>12.1f}{resampled_s / native_s:>9.2f}x"
+            f"{error.mean().item():>10.2f}{error[top].mean().item():>20.2f}"
+        )
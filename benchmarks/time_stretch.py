@@ -0,0 +1,61 @@
+"""
+Throughput of TimeStretchAudiomentation with the batched torch phase vocoder against the
+per-example librosa path, on random audio.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.time_stretch --sample_rate 44100 --batch_sizes 8 32 --devices cpu cuda
+
+Reports audio seconds processed per wall-clock second (higher is better) and, for the torch
+backend, the relative error against librosa on the same rates.
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from mulooc.dataloading.augmentations import TimeStretch
+
+
+def run(tfm, samples, n_runs, device):
+    out = tfm(samples.clone()).samples
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+    start = time.perf_counter()
+    for _ in range(n_runs):
+        out = tfm(samples.clone()).samples
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / n_runs, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample_rate", type=int, default=16000)
+    parser.add_argument("--len_s", type=float, default=5)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--devices", type=str, nargs="+", default=["cpu"] + (["cuda"] if torch.cuda.is_available() else []))
+    parser.add_argument("--n_runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10}{'device':<8}{'batch':>8}{'ms/batch':>12}{'audio s/s':>12}{'rel. error':>12}")
+    for batch_size in args.batch_sizes:
+        samples = torch.randn(batch_size, 1, int(args.len_s * args.sample_rate)) * 0.1
+
+        # librosa runs on CPU whatever the device, measure it once per batch size
+        librosa_tfm = TimeStretch(p=1.0, sample_rate=args.sample_rate, backend="librosa", output_type="dict")
+        np.random.seed(0)
+        torch.manual_seed(0)
+        elapsed, reference = run(librosa_tfm, samples, args.n_runs, torch.device("cpu"))
+        print(f"{'librosa':<10}{'cpu':<8}{batch_size:>8}{elapsed * 1000:>12.1f}{batch_size * args.len_s / elapsed:>12.1f}{'':>12}")
+
+        for device in map(torch.device, args.devices):
+            torch_tfm = TimeStretch(p=1.0, sample_rate=args.sample_rate, backend="torch", output_type="dict")
+            # same seed, so both backends draw the same rates on the last run
+            np.random.seed(0)
+            torch.manual_seed(0)
+            elapsed, out = run(torch_tfm, samples.to(device), args.n_runs, device)
+            error = ((out.cpu() - reference).norm() / reference.norm()).item()
+            print(f"{'torch':<10}{device.type:<8}{batch_size:>8}{elapsed * 1000:>12.1f}{batch_size * args.len_s / elapsed:>12.1f}{error:>12.4f}")
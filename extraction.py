@@ -19,6 +19,9 @@ def extract_representations(config):
     data_config['frontend'] = frontend
         
     mode = config['aug_mode']
+    if data_config.get('feature_store') is not None:
+        # every split is augmented below, the stored features are clean
+        raise ValueError("extraction augments every split, it cannot read a feature_store")
             
     dm = AudioDataModule(**data_config)
     dm.setup()
@@ -167,16 +170,9 @@ def get_embeddings(dataloader, model, epoch = 1, device = 'cuda', data_config =
         audio_embeddings += audio_embedding
         clean_audio_embeddings += clean_audio_embedding
         
-        # extend transform_params by recursively going through keys and appending lists when they exist
-        for augmentation in transform_parameters.keys():
-            if augmentation not in transform_params.keys():
-                transform_params[augmentation] = {}
-            for key in transform_parameters[augmentation].keys():
-                # if key=='transpositions':
-                #     transform_parameters[augmentation][key] = [float(12.0 * log2(ratio)) for ratio in transform_parameters[augmentation][key]]
-                if key not in transform_params[augmentation].keys():
-                    transform_params[augmentation][key] = []
-                transform_params[augmentation][key].append(transform_parameters[augmentation][key].contiguous().view(-1))
+        # transform parameters are flat "<augmentation>.<parameter>" records of shape [bsz, chunks]
+        for key, value in transform_parameters.items():
+            transform_params.setdefault(key, []).append(value.contiguous().view(-1))
     
     
     
@@ -187,11 +183,12 @@ def get_embeddings(dataloader, model, epoch = 1, device = 'cuda', data_config =
     
     ## pretty print the 
     
-    # flatten each key of the transform parameters
-    for augmentation in transform_params.keys():
-        for key in transform_params[augmentation].keys():
-            transform_params[augmentation][key] = torch.cat(transform_params[augmentation][key], dim = 0)
-            # print(f'{augmentation} {key} shape: {transform_params[augmentation][key].shape}')
+    # concatenate each record, then nest them as {augmentation: {parameter: values}} for saving
+    records = {key: torch.cat(values, dim = 0) for key, values in transform_params.items()}
+    for key, values in records.items():
+        augmentation, parameter = key.split('.', 1)
+        transform_params.setdefault(augmentation, {})[parameter] = values
+        del transform_params[key]
     
     
     # mean audio embeddings for each index
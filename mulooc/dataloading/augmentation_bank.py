@@ -0,0 +1,153 @@
+import os
+import pickle
+
+import numpy as np
+import torch
+from pedalboard import Pedalboard, PitchShift, Reverb
+from tqdm import tqdm
+
+from mulooc.dataloading.augmentations.time_stretch import phase_vocoder_stretch
+from mulooc.dataloading.loading_utils import get_audio_duration, load_audio_chunk, load_full_and_split
+
+
+def render_pitch_shift(audio, value, sample_rate):
+    board = Pedalboard([PitchShift(semitones = value)])
+    return torch.from_numpy(board(audio.numpy(), sample_rate))
+
+
+def render_time_stretch(audio, value, sample_rate):
+    return phase_vocoder_stretch(audio, value)
+
+
+def render_reverb(audio, value, sample_rate):
+    board = Pedalboard([Reverb(room_size = value, wet_level = 0.5, dry_level = 0.5)])
+    return torch.from_numpy(board(audio.numpy(), sample_rate))
+
+
+# expensive transforms that can be pre-rendered, recorded under the class name and parameter
+# that the online transform uses, so that augs labels and transform_parameters keep their keys
+bank_augmentations = {
+    "pitch_shift": {"name": "PitchShiftAudiomentation", "parameter": "semitones", "identity": 0.0, "render": render_pitch_shift},
+    "timestretch": {"name": "TimeStretchAudiomentation", "parameter": "stretch_rates", "identity": 1.0, "render": render_time_stretch},
+    "reverb": {"name": "ReverbAudiomentation", "parameter": "room_size", "identity": 0.0, "render": render_reverb},
+}
+
+
+def get_crops(path, target_n_samples, target_sr, n_crops = None):
+    # all consecutive crops of the file (as load_full_and_split) or n_crops evenly spaced ones
+    if n_crops is None:
+        return load_full_and_split(path, target_sr, target_n_samples).float()
+    duration = get_audio_duration(path)
+    margin = max(duration - target_n_samples / target_sr, 0)
+    starts = [(i + 0.5) * margin / n_crops for i in range(n_crops)]
+    return torch.stack([load_audio_chunk(path, target_n_samples, target_sr, start_s = start).mean(dim = 0, keepdim = True) for start in starts])
+
+
+def render_augmentation_bank(file_paths, path, augmentation, values, target_sr, target_n_samples, n_crops = None):
+    """
+    Renders every crop of ``file_paths`` once per value in ``values`` with the ``augmentation``
+    of bank_augmentations, plus the untransformed crop as variant 0, into ``path``:
+    ``audio.npy`` (float16, [n_crops_total, 1 + len(values), T]) and ``index.pkl``.
+    """
+    if augmentation not in bank_augmentations:
+        raise ValueError(f"Invalid augmentation: {augmentation}. Supported augmentations are: {list(bank_augmentations)}")
+    spec = bank_augmentations[augmentation]
+    values = [value for value in values if value != spec["identity"]]
+
+    # first pass over the files to size the store
+    counts = []
+    for file_path in tqdm(file_paths, desc = "Counting crops"):
+        if n_crops is not None:
+            counts.append(n_crops)
+        else:
+            n_samples = int(get_audio_duration(file_path) * target_sr)
+            counts.append(max(n_samples // target_n_samples, 0))
+    row_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    os.makedirs(path, exist_ok = True)
+    audio_store = np.lib.format.open_memmap(
+        os.path.join(path, "audio.npy"), mode = "w+", dtype = np.float16,
+        shape = (int(row_offsets[-1]), len(values) + 1, int(target_n_samples))
+    )
+
+    for i, file_path in enumerate(tqdm(file_paths, desc = f"Rendering {augmentation} bank")):
+        if counts[i] == 0:
+            continue
+        try:
+            crops = get_crops(file_path, target_n_samples, target_sr, n_crops)[:counts[i]]
+        except Exception as e:
+            print("Error loading file:", e)
+            continue
+        rows = slice(row_offsets[i], row_offsets[i] + len(crops))
+        audio_store[rows, 0] = crops[:, 0].numpy()
+        for j, value in enumerate(values):
+            variants = torch.stack([spec["render"](crop, value, target_sr)[..., :target_n_samples] for crop in crops])
+            audio_store[rows, j + 1] = variants[:, 0].numpy()
+
+    audio_store.flush()
+    index = {
+        "file_paths": list(file_paths),
+        "row_offsets": row_offsets,
+        "augmentation": augmentation,
+        "name": spec["name"],
+        "parameter": spec["parameter"],
+        "values": np.array([spec["identity"]] + values, dtype = np.float32),
+        "sample_rate": target_sr,
+        "n_samples": int(target_n_samples),
+    }
+    with open(os.path.join(path, "index.pkl"), "wb") as f:
+        pickle.dump(index, f)
+    print(f"Rendered {row_offsets[-1]} crops x {len(values) + 1} variants to {path}")
+
+
+class AugmentationBank:
+    """
+    Reads a store written by render_augmentation_bank. For each requested view, one variant is
+    drawn: a rendered one with probability ``p`` (uniformly among the rendered values), the
+    untransformed crop otherwise. The audio store is memory-mapped lazily, once per worker.
+    """
+
+    def __init__(self, path, p = 0.5):
+        self.path = path
+        self.p = p
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            self.index = pickle.load(f)
+        self.name = self.index["name"]
+        self.parameter = self.index["parameter"]
+        self.values = torch.from_numpy(self.index["values"])
+        self.row_offsets = self.index["row_offsets"]
+        self.file_rows = {file_path: i for i, file_path in enumerate(self.index["file_paths"])}
+        self.audio = None
+
+    def get_rows(self, path):
+        if path not in self.file_rows:
+            raise KeyError(f"{path} is not in the augmentation bank at {self.path}")
+        i = self.file_rows[path]
+        return np.arange(self.row_offsets[i], self.row_offsets[i + 1])
+
+    def load(self, path, n_views = None, apply = True):
+        """
+        Returns ``[n_views, 1, T]`` views of one random crop of ``path`` (or one view per crop of
+        the file if ``n_views`` is None) and their transform parameters.
+        """
+        if self.audio is None:
+            self.audio = np.load(os.path.join(self.path, "audio.npy"), mmap_mode = "r")
+
+        rows = self.get_rows(path)
+        if len(rows) == 0:
+            raise ValueError(f"{path} has no crops in the augmentation bank")
+        if n_views is not None:
+            rows = np.full(n_views, np.random.choice(rows))
+
+        should_apply = torch.rand(len(rows)) < self.p if apply else torch.zeros(len(rows), dtype = torch.bool)
+        variants = torch.randint(1, len(self.values), (len(rows),)) if len(self.values) > 1 else torch.zeros(len(rows), dtype = torch.long)
+        variants = torch.where(should_apply, variants, torch.zeros_like(variants))
+        should_apply = variants > 0
+
+        audio = torch.from_numpy(np.stack([self.audio[row, variant] for row, variant in zip(rows, variants.tolist())])).float()
+
+        parameters = {
+            "should_apply": should_apply,
+            self.parameter: self.values[variants],
+        }
+        return audio.unsqueeze(1), parameters
@@ -0,0 +1,204 @@
+import time
+
+import torch
+from pytorch_lightning.callbacks import Callback
+
+
+class AugmentationGovernor(Callback):
+    """
+    Keeps training near ``target_steps_per_s`` when the input pipeline is the bottleneck. Every
+    ``every_n_steps`` training steps, if the trainer spent more than ``max_wait_share`` of the time
+    waiting for batches and runs below the target, the most expensive transform of the augmentation
+    chains (by the per-transform timings of AudioDataModule(profile=True)) is throttled: swapped for
+    its entry in ``substitutes`` if it has one, then its application probability is lowered by
+    ``p_factor`` down to ``min_p``. Once the loader keeps up again, the cheapest throttled transform
+    is restored, p first and substitution last.
+
+    Substitutes keep the name of the transform they replace, so the augs labels (and the contrastive
+    matrices built from them) keep their keys and still say which views were transformed. Every
+    decision is printed, kept in ``decisions`` (saved in checkpoints) and the p of each governed
+    transform is logged under ``governor/``.
+
+    Chains running in the dataloader workers are copies: decisions reach them when the workers are
+    restarted, i.e. at the next epoch. With batch_augment they apply from the next batch.
+    """
+
+    def __init__(
+        self, target_steps_per_s, every_n_steps = 50, warmup_steps = 100, tolerance = 0.1,
+        max_wait_share = 0.2, p_factor = 0.8, min_p = 0.1, substitutes = None
+    ):
+        """
+        :param target_steps_per_s: training steps per second to keep
+        :param every_n_steps: steps between two decisions
+        :param warmup_steps: steps before the first decision, e.g. while workers and caches warm up
+        :param tolerance: relative distance to the target within which nothing is changed
+        :param max_wait_share: share of the time spent waiting for batches above which the loader is the bottleneck
+        :param p_factor: factor applied to the p of a throttled transform at each decision
+        :param min_p: lowest p of a throttled transform, or a dict of them keyed ``"<stage>.<transform name>"``
+        :param substitutes: cheaper transforms keyed ``"<stage>.<transform name>"`` of those they replace
+        """
+        super().__init__()
+        if not 0 < p_factor < 1:
+            raise ValueError("p_factor must be between 0 and 1")
+        self.target_steps_per_s = target_steps_per_s
+        self.every_n_steps = every_n_steps
+        self.warmup_steps = warmup_steps
+        self.tolerance = tolerance
+        self.max_wait_share = max_wait_share
+        self.p_factor = p_factor
+        self.min_p = min_p
+        self.substitutes = dict(substitutes) if substitutes is not None else {}
+
+        # {"<stage>.<transform name>": (chain, index)} of the governed transforms
+        self.transforms = {}
+        self.original_p = {}
+        # transforms replaced by their substitute, to put back
+        self.substituted = {}
+        self.decisions = []
+        self.loaded_state = None
+        self.reset_window()
+
+    def reset_window(self):
+        self.window_start = time.perf_counter()
+        self.window_steps = 0
+        self.wait_s = 0.0
+        self.costs = {}
+        self.last_batch_end = None
+
+    def get_min_p(self, key):
+        min_p = self.min_p.get(key, 0.0) if isinstance(self.min_p, dict) else self.min_p
+        return min(min_p, self.original_p[key])
+
+    def get_p(self, key):
+        chain, index = self.transforms[key]
+        return float(chain.transforms[index].p)
+
+    def set_p(self, key, p):
+        chain, index = self.transforms[key]
+        chain.transforms[index].p = p
+
+    def on_fit_start(self, trainer, pl_module):
+        datamodule = trainer.datamodule
+        for stage, chain in datamodule.aug_chain.items():
+            for index, name in enumerate(chain.transform_names):
+                key = f"{stage}.{name}"
+                self.transforms[key] = (chain, index)
+                self.original_p[key] = float(chain.transforms[index].p)
+        if datamodule.batch_augment is None:
+            print("AugmentationGovernor: augmentations run in the dataloader workers, decisions apply from the next epoch")
+        if self.loaded_state is not None:
+            self.apply_state(self.loaded_state)
+            self.loaded_state = None
+
+    def on_train_epoch_start(self, trainer, pl_module):
+        # the first batches of an epoch wait for the workers to start, which throttling does not help
+        self.reset_window()
+
+    def on_train_batch_start(self, trainer, pl_module, batch, batch_idx):
+        if self.last_batch_end is not None:
+            self.wait_s += time.perf_counter() - self.last_batch_end
+        timings = batch.get("timings") if isinstance(batch, dict) else None
+        if timings is not None:
+            for key, value in timings["time_s"].items():
+                if key in self.transforms:
+                    self.costs[key] = self.costs.get(key, 0.0) + float(torch.as_tensor(value, dtype = torch.float64).sum())
+
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx):
+        self.window_steps += 1
+        if self.window_steps >= self.every_n_steps:
+            if trainer.global_step >= self.warmup_steps:
+                self.update(trainer, pl_module)
+            self.reset_window()
+        self.last_batch_end = time.perf_counter()
+
+    def update(self, trainer, pl_module):
+        elapsed = time.perf_counter() - self.window_start
+        steps_per_s = self.window_steps / elapsed
+        wait_share = self.wait_s / elapsed
+        context = {"step": trainer.global_step, "steps_per_s": steps_per_s, "wait_share": wait_share}
+
+        if wait_share > self.max_wait_share and steps_per_s < self.target_steps_per_s * (1 - self.tolerance):
+            self.throttle(context)
+        elif wait_share < self.max_wait_share / 2 or steps_per_s > self.target_steps_per_s * (1 + self.tolerance):
+            self.relax(context)
+
+        pl_module.log("governor/steps_per_s", steps_per_s, on_step=True, on_epoch=False, logger=True)
+        pl_module.log("governor/wait_share", wait_share, on_step=True, on_epoch=False, logger=True)
+        for key in self.transforms:
+            pl_module.log(f"governor/{key}_p", self.get_p(key), on_step=True, on_epoch=False, logger=True)
+            pl_module.log(f"governor/{key}_substituted", float(key in self.substituted), on_step=True, on_epoch=False, logger=True)
+
+    def throttle(self, context):
+        # most expensive first
+        for key in sorted(self.costs, key = self.costs.get, reverse = True):
+            if key in self.substitutes and key not in self.substituted:
+                self.substitute(key, context)
+                return
+            p = self.get_p(key)
+            if p > self.get_min_p(key):
+                self.decide(key, "p", max(p * self.p_factor, self.get_min_p(key)), context)
+                return
+
+    def relax(self, context):
+        throttled = [key for key in self.transforms if self.get_p(key) < self.original_p[key] or key in self.substituted]
+        # cheapest first
+        for key in sorted(throttled, key = lambda key: self.costs.get(key, 0.0)):
+            p = self.get_p(key)
+            if p < self.original_p[key]:
+                self.decide(key, "p", min(p / self.p_factor, self.original_p[key]), context)
+            else:
+                self.restore(key, context)
+            return
+
+    def substitute(self, key, context):
+        chain, index = self.transforms[key]
+        substitute = self.substitutes[key]
+        substitute.p = self.get_p(key)
+        self.substituted[key] = chain.replace_transform(index, substitute)
+        self.log_decision(key, "substitute", substitute.p, context, transform = substitute.__class__.__name__)
+
+    def restore(self, key, context):
+        chain, index = self.transforms[key]
+        original = self.substituted.pop(key)
+        original.p = self.get_p(key)
+        chain.replace_transform(index, original)
+        self.log_decision(key, "restore", original.p, context, transform = original.__class__.__name__)
+
+    def decide(self, key, action, p, context):
+        self.set_p(key, p)
+        self.log_decision(key, action, p, context)
+
+    def log_decision(self, key, action, p, context, transform = None):
+        decision = {**context, "transform": key, "action": action, "p": p}
+        if transform is not None:
+            decision["active"] = transform
+        self.decisions.append(decision)
+        print(
+            f"AugmentationGovernor: step {context['step']}, {context['steps_per_s']:.2f} steps/s, "
+            f"{context['wait_share']:.0%} waiting for data: {action} {key} (p = {p:.3f})"
+            + (f", now {transform}" if transform is not None else "")
+        )
+
+    def state_dict(self):
+        return {
+            "p": {key: self.get_p(key) for key in self.transforms},
+            "substituted": list(self.substituted),
+            "decisions": self.decisions,
+        }
+
+    def load_state_dict(self, state_dict):
+        # the chains are only known at fit start
+        if self.transforms:
+            self.apply_state(state_dict)
+        else:
+            self.loaded_state = state_dict
+
+    def apply_state(self, state):
+        for key in state["substituted"]:
+            if key in self.substitutes and key not in self.substituted:
+                chain, index = self.transforms[key]
+                self.substituted[key] = chain.replace_transform(index, self.substitutes[key])
+        for key, p in state["p"].items():
+            if key in self.transforms:
+                self.set_p(key, p)
+        self.decisions = state["decisions"]
@@ -13,6 +13,9 @@ from .chorus import ChorusAudiomentation
 from .compression import CompressorAudiomentation
 from .distortion import DistortionAudiomentation
 from .reverb import ReverbAudiomentation
+from .convolution_reverb import ConvolutionReverbAudiomentation
 from .bitcrush import BitcrushAudiomentation
 from .background import AddBackgroundNoiseAudiomentation
 from .custom_pitch_shift import PitchShiftAudiomentation
+
+from .spectrogram import SpectrogramTransform, TimeMasking, FrequencyMasking, FrequencyShift, TimeWarp
@@ -8,11 +8,94 @@ from random import choices
 import torch
 import numpy as np
 import soundfile as sf
+from tqdm import tqdm
 from mulooc.dataloading.loading_utils import *
 import random
 import os
+import json
 
 
+def find_audio_files(background_paths):
+    if isinstance(background_paths, (str, Path)):
+        found = []
+        for root, _, files in os.walk(background_paths):
+            for file in files:
+                if file.endswith(".wav") or file.endswith(".mp3"):
+                    found.append(os.path.join(root, file))
+        return found
+    return [str(path) for path in background_paths]
+
+
+def prepare_noise_bank(background_paths, path, sample_rate, min_duration_s = 0.0):
+    """
+    Packs background noise clips into a noise bank at ``path``: every clip is resampled to
+    ``sample_rate``, mixed down to mono and RMS-normalised, then appended to ``noise.f32``
+    (raw float32). ``index.json`` records the offset and length of each clip.
+    """
+    os.makedirs(path, exist_ok = True)
+    files = find_audio_files(background_paths)
+
+    offsets, lengths, kept = [], [], []
+    offset = 0
+    with open(os.path.join(path, "noise.f32"), "wb") as f:
+        for file in tqdm(files, desc = "Packing noise bank"):
+            try:
+                audio = load_full_audio(file, sample_rate).float().mean(dim = 0)
+            except Exception as e:
+                print("Error loading file:", e)
+                continue
+            if len(audio) < min_duration_s * sample_rate:
+                continue
+            rms_normalize(audio).numpy().astype(np.float32).tofile(f)
+            offsets.append(offset)
+            lengths.append(len(audio))
+            kept.append(file)
+            offset += len(audio)
+
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump({"sample_rate": sample_rate, "offsets": offsets, "lengths": lengths, "files": kept}, f)
+    print(f"Packed {len(kept)} clips ({offset / sample_rate / 3600:.2f} hours) into {path}")
+
+
+class NoiseBank:
+    """
+    Draws random RMS-normalised segments from a bank written by prepare_noise_bank. The packed
+    audio is memory-mapped lazily (once per worker) and only clips long enough for the requested
+    segment length are eligible, so drawing never retries or touches audio files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            index = json.load(f)
+        self.sample_rate = index["sample_rate"]
+        self.offsets = np.array(index["offsets"], dtype = np.int64)
+        self.lengths = np.array(index["lengths"], dtype = np.int64)
+        self.noise = None
+        self.eligible = {}
+
+    def __getstate__(self):
+        # workers open their own memory map
+        state = self.__dict__.copy()
+        state["noise"] = None
+        return state
+
+    def get_eligible(self, num_samples):
+        if num_samples not in self.eligible:
+            self.eligible[num_samples] = np.flatnonzero(self.lengths >= num_samples)
+            if len(self.eligible[num_samples]) == 0:
+                raise ValueError(f"No clip of the noise bank at {self.path} has {num_samples} samples")
+        return self.eligible[num_samples]
+
+    def sample(self, num_samples, batch_size):
+        if self.noise is None:
+            self.noise = np.memmap(os.path.join(self.path, "noise.f32"), dtype = np.float32, mode = "r")
+
+        clips = np.random.choice(self.get_eligible(num_samples), batch_size)
+        starts = self.offsets[clips] + (np.random.random(batch_size) * (self.lengths[clips] - num_samples + 1)).astype(np.int64)
+        segments = torch.from_numpy(np.stack([self.noise[start:start + num_samples] for start in starts]))
+        return rms_normalize(segments)
+
 
 
 class AddBackgroundNoiseAudiomentation(BaseWaveformTransform):
@@ -30,9 +113,12 @@ class AddBackgroundNoiseAudiomentation(BaseWaveformTransform):
     supports_target = True
     requires_target = False
 
+    # parameters recorded by CustomCompose, see CustomCompose.get_records
+    record_parameters = ["snr_in_db"]
+
     def __init__(
         self,
-        background_paths: Union[List[Path], List[str], Path, str],
+        background_paths: Union[List[Path], List[str], Path, str] = None,
         min_snr_in_db: float = 3.0,
         max_snr_in_db: float = 30.0,
         mode: str = "per_example",
@@ -41,11 +127,14 @@ class AddBackgroundNoiseAudiomentation(BaseWaveformTransform):
         sample_rate: int = None,
         target_rate: int = None,
         output_type: Optional[str] = None,
+        noise_bank: Optional[str] = None,
     ):
         """
 
         :param background_paths: Either a path to a folder with audio files or a list of paths
             to audio files.
+        :param noise_bank: Path to a noise bank written by prepare_noise_bank.py, used instead of
+            background_paths. Must be packed at ``sample_rate``.
         :param min_snr_in_db: minimum SNR in dB.
         :param max_snr_in_db: maximum SNR in dB.
         :param mode:
@@ -63,12 +152,16 @@ class AddBackgroundNoiseAudiomentation(BaseWaveformTransform):
             output_type=output_type,
         )
 
+        self.noise_bank = None
         self.background_paths = []
-        if isinstance(background_paths, (str, Path)):
-            for root, _, files in os.walk(background_paths):
-                for file in files:
-                    if file.endswith(".wav") or file.endswith(".mp3"):
-                        self.background_paths.append(os.path.join(root, file))
+        if noise_bank is not None:
+            self.noise_bank = NoiseBank(noise_bank)
+            if self.noise_bank.sample_rate != sample_rate:
+                raise ValueError(f"noise bank sample rate {self.noise_bank.sample_rate} does not match sample_rate {sample_rate}")
+        elif background_paths is not None:
+            self.background_paths = find_audio_files(background_paths)
+        else:
+            raise ValueError("one of background_paths or noise_bank is required")
         
         self.sample_rate = sample_rate
         self.min_snr_in_db = min_snr_in_db
@@ -117,9 +210,12 @@ class AddBackgroundNoiseAudiomentation(BaseWaveformTransform):
         batch_size, _, num_samples = samples.shape
 
         # (batch_size, num_samples) RMS-normalized background noise
-        self.transform_parameters["background"] = torch.stack(
-            [self.random_background(num_samples) for _ in range(batch_size)]
-        )
+        if self.noise_bank is not None:
+            self.transform_parameters["background"] = self.noise_bank.sample(num_samples, batch_size).to(samples.device)
+        else:
+            self.transform_parameters["background"] = torch.stack(
+                [self.random_background(num_samples) for _ in range(batch_size)]
+            )
 
         # (batch_size, ) SNRs
         if self.min_snr_in_db == self.max_snr_in_db:
@@ -1,12 +1,24 @@
 
 from . import PedalBoardAudiomentation
 from pedalboard import Pedalboard, Bitcrush
+from torch_audiomentations.utils.object_dict import ObjectDict
+from typing import Optional
+from torch import Tensor
+import torch
 
 
+def bitcrush(samples: Tensor, bit_depth: Tensor) -> Tensor:
+    # pedalboard's Bitcrush: rounding to multiples of 2 ** -bit_depth, per row of samples ([B, ...])
+    scale = 2 ** bit_depth.to(samples).reshape(-1, *[1] * (samples.dim() - 1))
+    return torch.round(samples * scale) / scale
+
 
 class BitcrushAudiomentation(PedalBoardAudiomentation):
     
-    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None, randomize_parameters = True, *args, **kwargs):
+    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None, randomize_parameters = True, num_threads = 1, max_process_channels = None, backend = "pedalboard", *args, **kwargs):
+        """
+        :param backend: ``pedalboard`` (the plugin per example) or ``torch`` (bitcrush over the whole batch, on its device)
+        """
         try:
             board = Pedalboard([
                 Bitcrush(**kwargs)
@@ -18,6 +30,24 @@ class BitcrushAudiomentation(PedalBoardAudiomentation):
         
     
         
-        super().__init__(board, mode, p, p_mode, sample_rate , output_type=output_type, randomize_parameters=randomize_parameters)
+        super().__init__(board, mode, p, p_mode, sample_rate , output_type=output_type, randomize_parameters=randomize_parameters, num_threads=num_threads, max_process_channels=max_process_channels)
         self.set_kwargs(**kwargs)
-        
\ No newline at end of file
+        
+        if backend not in ["pedalboard", "torch"]:
+            raise ValueError(f"Invalid backend: {backend}. Supported backends are: pedalboard, torch")
+        self._backend = backend
+    
+    def apply_transform(self, samples: Tensor = None, sample_rate: Optional[int] = None, targets: Optional[Tensor] = None, target_rate: Optional[int] = None) -> ObjectDict:
+        if self._backend == "pedalboard":
+            return super().apply_transform(samples, sample_rate, targets, target_rate)
+        
+        batch_size, num_channels, num_samples = samples.shape
+        samples = bitcrush(samples, self.get_parameter("bit_depth", batch_size))
+        
+        return ObjectDict(
+            samples=samples,
+            sample_rate=sample_rate,
+            targets=targets,
+            target_rate=target_rate,
+            should_apply = self.transform_parameters["should_apply"]
+        )
@@ -5,7 +5,7 @@ from pedalboard import Pedalboard, Chorus
 
 class ChorusAudiomentation(PedalBoardAudiomentation):
     
-    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None, randomize_parameters = True, *args, **kwargs):
+    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None, randomize_parameters = True, num_threads = 1, max_process_channels = None, *args, **kwargs):
         try:
             board = Pedalboard([
                 Chorus(**kwargs)
@@ -15,6 +15,6 @@ class ChorusAudiomentation(PedalBoardAudiomentation):
                 Chorus()
             ])
         
-        super().__init__(board, mode, p, p_mode, sample_rate, output_type=output_type, randomize_parameters=randomize_parameters)
+        super().__init__(board, mode, p, p_mode, sample_rate, output_type=output_type, randomize_parameters=randomize_parameters, num_threads=num_threads, max_process_channels=max_process_channels)
         
         self.set_kwargs(**kwargs)
\ No newline at end of file
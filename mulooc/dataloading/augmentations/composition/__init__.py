@@ -1 +1,2 @@
-from .custom_compose import CustomCompose
\ No newline at end of file
+from .custom_compose import CustomCompose
+from .spectrogram_compose import SpectrogramCompose
\ No newline at end of file
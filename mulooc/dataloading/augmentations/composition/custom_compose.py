@@ -1,4 +1,5 @@
 import random
+import time
 from typing import List, Union, Optional, Tuple
 
 from torch import Tensor
@@ -8,6 +9,9 @@ import warnings
 from torch_audiomentations.core.transforms_interface import BaseWaveformTransform
 from torch_audiomentations.utils.object_dict import ObjectDict
 from torch_audiomentations.core.composition import BaseCompose
+from pedalboard import Pedalboard
+
+from mulooc.dataloading.augmentations.pedalboard_audiomentation import PedalBoardAudiomentation
 
 class CustomCompose(BaseCompose):
     """
@@ -18,16 +22,27 @@ class CustomCompose(BaseCompose):
 
     Attributes:
         transform_names (list): List of transformation names.
+        records (dict): Parameters of the last call as fixed-shape tensors, keyed ``"<transform name>.<parameter>"``,
+            plus a ``"<transform name>.should_apply"`` mask per transform.
+        fuse_pedalboards (bool): Run adjacent per_example pedalboard transforms as one board per example,
+            with the plugins of the transforms that don't apply to an example left out.
+        timings (dict): With ``profile``, wall-clock seconds and number of calls of each transform in the last call,
+            as ``{"time_s": {name: seconds}, "calls": {name: calls}}``. On GPU, kernels still queued when a transform
+            returns are counted towards the next one.
     """
 
     def __init__(
-        self, return_tfms = False, track_params = False,
+        self, return_tfms = False, track_params = False, profile = False, fuse_pedalboards = True,
         **kwargs
     ):
         super().__init__(**kwargs)
         self.transform_names = [tfm.__class__.__name__ for tfm in self.transforms]
         self.return_tfms = return_tfms
         self.track_params = False
+        self.records = {}
+        self.profile = profile
+        self.timings = {}
+        self.fuse_pedalboards = fuse_pedalboards
         
     
     def forward(
@@ -56,15 +71,32 @@ class CustomCompose(BaseCompose):
             target_rate=target_rate,
         )
         transformed = ObjectDict()
+        called = [False] * len(self.transforms)
+        if self.profile:
+            self.reset_timings()
         if random.random() < self.p:
             transform_indexes = list(range(len(self.transforms)))
             if self.shuffle:
                 random.shuffle(transform_indexes)
+            runs = self.get_pedalboard_runs(transform_indexes) if self.fuse_pedalboards else {}
+            fused = {i for run in runs.values() for i in run}
             for i in transform_indexes:
+                if i in runs:
+                    inputs = self.apply_pedalboard_run(runs[i], inputs, transformed, called)
+                    continue
+                if i in fused:
+                    # already applied with the first transform of its run
+                    continue
                 tfm = self.transforms[i]
                 if isinstance(tfm, (BaseWaveformTransform, BaseCompose)):
                     samples = inputs.samples
+                    if self.profile:
+                        start = time.perf_counter()
                     inputs = self.transforms[i](**inputs)
+                    called[i] = True
+                    if self.profile:
+                        self.timings["time_s"][self.transform_names[i]] += time.perf_counter() - start
+                        self.timings["calls"][self.transform_names[i]] += 1
                     
                     # changed = (new_samples.sum(dim=(1, 2)) != samples.sum(dim=(1, 2))).int()
                     
@@ -90,6 +122,9 @@ class CustomCompose(BaseCompose):
                         else :
                             
                             changed = self.transforms[i].transform_parameters["should_apply"].int()
+                            if changed.numel() == 1:
+                                # per_batch transforms make one decision for the whole batch
+                                changed = changed.expand(inputs.samples.shape[0])
                         
                         transformed[self.transform_names[i]] = changed
                     
@@ -104,18 +139,135 @@ class CustomCompose(BaseCompose):
                 transformed[self.transform_names[i]] = torch.zeros(inputs.samples.shape[0], dtype=torch.int)
                 
         
-        if self.return_tfms:
-            for transform in self.transforms:
-                    for key in transform.transform_parameters:
-                        new_params = transform.transform_parameters[key]
-                        if key != "should_apply":
-                            
-                            for i in range(len(transform.transform_parameters['should_apply'])):
-                                if not transform.transform_parameters['should_apply'][i]:
-                                    # insert None for non-transformed samples
-                                    new_params.insert(i, None)
-                            transform.transform_parameters[key] = new_params
-                
+        self.records = self.get_records(inputs.samples.shape[0], called)
                 
         return (inputs.samples, transformed) if self.output_type == "tensor" else (inputs, transformed)
 
+
+    def is_fusable(self, tfm):
+        return (
+            isinstance(tfm, PedalBoardAudiomentation) and getattr(tfm, "_backend", "pedalboard") == "pedalboard"
+            and tfm.training and not tfm.are_parameters_frozen
+            and tfm._mode == "per_example" and tfm.p_mode == "per_example"
+        )
+
+    def get_pedalboard_runs(self, transform_indexes):
+        # {first index: indexes} of the runs of two or more adjacent fusable transforms, in the order they are applied
+        runs, run = {}, []
+        for i in transform_indexes + [None]:
+            tfm = self.transforms[i] if i is not None else None
+            if tfm is not None and self.is_fusable(tfm) and (not run or tfm._sample_rate == self.transforms[run[0]]._sample_rate):
+                run.append(i)
+                continue
+            if len(run) > 1:
+                runs[run[0]] = run
+            run = [i] if tfm is not None and self.is_fusable(tfm) else []
+        return runs
+
+    def apply_pedalboard_run(self, run, inputs, transformed, called):
+        """
+        Applies the pedalboard transforms ``run`` with one tensor->numpy conversion and one board call
+        per example. Decisions and parameters are drawn per transform, in the same order as when the
+        transforms are called one after the other, and are left in each transform's transform_parameters.
+        """
+        if self.profile:
+            start = time.perf_counter()
+        tfms = [self.transforms[i] for i in run]
+        samples = inputs.samples
+        batch_size = samples.shape[0]
+
+        for tfm in tfms:
+            tfm.transform_parameters = {
+                "should_apply": tfm.bernoulli_distribution.sample(sample_shape=(batch_size,)).to(dtype=torch.bool, device=samples.device)
+            }
+            if tfm.transform_parameters["should_apply"].any():
+                tfm.randomize_parameters(samples=samples[tfm.transform_parameters["should_apply"]], sample_rate=inputs.sample_rate)
+
+        should_apply = [tfm.transform_parameters["should_apply"].cpu() for tfm in tfms]
+        # parameters are drawn for the selected examples only, the rank of an example among them indexes its values
+        ranks = [(mask.cumsum(0) - 1).tolist() for mask in should_apply]
+        examples = [b for b in range(batch_size) if any(mask[b] for mask in should_apply)]
+
+        input_ = samples.cpu().numpy()
+        output = input_.copy()
+
+        def process(b, boards):
+            plugins = []
+            for tfm, board, mask, rank in zip(tfms, boards, should_apply, ranks):
+                if not mask[b]:
+                    continue
+                if tfm._randomize_parameters:
+                    for key in tfm.transform_ranges:
+                        board[0].__setattr__(key, tfm.transform_parameters[key][rank[b]])
+                plugins.extend(board)
+            output[b] = Pedalboard(plugins)(input_array = input_[b], sample_rate = tfms[0]._sample_rate)
+
+        if tfms[0]._num_threads > 1 and len(examples) > 1:
+            # as in PedalBoardAudiomentation, each thread configures its own copy of the plugins
+            list(tfms[0].get_executor().map(lambda b: process(b, [tfm.get_thread_board() for tfm in tfms]), examples))
+        else:
+            for b in examples:
+                process(b, [tfm._board for tfm in tfms])
+
+        inputs.samples = torch.from_numpy(output).to(samples.device)
+
+        for i, mask in zip(run, should_apply):
+            called[i] = True
+            if self.return_tfms:
+                transformed[self.transform_names[i]] = mask.int()
+        if self.profile:
+            # one board call covers the whole run, its time is shared evenly between the transforms
+            elapsed = (time.perf_counter() - start) / len(run)
+            for i in run:
+                self.timings["time_s"][self.transform_names[i]] += elapsed
+                self.timings["calls"][self.transform_names[i]] += 1
+        return inputs
+
+    def replace_transform(self, index, tfm):
+        # swaps in another transform under the same name, so that augs labels, records and timings keep their keys
+        previous = self.transforms[index]
+        tfm.output_type = "dict"
+        tfm.train(previous.training)
+        self.transforms[index] = tfm
+        return previous
+
+    def reset_timings(self):
+        # every transform gets a key, so that timings of different calls have the same keys
+        self.timings = {
+            "time_s": dict.fromkeys(self.transform_names, 0.0),
+            "calls": dict.fromkeys(self.transform_names, 0),
+        }
+
+    def get_records(self, batch_size, called):
+        # one [batch_size] tensor per recorded parameter, whether or not the transform ran, so that
+        # records of different calls always have the same keys and shapes and collate with one stack per key
+        records = {}
+        for name, tfm, was_called in zip(self.transform_names, self.transforms, called):
+            # parameters of transforms skipped by this call are left over from a previous one
+            parameters = getattr(tfm, "transform_parameters", {}) if was_called else {}
+            should_apply = parameters.get("should_apply")
+            if should_apply is None:
+                should_apply = torch.zeros(batch_size, dtype=torch.bool)
+            should_apply = should_apply.cpu().bool().reshape(-1)
+            if should_apply.numel() == 1:
+                # per_batch decisions apply to every example
+                should_apply = should_apply.expand(batch_size)
+            elif should_apply.numel() != batch_size:
+                # per_channel decisions, an example counts as transformed if any of its channels is
+                should_apply = should_apply.view(batch_size, -1).any(dim=1)
+            records[f"{name}.should_apply"] = should_apply.clone()
+
+            n_applied = int(should_apply.sum())
+            identity = getattr(tfm, "identity_parameters", {})
+            for parameter in getattr(tfm, "record_parameters", []):
+                values = torch.full((batch_size,), float(identity.get(parameter, 0.0)))
+                applied = parameters.get(parameter)
+                if applied is not None and n_applied > 0:
+                    applied = torch.as_tensor(applied, dtype=torch.float32).cpu().reshape(-1)
+                    if applied.numel() in [1, n_applied]:
+                        values[should_apply] = applied
+                    elif applied.numel() % n_applied == 0:
+                        # per_channel parameters, record the first channel
+                        values[should_apply] = applied.view(n_applied, -1)[:, 0]
+                records[f"{name}.{parameter}"] = values
+        return records
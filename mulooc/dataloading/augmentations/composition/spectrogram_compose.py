@@ -0,0 +1,56 @@
+import random
+import time
+from typing import Optional
+
+from torch import Tensor
+import torch
+
+from torch_audiomentations.utils.object_dict import ObjectDict
+
+from mulooc.dataloading.augmentations.composition.custom_compose import CustomCompose
+
+
+class SpectrogramCompose(CustomCompose):
+    """
+    CustomCompose for the spectrogram transforms of mulooc.dataloading.augmentations.spectrogram,
+    applied to frontend output. Returns the transformed spectrograms and, keyed by transform name,
+    whether each example was transformed, so that these transforms get augs labels (and variant
+    heads) like those of the var chain. ``records`` and ``timings`` are kept as in CustomCompose.
+    """
+
+    def __init__(self, return_tfms = True, **kwargs):
+        super().__init__(return_tfms = return_tfms, fuse_pedalboards = False, **kwargs)
+
+    def forward(
+        self,
+        samples: Tensor = None,
+        sample_rate: Optional[int] = None,
+        targets: Optional[Tensor] = None,
+        target_rate: Optional[int] = None,
+    ):
+        batch_size = samples.shape[0]
+        transformed = ObjectDict()
+        called = [False] * len(self.transforms)
+        if self.profile:
+            self.reset_timings()
+        if random.random() < self.p:
+            transform_indexes = list(range(len(self.transforms)))
+            if self.shuffle:
+                random.shuffle(transform_indexes)
+            for i in transform_indexes:
+                if self.profile:
+                    start = time.perf_counter()
+                samples = self.transforms[i](samples)
+                called[i] = True
+                if self.profile:
+                    self.timings["time_s"][self.transform_names[i]] += time.perf_counter() - start
+                    self.timings["calls"][self.transform_names[i]] += 1
+                if self.return_tfms:
+                    transformed[self.transform_names[i]] = self.transforms[i].transform_parameters["should_apply"].int()
+        else:
+            for i in range(len(self.transforms)):
+                transformed[self.transform_names[i]] = torch.zeros(batch_size, dtype=torch.int)
+
+        self.records = self.get_records(batch_size, called)
+
+        return (samples, transformed) if self.output_type == "tensor" else (ObjectDict(samples=samples), transformed)
@@ -1,13 +1,62 @@
 
 from . import PedalBoardAudiomentation
 from pedalboard import Pedalboard, Compressor
+from torch_audiomentations.utils.object_dict import ObjectDict
+from typing import Optional
+from torch import Tensor
+import torchaudio
+import torch
+import math
+
+
+def one_pole(samples: Tensor, coefficients: Tensor) -> Tensor:
+    # y[n] = c * y[n - 1] + (1 - c) * x[n], with one coefficient per row of samples ([N, T])
+    a_coeffs = torch.stack([torch.ones_like(coefficients), -coefficients], dim = -1)
+    b_coeffs = torch.stack([1 - coefficients, torch.zeros_like(coefficients)], dim = -1)
+    return torchaudio.functional.lfilter(samples, a_coeffs, b_coeffs, clamp = False)
+
+
+def compress(samples: Tensor, sample_rate, threshold_db: Tensor, ratio: Tensor, attack_ms: Tensor, release_ms: Tensor) -> Tensor:
+    """
+    pedalboard's (JUCE) Compressor over the whole batch ([B, ..., T]) with one set of parameters
+    per example. Its peak envelope follower switches between the attack and release time constants
+    sample by sample, which does not vectorise; instead the envelope is the peak of |x| decaying
+    with the release constant (a cumulative max in the log domain), smoothed by a one-pole filter
+    with the attack constant. Within a few percent of the plugin on music, above the threshold.
+    """
+    shape = samples.shape
+    rows = samples.reshape(shape[0], -1, shape[-1])
+    n_channels = rows.shape[1]
+    rows = rows.reshape(-1, shape[-1])
+
+    def per_row(parameter, dtype = torch.float32):
+        return parameter.to(rows.device, dtype).repeat_interleave(n_channels)[:, None]
+
+    # time constants of JUCE's BallisticsFilter, the decay in float64 as it accumulates over T
+    attack = torch.exp(-2 * math.pi * 1000 / per_row(attack_ms)[:, 0] / sample_rate)
+    log_release = -2 * math.pi * 1000 / per_row(release_ms, torch.float64) / sample_rate
+
+    # silence is floored far below any threshold, log(0) times a zero slope (ratio 1) would be NaN
+    n = torch.arange(shape[-1], device = rows.device, dtype = torch.float64)
+    log_peak = torch.log(rows.abs().double().clamp(min = 1e-12)) - n * log_release
+    envelope = torch.exp(torch.cummax(log_peak, dim = -1).values + n * log_release).float()
+    envelope = one_pole(envelope, attack)
+
+    # (envelope / threshold) ** (1 / ratio - 1) above the threshold, 1 below
+    gain = torch.exp(
+        ((torch.log(envelope.clamp(min = 1e-12)) - per_row(threshold_db) * math.log(10) / 20) * (1 / per_row(ratio) - 1)).clamp(max = 0)
+    )
+    return (rows * gain.to(rows)).reshape(shape)
 
 
 class CompressorAudiomentation(PedalBoardAudiomentation):
     
     
     
-    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None,randomize_parameters = True, *args, **kwargs):
+    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None,randomize_parameters = True, num_threads = 1, max_process_channels = None, backend = "pedalboard", *args, **kwargs):
+        """
+        :param backend: ``pedalboard`` (the plugin per example) or ``torch`` (compress over the whole batch, on its device)
+        """
         
         try:
             board = Pedalboard([
@@ -18,6 +67,28 @@ class CompressorAudiomentation(PedalBoardAudiomentation):
                 Compressor()
             ])
         
-        super().__init__(board, mode, p, p_mode, sample_rate, output_type=output_type, randomize_parameters=randomize_parameters)
+        super().__init__(board, mode, p, p_mode, sample_rate, output_type=output_type, randomize_parameters=randomize_parameters, num_threads=num_threads, max_process_channels=max_process_channels)
+        
+        self.set_kwargs(**kwargs)
+        
+        if backend not in ["pedalboard", "torch"]:
+            raise ValueError(f"Invalid backend: {backend}. Supported backends are: pedalboard, torch")
+        self._backend = backend
+    
+    def apply_transform(self, samples: Tensor = None, sample_rate: Optional[int] = None, targets: Optional[Tensor] = None, target_rate: Optional[int] = None) -> ObjectDict:
+        if self._backend == "pedalboard":
+            return super().apply_transform(samples, sample_rate, targets, target_rate)
+        
+        batch_size, num_channels, num_samples = samples.shape
+        samples = compress(
+            samples, self._sample_rate,
+            *[self.get_parameter(name, batch_size) for name in ["threshold_db", "ratio", "attack_ms", "release_ms"]]
+        )
         
-        self.set_kwargs(**kwargs)
\ No newline at end of file
+        return ObjectDict(
+            samples=samples,
+            sample_rate=sample_rate,
+            targets=targets,
+            target_rate=target_rate,
+            should_apply = self.transform_parameters["should_apply"]
+        )
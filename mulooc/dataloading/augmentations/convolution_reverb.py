@@ -0,0 +1,155 @@
+from torch_audiomentations.core.transforms_interface import BaseWaveformTransform
+from torch_audiomentations.utils.object_dict import ObjectDict
+
+from torch import Tensor
+from typing import Optional
+import torch
+
+
+def generate_impulse_responses(n_irs, sample_rate, min_rt60 = 0.2, max_rt60 = 1.5, n_reflections = 8, seed = 0):
+    """
+    Synthetic room impulse responses: a direct path, sparse early reflections within the first
+    50 ms and a Gaussian noise tail decaying by 60 dB over the RT60 of the room, drawn uniformly
+    in [min_rt60, max_rt60]. Returns the energy-normalised [n_irs, max_rt60 * sample_rate] IRs and
+    their [n_irs] RT60s, the same for a given seed.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    rt60s = min_rt60 + (max_rt60 - min_rt60) * torch.rand(n_irs, generator = generator)
+    length = int(max_rt60 * sample_rate)
+    t = torch.arange(length) / sample_rate
+
+    # -60 dB at t = rt60
+    decay = torch.exp(-6.908 * t[None] / rt60s[:, None])
+    irs = torch.randn(n_irs, length, generator = generator) * decay * 0.1
+
+    delays = torch.randint(int(0.002 * sample_rate), int(0.05 * sample_rate), (n_irs, n_reflections), generator = generator)
+    signs = torch.randint(0, 2, (n_irs, n_reflections), generator = generator) * 2 - 1
+    gains = signs * (0.2 + 0.6 * torch.rand(n_irs, n_reflections, generator = generator)) * decay.gather(1, delays)
+    irs.scatter_add_(1, delays, gains)
+    irs[:, 0] = 1.0
+
+    return irs / irs.norm(dim = 1, keepdim = True), rt60s
+
+
+class ConvolutionReverbAudiomentation(BaseWaveformTransform):
+    """
+    Reverb by FFT convolution of the whole batch with impulse responses drawn from a synthetic
+    IR bank, built once (and moved with the module) so that no external data is needed.
+    """
+
+    supported_modes = {"per_batch", "per_example"}
+
+    supports_multichannel = True
+    requires_sample_rate = True
+
+    supports_target = True
+    requires_target = False
+
+    # parameters recorded by CustomCompose, see CustomCompose.get_records
+    record_parameters = ["ir_ids", "rt60"]
+    identity_parameters = {"ir_ids": -1.0, "rt60": 0.0}
+
+    def __init__(
+        self,
+        n_irs: int = 64,
+        min_rt60: float = 0.2,
+        max_rt60: float = 1.5,
+        wet_level: float = 0.5,
+        dry_level: float = 0.5,
+        seed: int = 0,
+        mode: str = "per_example",
+        p: float = 0.5,
+        p_mode: str = None,
+        sample_rate: int = None,
+        target_rate: int = None,
+        output_type: Optional[str] = None,
+    ):
+        """
+        :param n_irs: number of impulse responses in the bank
+        :param min_rt60: shortest reverberation time of the bank, in seconds
+        :param max_rt60: longest reverberation time of the bank, in seconds, also the IR length
+        :param wet_level: gain of the reverberated signal
+        :param dry_level: gain of the input signal
+        :param seed: seed of the IR bank
+        :param mode: ``per_example`` or ``per_batch``. Default ``per_example``.
+        :param p:
+        :param p_mode:
+        :param sample_rate:
+        """
+        super().__init__(
+            mode=mode,
+            p=p,
+            p_mode=p_mode,
+            sample_rate=sample_rate,
+            target_rate=target_rate,
+            output_type=output_type,
+        )
+
+        if min_rt60 > max_rt60:
+            raise ValueError("min_rt60 must not be greater than max_rt60")
+        if not sample_rate:
+            raise ValueError("sample_rate is invalid.")
+        self._sample_rate = sample_rate
+        self._mode = mode
+        self._wet_level = wet_level
+        self._dry_level = dry_level
+
+        irs, rt60s = generate_impulse_responses(n_irs, sample_rate, min_rt60, max_rt60, seed = seed)
+        self.register_buffer("irs", irs, persistent = False)
+        self.register_buffer("rt60s", rt60s, persistent = False)
+        # spectra of the whole bank for the last FFT size and device
+        self._ir_spectra = None
+
+    def randomize_parameters(
+        self,
+        samples: Tensor = None,
+        sample_rate: Optional[int] = None,
+        targets: Optional[Tensor] = None,
+        target_rate: Optional[int] = None,
+    ):
+        batch_size, num_channels, num_samples = samples.shape
+
+        if self._mode == "per_example":
+            ir_ids = torch.randint(0, self.irs.shape[0], (batch_size,))
+        elif self._mode == "per_batch":
+            ir_ids = torch.randint(0, self.irs.shape[0], (1,)).expand(batch_size)
+
+        self.transform_parameters["ir_ids"] = ir_ids
+        self.transform_parameters["rt60"] = self.rt60s[ir_ids.to(self.rt60s.device)].cpu()
+
+    def get_ir_spectra(self, n_fft, device):
+        if self._ir_spectra is None or self._ir_spectra[0] != n_fft or self._ir_spectra[1] != device:
+            self._ir_spectra = (n_fft, device, torch.fft.rfft(self.irs.to(device), n = n_fft))
+        return self._ir_spectra[2]
+
+    def apply_transform(
+        self,
+        samples: Tensor = None,
+        sample_rate: Optional[int] = None,
+        targets: Optional[Tensor] = None,
+        target_rate: Optional[int] = None,
+    ) -> ObjectDict:
+        """
+        :param samples: (batch_size, num_channels, num_samples)
+        :param sample_rate:
+        """
+        batch_size, num_channels, num_samples = samples.shape
+
+        if sample_rate is not None and sample_rate != self._sample_rate:
+            raise ValueError(
+                "sample_rate must match the value of sample_rate "
+                + "passed into the ConvolutionReverb constructor"
+            )
+        sample_rate = self.sample_rate
+
+        # linear (not circular) convolution, with a power of two FFT size
+        n_fft = 1 << (num_samples + self.irs.shape[1] - 2).bit_length()
+        ir_spectra = self.get_ir_spectra(n_fft, samples.device)[self.transform_parameters["ir_ids"].to(samples.device)]
+        wet = torch.fft.irfft(torch.fft.rfft(samples, n = n_fft) * ir_spectra[:, None], n = n_fft)[..., :num_samples]
+
+        return ObjectDict(
+            samples=self._dry_level * samples + self._wet_level * wet,
+            sample_rate=sample_rate,
+            targets=targets,
+            target_rate=target_rate,
+        )
@@ -1,9 +1,14 @@
 
 from . import PedalBoardAudiomentation
+from .time_stretch import phase_vocoder_stretch
 from pedalboard import Pedalboard, PitchShift
+from torch_audiomentations.utils.object_dict import ObjectDict
 from typing import Optional
 from torch import Tensor
+from fractions import Fraction
 import numpy as np
+import torch
+import math
 
 
 
@@ -45,9 +50,70 @@ import numpy as np
 #                     transform_ranges = np.arange(self.transform_ranges[key][0], self.transform_ranges[key][1], 1)
 #                     self.transform_parameters[key] = np.random.choice(transform_ranges, 1)
 
+def get_resample_kernel(orig_freq, new_freq, lowpass_filter_width = 6, rolloff = 0.99):
+    # polyphase windowed-sinc kernels ([new_freq, 1, K]) from orig_freq to new_freq, as torchaudio's sinc_interp_hann
+    base_freq = min(orig_freq, new_freq) * rolloff
+    width = math.ceil(lowpass_filter_width * orig_freq / base_freq)
+    idx = torch.arange(-width, width + orig_freq, dtype = torch.float64)[None, None] / orig_freq
+    t = torch.arange(0, -new_freq, -1, dtype = torch.float64)[:, None, None] / new_freq + idx
+    t = (t * base_freq).clamp(-lowpass_filter_width, lowpass_filter_width)
+    window = torch.cos(t * math.pi / lowpass_filter_width / 2) ** 2
+    t = t * math.pi
+    kernels = torch.where(t == 0, torch.ones_like(t), torch.sin(t) / torch.where(t == 0, torch.ones_like(t), t))
+    return (kernels * window * base_freq / orig_freq).float(), width
+
+
+def resample(samples: Tensor, orig_freq, new_freq, kernel, width) -> Tensor:
+    # [N, L] -> [N, ceil(L * new_freq / orig_freq)], with a kernel of get_resample_kernel
+    n_rows, n_samples = samples.shape
+    padded = torch.nn.functional.pad(samples[:, None], (width, width + orig_freq))
+    resampled = torch.nn.functional.conv1d(padded, kernel.to(samples), stride = orig_freq)
+    return resampled.transpose(1, 2).reshape(n_rows, -1)[:, :math.ceil(new_freq * n_samples / orig_freq)]
+
+
+def batch_pitch_shift(samples: Tensor, semitones, kernels = None, max_denominator = 128) -> Tensor:
+    """
+    Pitch shifts every row of ``samples`` ([..., T]) by its own number of semitones: one phase
+    vocoder stretch of the whole batch by 2 ** (semitones / 12), then a resampling back to T samples
+    per distinct ratio. Ratios are rounded to fractions with denominators up to ``max_denominator``
+    (well under a cent off) so that the resampling kernels stay small; they are kept in ``kernels``,
+    a dict keyed by ratio, across calls.
+    """
+    shape = samples.shape
+    samples = samples.reshape(-1, shape[-1])
+    n_rows, n_samples = samples.shape
+    semitones = torch.as_tensor(semitones, dtype = torch.float64).reshape(-1)
+    semitones = semitones.expand(n_rows) if semitones.numel() == 1 else semitones
+    kernels = {} if kernels is None else kernels
+
+    ratios = [Fraction(2 ** (value / 12)).limit_denominator(max_denominator) for value in semitones.tolist()]
+    # stretched by the exact rational ratio, so that resampling lands back on n_samples
+    stretched = phase_vocoder_stretch(
+        samples, [float(1 / ratio) for ratio in ratios], n_output_samples = math.ceil(n_samples * max(ratios))
+    )
+
+    output = samples.clone()
+    for ratio in set(ratios):
+        if ratio == 1:
+            continue
+        if ratio not in kernels:
+            kernels[ratio] = get_resample_kernel(ratio.numerator, ratio.denominator)
+        rows = torch.tensor([i for i, row_ratio in enumerate(ratios) if row_ratio == ratio], device = samples.device)
+        shifted = resample(stretched[rows, :math.ceil(n_samples * ratio)], ratio.numerator, ratio.denominator, *kernels[ratio])
+        output[rows] = torch.nn.functional.pad(shifted, (0, max(n_samples - shifted.shape[-1], 0)))[:, :n_samples]
+
+    return output.reshape(shape)
+
+
 class PitchShiftAudiomentation(PedalBoardAudiomentation):
     
-    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None, randomize_parameters = True, *args, **kwargs):
+    identity_parameters = {"semitones": 0.0}
+    
+    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None, randomize_parameters = True, num_threads = 1, max_process_channels = None, backend = "pedalboard", semitone_step = None, *args, **kwargs):
+        """
+        :param backend: ``pedalboard`` (PitchShift per example) or ``torch`` (batch_pitch_shift, on the device of the batch)
+        :param semitone_step: draw semitones on a grid of this step, e.g. 1 for whole semitones, None for continuous values
+        """
         try:
             board = Pedalboard([
                 PitchShift(**kwargs)
@@ -57,7 +123,38 @@ class PitchShiftAudiomentation(PedalBoardAudiomentation):
                 PitchShift()
             ])
         
-        super().__init__(board, mode, p, p_mode, sample_rate , output_type=output_type, randomize_parameters=randomize_parameters)
+        super().__init__(board, mode, p, p_mode, sample_rate , output_type=output_type, randomize_parameters=randomize_parameters, num_threads=num_threads, max_process_channels=max_process_channels)
         self.set_kwargs(**kwargs)
         
-        print("PitchShiftAudiomentation")
\ No newline at end of file
+        if backend not in ["pedalboard", "torch"]:
+            raise ValueError(f"Invalid backend: {backend}. Supported backends are: pedalboard, torch")
+        self._backend = backend
+        self._semitone_step = semitone_step
+        # resampling kernels of batch_pitch_shift, one per ratio
+        self._resample_kernels = {}
+        
+        print("PitchShiftAudiomentation")
+    
+    def randomize_parameters(self, samples: Tensor = None, sample_rate: Optional[int] = None, targets: Optional[Tensor] = None, target_rate: Optional[int] = None):
+        super().randomize_parameters(samples, sample_rate, targets, target_rate)
+        if self._semitone_step and "semitones" in self.transform_parameters:
+            self.transform_parameters["semitones"] = [
+                float(np.round(value / self._semitone_step) * self._semitone_step) for value in self.transform_parameters["semitones"]
+            ]
+    
+    def apply_transform(self, samples: Tensor = None, sample_rate: Optional[int] = None, targets: Optional[Tensor] = None, target_rate: Optional[int] = None) -> ObjectDict:
+        if self._backend == "pedalboard":
+            return super().apply_transform(samples, sample_rate, targets, target_rate)
+        
+        batch_size, num_channels, num_samples = samples.shape
+        # one shift per example (or one for the batch), shared by the channels of an example
+        semitones = self.get_parameter("semitones", batch_size).double().reshape(-1, 1).expand(batch_size, num_channels)
+        samples = batch_pitch_shift(samples, semitones, kernels = self._resample_kernels)
+        
+        return ObjectDict(
+            samples=samples,
+            sample_rate=sample_rate,
+            targets=targets,
+            target_rate=target_rate,
+            should_apply = self.transform_parameters["should_apply"]
+        )
\ No newline at end of file
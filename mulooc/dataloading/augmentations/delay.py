@@ -18,6 +18,9 @@ class Delay(BaseWaveformTransform):
     supports_target = True
     requires_target = False
 
+    # parameters recorded by CustomCompose, see CustomCompose.get_records
+    record_parameters = ["delays", "volume_factors", "repeats", "attenuation"]
+
     def __init__(
         self,
         min_delay_ms: float = 100.0,
@@ -164,36 +167,20 @@ class Delay(BaseWaveformTransform):
             )
         sample_rate = self.sample_rate
 
-        if self._mode == "per_example":
-            for i in range(batch_size):
-                samples[i, ...] = self.delay(
-                    samples[i][None],
-                    self.transform_parameters["delays"][i],
-                    self.transform_parameters['volume_factors'][i],
-                    self.transform_parameters['repeats'][i],
-                    self.transform_parameters['attenuation'][i],
-                    sample_rate,
-                )[0]
+        # per-example and per-channel parameters broadcast to [B, C] (or [1, 1] per batch) tensors
+        parameters = [
+            torch.tensor(self.transform_parameters[key], dtype=torch.float32, device=samples.device)
+            for key in ["delays", "volume_factors", "repeats", "attenuation"]
+        ]
+        if self._mode == "per_channel":
+            parameters = [parameter.view(batch_size, num_channels) for parameter in parameters]
+        else:
+            parameters = [parameter.view(-1, 1) for parameter in parameters]
 
-        elif self._mode == "per_channel":
-            for i in range(batch_size):
-                for j in range(num_channels):
-                    samples[i, j, ...] = self.delay(
-                        samples[i][j][None][None],
-                        self.transform_parameters["delays"][i][j],
-                        self.transform_parameters['volume_factors'][i][j],
-                        self.transform_parameters['repeats'][i][j],
-                        self.transform_parameters['attenuation'][i][j],
-                        sample_rate,
-                    )[0][0]
+        samples = self.batch_delay(samples, *parameters)
 
-        elif self._mode == "per_batch":
-            samples = self.delay(
-                samples, self.transform_parameters["delays"][0], self.transform_parameters['volume_factors'][0], 
-                self.transform_parameters['repeats'][0],
-                self.transform_parameters['attenuation'][0],
-                sample_rate
-            )
+        if self.debug:
+            print({key: self.transform_parameters[key] for key in ["volume_factors", "repeats", "attenuation"]})
 
         return ObjectDict(
             samples=samples,
@@ -204,24 +191,45 @@ class Delay(BaseWaveformTransform):
         
     def delay(self,samples: Tensor, delay_samples: int, volume_factor: float , repeats, attenuation, sample_rate: int) -> Tensor:
         
-        ## add the original signal delayed by delay_samples to the original signal
-        ## do this operation repeats times and each time attenuate the delayed signal by attenuation factor
-        ## reduce the whole delayed signal by volume_factor
-        ## then add both signals together and truncate to be the same length as the original signal
+        ## same delay parameters for every example and channel of samples
+        samples = self.batch_delay(
+            samples,
+            *[torch.tensor([[value]], dtype=torch.float32, device=samples.device) for value in [delay_samples, volume_factor, repeats, attenuation]]
+        )
+        
+        if self.debug:
+            ## pretty print the volume factor, number of repeats, and attenuation factor
+            print(f"volume_factor: {volume_factor}, repeats: {repeats}, attenuation: {attenuation}")
+
+        return samples
+
+    def batch_delay(self, samples: Tensor, delays: Tensor, volume_factors: Tensor, repeats: Tensor, attenuation: Tensor) -> Tensor:
+        
+        ## add copies of the signal delayed by i * delay samples, attenuated by attenuation ** i, for i < repeats
+        ## (i = 0 being the dry signal), scale the delayed sum by volume_factor and average it with the input.
+        ## parameters are [B, C] tensors (or broadcastable to it), so the whole batch is processed with one
+        ## indexing op per repeat instead of one buffer per example.
         
         batch_size, num_channels, num_samples = samples.shape
         
-        delayed_signal = torch.zeros(batch_size, num_channels, num_samples + repeats * delay_samples, device = samples.device)
+        delays = delays.expand(batch_size, num_channels).reshape(-1).long()
+        volume_factors = volume_factors.expand(batch_size, num_channels).reshape(-1, 1)
+        repeats = repeats.expand(batch_size, num_channels).reshape(-1, 1)
+        attenuation = attenuation.expand(batch_size, num_channels).reshape(-1, 1)
         
-        for i in range(repeats):
-            delayed_signal[:,:,i*delay_samples:i*delay_samples+num_samples] += samples * attenuation ** (i)
-            
-        delayed_signal = delayed_signal[:,:,:num_samples]
+        flat = samples.reshape(-1, num_samples)
+        max_repeats = int(repeats.max().item())
+        max_shift = max(max_repeats - 1, 0) * int(delays.max().item())
         
-        samples = (samples + volume_factor * delayed_signal)/2
+        # output = (x + volume * sum_i attenuation^i * x[t - i * delay]) / 2, the i = 0 term being x itself
+        weights = [0.5 * volume_factors * (attenuation ** i) * (i < repeats) for i in range(max(max_repeats, 1))]
+        output = flat * (0.5 + weights[0])
         
-        if self.debug:
-            ## pretty print the volume factor, number of repeats, and attenuation factor
-            print(f"volume_factor: {volume_factor}, repeats: {repeats}, attenuation: {attenuation}")
-
-        return samples
\ No newline at end of file
+        # every shift of every row is a window of the left-padded signal
+        windows = torch.nn.functional.pad(flat, (max_shift, 0)).unfold(1, num_samples, 1)
+        rows = torch.arange(flat.shape[0], device = samples.device)
+        
+        for i in range(1, max_repeats):
+            output.addcmul_(windows[rows, max_shift - i * delays], weights[i])
+        
+        return output.view(batch_size, num_channels, num_samples)
@@ -1,11 +1,24 @@
 
 from . import PedalBoardAudiomentation
 from pedalboard import Pedalboard, Distortion
+from torch_audiomentations.utils.object_dict import ObjectDict
+from typing import Optional
+from torch import Tensor
+import torch
+
+
+def distort(samples: Tensor, drive_db: Tensor) -> Tensor:
+    # pedalboard's Distortion: tanh waveshaping after a gain of drive_db, per row of samples ([B, ...])
+    gain = 10 ** (drive_db.to(samples).reshape(-1, *[1] * (samples.dim() - 1)) / 20)
+    return torch.tanh(samples * gain)
 
 
 class DistortionAudiomentation(PedalBoardAudiomentation):
     
-    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None,randomize_parameters = True, *args, **kwargs):
+    def __init__(self, board=None, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None,randomize_parameters = True, num_threads = 1, max_process_channels = None, backend = "pedalboard", *args, **kwargs):
+        """
+        :param backend: ``pedalboard`` (the plugin per example) or ``torch`` (distort over the whole batch, on its device)
+        """
         
         try:
             board = Pedalboard([
@@ -16,7 +29,26 @@ class DistortionAudiomentation(PedalBoardAudiomentation):
                 Distortion()
             ])
         
-        super().__init__(board, mode, p, p_mode, sample_rate, output_type=output_type, randomize_parameters=randomize_parameters)
+        super().__init__(board, mode, p, p_mode, sample_rate, output_type=output_type, randomize_parameters=randomize_parameters, num_threads=num_threads, max_process_channels=max_process_channels)
         # print(self.output_type)
         
-        self.set_kwargs(**kwargs)
\ No newline at end of file
+        self.set_kwargs(**kwargs)
+        
+        if backend not in ["pedalboard", "torch"]:
+            raise ValueError(f"Invalid backend: {backend}. Supported backends are: pedalboard, torch")
+        self._backend = backend
+    
+    def apply_transform(self, samples: Tensor = None, sample_rate: Optional[int] = None, targets: Optional[Tensor] = None, target_rate: Optional[int] = None) -> ObjectDict:
+        if self._backend == "pedalboard":
+            return super().apply_transform(samples, sample_rate, targets, target_rate)
+        
+        batch_size, num_channels, num_samples = samples.shape
+        samples = distort(samples, self.get_parameter("drive_db", batch_size))
+        
+        return ObjectDict(
+            samples=samples,
+            sample_rate=sample_rate,
+            targets=targets,
+            target_rate=target_rate,
+            should_apply = self.transform_parameters["should_apply"]
+        )
@@ -2,10 +2,14 @@
 
 
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
 import torch
 from torch_audiomentations.core.transforms_interface import BaseWaveformTransform
 from torch_audiomentations.utils.object_dict import ObjectDict
 from torch import Tensor
+from pedalboard import Pedalboard
 import numpy as np
 
 
@@ -17,13 +21,17 @@ class PedalBoardAudiomentation(BaseWaveformTransform):
     """
     
     
-    supported_modes = {"per_example"}
+    supported_modes = {"per_example", "per_batch"}
 
     supports_multichannel = True
     requires_sample_rate = True
 
     supports_target = True
     requires_target = False
+    
+    # whether the plugins process channels independently, so that with per_batch the [1, B*C, T]
+    # batch can go through the board as one multichannel buffer
+    batch_channels = True
 
     
     def __init__(self, board,
@@ -33,7 +41,9 @@ class PedalBoardAudiomentation(BaseWaveformTransform):
         sample_rate: int = None,
         target_rate: int = None,
         output_type: Optional[str] = 'dict',
-        randomize_parameters: bool = True,):
+        randomize_parameters: bool = True,
+        num_threads: int = 1,
+        max_process_channels: int = None,):
         super().__init__(
             mode=mode,
             p=p,
@@ -49,6 +59,8 @@ class PedalBoardAudiomentation(BaseWaveformTransform):
         :param p:
         :param p_mode:
         :param target_rate:
+        :param num_threads: number of threads processing the examples of a batch concurrently, each with its own board
+        :param max_process_channels: with per_batch, the most channels processed by one board call, None for all of them
         
         """
         self._randomize_parameters = randomize_parameters
@@ -66,6 +78,12 @@ class PedalBoardAudiomentation(BaseWaveformTransform):
         self.transform_parameters = {}
         self.transform_ranges = {}
         
+        self._num_threads = num_threads
+        self._max_process_channels = max_process_channels
+        self._executor = None
+        self._executor_pid = None
+        self._thread_boards = threading.local()
+        
     # indexing with [] should return self._board[index]
     def __getitem__(self, index):
         return self._board[index]
@@ -73,6 +91,11 @@ class PedalBoardAudiomentation(BaseWaveformTransform):
     def append(self, effect):
         self._board.append(effect)
     
+    @property
+    def record_parameters(self):
+        # parameters recorded by CustomCompose, the randomized plugin properties
+        return list(self.transform_ranges) if self._randomize_parameters else []
+    
     # def __call__(self, samples):
     #     return self.process(samples)
     
@@ -80,13 +103,51 @@ class PedalBoardAudiomentation(BaseWaveformTransform):
         ## audio is of shape [Batch, channels, time], as expected by pedalboard
         new_audio = []
         for i in range(samples.shape[0]):
-            input_ = samples[i,:,:].numpy()
+            input_ = samples[i,:,:].cpu().numpy()
             effected = self._board(input_array = input_, sample_rate = self._sample_rate)
-            new_audio.append(torch.tensor(effected).unsqueeze(0))
+            new_audio.append(torch.tensor(effected, device = samples.device).unsqueeze(0))
         
         
         return torch.cat(new_audio, dim=0)
 
+    def clone_board(self):
+        # pedalboard plugins can't be copied or pickled, rebuild them and copy every settable property
+        plugins = []
+        for plugin in self._board:
+            clone = type(plugin)()
+            for name in dir(type(plugin)):
+                attribute = getattr(type(plugin), name)
+                if isinstance(attribute, property) and attribute.fset is not None and not name.startswith("_"):
+                    setattr(clone, name, getattr(plugin, name))
+            plugins.append(clone)
+        return Pedalboard(plugins)
+    
+    def get_executor(self):
+        # threads don't survive a fork, so each dataloader worker starts its own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers = self._num_threads)
+            self._executor_pid = os.getpid()
+            self._thread_boards = threading.local()
+        return self._executor
+    
+    def get_thread_board(self):
+        # one board per thread, as boards are configured per example
+        board = getattr(self._thread_boards, "board", None)
+        if board is None:
+            board = self.clone_board()
+            self._thread_boards.board = board
+        return board
+    
+    def get_parameter(self, name, batch_size):
+        # [batch_size] values of a plugin property, drawn if randomized, for the torch backends
+        values = self.transform_parameters.get(name, [getattr(self._board[0], name)] * batch_size)
+        return torch.tensor(values, dtype = torch.float32)
+    
+    def process_example(self, board, input_, parameters):
+        for key, value in parameters.items():
+            board[0].__setattr__(key, value)
+        return board(input_array = input_, sample_rate = self._sample_rate)
+
     def apply_transform(
         
         self,
@@ -98,11 +159,39 @@ class PedalBoardAudiomentation(BaseWaveformTransform):
         
         batch_size, num_channels, num_samples = samples.shape
         
-        for i in range(batch_size):
-            if self._randomize_parameters:
-                for key in self.transform_parameters:   
-                    self._board[0].__setattr__(key, self.transform_parameters[key][i]) if key!="should_apply" else None
-            samples[i, ...] = self.process(samples[i][None])
+        parameters = [
+            {key: self.transform_parameters[key][i] for key in self.transform_parameters if key != "should_apply"}
+            if self._randomize_parameters else {}
+            for i in range(batch_size)
+        ]
+        
+        # per_batch hands over the whole batch as one [1, B*C, T] example with shared parameters,
+        # its channels go through the board in as few calls as the plugins and max_process_channels allow
+        step = num_channels
+        if self._mode == "per_batch":
+            if not self.batch_channels:
+                step = 1
+            elif self._max_process_channels is not None:
+                step = min(step, self._max_process_channels)
+        jobs = [(i, slice(c, c + step)) for i in range(batch_size) for c in range(0, num_channels, step)]
+        
+        if self._num_threads > 1 and len(jobs) > 1:
+            # pedalboard releases the GIL, so examples are processed concurrently into a preallocated output
+            input_ = samples.cpu().numpy()
+            output = np.empty_like(input_)
+            
+            def process(job):
+                i, channels = job
+                output[i, channels] = self.process_example(self.get_thread_board(), input_[i, channels], parameters[i])
+            
+            list(self.get_executor().map(process, jobs))
+            samples = torch.from_numpy(output).to(samples.device)
+        
+        else:
+            for i, channels in jobs:
+                samples[i, channels] = torch.from_numpy(
+                    self.process_example(self._board, samples[i, channels].cpu().numpy(), parameters[i])
+                ).to(samples.device)
         
         return ObjectDict(
             samples=samples,
@@ -113,7 +202,7 @@ class PedalBoardAudiomentation(BaseWaveformTransform):
         )    
 
     # TODO : implement parameter randomization
-    # TODO : implement per-batch and per-channel modes
+    # TODO : implement per-channel mode
     
     def set_kwargs(self, **kwargs):
         
@@ -5,7 +5,10 @@ from pedalboard import Pedalboard, Reverb
 
 class ReverbAudiomentation(PedalBoardAudiomentation):
     
-    def __init__(self, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None,randomize_parameters = True, *args, **kwargs):
+    # the reverb is stereo: channels beyond the second are passed through and a pair is mixed
+    batch_channels = False
+    
+    def __init__(self, sample_rate = 22050, mode='per_example', p=0.5, p_mode=None, output_type=None,randomize_parameters = True, num_threads = 1, max_process_channels = None, *args, **kwargs):
         
         try:
             board  = Pedalboard([
@@ -15,6 +18,6 @@ class ReverbAudiomentation(PedalBoardAudiomentation):
             board = Pedalboard([
                 Reverb()
             ])
-        super().__init__(board = board, mode = mode, p = p, p_mode = p_mode, sample_rate = sample_rate, output_type = output_type, randomize_parameters = randomize_parameters)
+        super().__init__(board = board, mode = mode, p = p, p_mode = p_mode, sample_rate = sample_rate, output_type = output_type, randomize_parameters = randomize_parameters, num_threads = num_threads, max_process_channels = max_process_channels)
         
         self.set_kwargs(**kwargs)
\ No newline at end of file
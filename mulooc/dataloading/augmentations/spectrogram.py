@@ -0,0 +1,200 @@
+from torch import Tensor
+import torch
+
+
+class SpectrogramTransform(torch.nn.Module):
+    """
+    Base of the spectrogram-domain transforms, applied to frontend output ([B, ..., n_mels, frames],
+    e.g. Melgram) on its device. As the waveform transforms, each example is transformed with
+    probability ``p`` (or the whole batch, with ``per_batch``), ``transform_parameters`` holds the
+    ``should_apply`` mask and the parameters of the transformed examples, and nothing happens in eval mode.
+    """
+
+    supported_modes = {"per_example", "per_batch"}
+
+    # parameters recorded by CustomCompose, see CustomCompose.get_records
+    record_parameters = []
+    identity_parameters = {}
+
+    def __init__(self, p = 0.5, mode = "per_example"):
+        super().__init__()
+        if mode not in self.supported_modes:
+            raise ValueError(f"Invalid mode: {mode}. Supported modes are: {self.supported_modes}")
+        self.p = p
+        self.mode = mode
+        self.p_mode = mode
+        self._mode = mode
+        self.transform_parameters = {}
+
+    def uniform(self, low, high, n):
+        # n values, one per transformed example or the same one for the batch
+        values = low + (high - low) * torch.rand(1 if self._mode == "per_batch" else n)
+        return values.expand(n)
+
+    def randint(self, low, high, n):
+        # n integers in [low, high], one per transformed example or the same one for the batch
+        values = torch.randint(int(low), int(high) + 1, (1 if self._mode == "per_batch" else n,))
+        return values.expand(n)
+
+    def randomize_parameters(self, specs: Tensor):
+        raise NotImplementedError
+
+    def apply_transform(self, specs: Tensor) -> Tensor:
+        raise NotImplementedError
+
+    def forward(self, specs: Tensor) -> Tensor:
+        batch_size = specs.shape[0]
+        if not self.training:
+            self.transform_parameters = {"should_apply": torch.zeros(batch_size, dtype = torch.bool)}
+            return specs
+
+        if self._mode == "per_batch":
+            should_apply = (torch.rand(1) < self.p).expand(batch_size)
+        else:
+            should_apply = torch.rand(batch_size) < self.p
+        self.transform_parameters = {"should_apply": should_apply}
+        if not should_apply.any():
+            return specs
+
+        selected = should_apply.to(specs.device)
+        self.randomize_parameters(specs[selected])
+        specs = specs.clone()
+        specs[selected] = self.apply_transform(specs[selected])
+        return specs
+
+
+def get_band_mask(n_positions, starts, widths, device):
+    # [n, n_positions] mask of the union of the [start, start + width) bands of each row ([n, n_bands])
+    positions = torch.arange(n_positions, device = device)[None, None]
+    starts, widths = starts.to(device)[..., None], widths.to(device)[..., None]
+    return ((positions >= starts) & (positions < starts + widths)).any(dim = 1)
+
+
+class TimeMasking(SpectrogramTransform):
+    """
+    SpecAugment time masking: ``n_masks`` bands of up to ``max_width`` frames each are set to the
+    mean of the example.
+    """
+
+    record_parameters = ["masked_frames"]
+    identity_parameters = {"masked_frames": 0.0}
+
+    def __init__(self, max_width = 20, n_masks = 1, p = 0.5, mode = "per_example"):
+        super().__init__(p, mode)
+        self.max_width = max_width
+        self.n_masks = n_masks
+
+    def randomize_parameters(self, specs: Tensor):
+        n, n_frames = specs.shape[0], specs.shape[-1]
+        widths = torch.stack([self.randint(0, min(self.max_width, n_frames), n) for _ in range(self.n_masks)], dim = 1)
+        starts = (torch.rand(widths.shape) * (n_frames - widths + 1)).long()
+        self.transform_parameters["starts"] = starts
+        self.transform_parameters["widths"] = widths
+        self.transform_parameters["masked_frames"] = widths.sum(dim = 1).float()
+
+    def apply_transform(self, specs: Tensor) -> Tensor:
+        mask = get_band_mask(specs.shape[-1], self.transform_parameters["starts"], self.transform_parameters["widths"], specs.device)
+        mask = mask.view(specs.shape[0], *[1] * (specs.dim() - 2), specs.shape[-1])
+        means = specs.mean(dim = tuple(range(1, specs.dim())), keepdim = True)
+        return torch.where(mask, means, specs)
+
+
+class FrequencyMasking(SpectrogramTransform):
+    """
+    SpecAugment frequency masking: ``n_masks`` bands of up to ``max_width`` bins each are set to the
+    mean of the example.
+    """
+
+    record_parameters = ["masked_bins"]
+    identity_parameters = {"masked_bins": 0.0}
+
+    def __init__(self, max_width = 12, n_masks = 1, p = 0.5, mode = "per_example"):
+        super().__init__(p, mode)
+        self.max_width = max_width
+        self.n_masks = n_masks
+
+    def randomize_parameters(self, specs: Tensor):
+        n, n_bins = specs.shape[0], specs.shape[-2]
+        widths = torch.stack([self.randint(0, min(self.max_width, n_bins), n) for _ in range(self.n_masks)], dim = 1)
+        starts = (torch.rand(widths.shape) * (n_bins - widths + 1)).long()
+        self.transform_parameters["starts"] = starts
+        self.transform_parameters["widths"] = widths
+        self.transform_parameters["masked_bins"] = widths.sum(dim = 1).float()
+
+    def apply_transform(self, specs: Tensor) -> Tensor:
+        mask = get_band_mask(specs.shape[-2], self.transform_parameters["starts"], self.transform_parameters["widths"], specs.device)
+        mask = mask.view(specs.shape[0], *[1] * (specs.dim() - 3), specs.shape[-2], 1)
+        means = specs.mean(dim = tuple(range(1, specs.dim())), keepdim = True)
+        return torch.where(mask, means, specs)
+
+
+class FrequencyShift(SpectrogramTransform):
+    """
+    Pitch shift approximated by moving the spectrogram up or down by a whole number of bins, between
+    ``min_shift`` and ``max_shift``, the bins moved in filled with the minimum of the example. On mel
+    bins, which are roughly log-spaced above 1 kHz, a shift is close to a constant pitch ratio there.
+    """
+
+    record_parameters = ["shift_bins"]
+    identity_parameters = {"shift_bins": 0.0}
+
+    def __init__(self, min_shift = -4, max_shift = 4, p = 0.5, mode = "per_example"):
+        super().__init__(p, mode)
+        if min_shift > max_shift:
+            raise ValueError("min_shift must not be greater than max_shift")
+        self.min_shift = min_shift
+        self.max_shift = max_shift
+
+    def randomize_parameters(self, specs: Tensor):
+        self.transform_parameters["shift_bins"] = self.randint(self.min_shift, self.max_shift, specs.shape[0])
+
+    def apply_transform(self, specs: Tensor) -> Tensor:
+        n_bins = specs.shape[-2]
+        shifts = self.transform_parameters["shift_bins"].to(specs.device)
+        # bin f of the output is bin f - shift of the input
+        sources = torch.arange(n_bins, device = specs.device)[None] - shifts[:, None]
+        valid = ((sources >= 0) & (sources < n_bins)).view(specs.shape[0], *[1] * (specs.dim() - 3), n_bins, 1)
+        index = sources.clamp(0, n_bins - 1).view(specs.shape[0], *[1] * (specs.dim() - 3), n_bins, 1).expand(specs.shape)
+        minimums = specs.amin(dim = tuple(range(1, specs.dim())), keepdim = True)
+        return torch.where(valid, specs.gather(-2, index), minimums)
+
+
+class TimeWarp(SpectrogramTransform):
+    """
+    SpecAugment time warping: the frame at a random centre moves by up to ``max_warp`` frames, the
+    frames on each side of it are stretched or squeezed linearly to follow, with linear interpolation.
+    """
+
+    record_parameters = ["warp_frames"]
+    identity_parameters = {"warp_frames": 0.0}
+
+    def __init__(self, max_warp = 5, p = 0.5, mode = "per_example"):
+        super().__init__(p, mode)
+        self.max_warp = max_warp
+
+    def randomize_parameters(self, specs: Tensor):
+        n, n_frames = specs.shape[0], specs.shape[-1]
+        max_warp = min(self.max_warp, (n_frames - 1) // 2 - 1)
+        self.transform_parameters["centres"] = self.randint(max_warp + 1, n_frames - 2 - max_warp, n)
+        self.transform_parameters["warp_frames"] = self.uniform(-max_warp, max_warp, n)
+
+    def apply_transform(self, specs: Tensor) -> Tensor:
+        n_frames = specs.shape[-1]
+        centres = self.transform_parameters["centres"].to(specs.device, torch.float32)[:, None]
+        warps = self.transform_parameters["warp_frames"].to(specs.device, torch.float32)[:, None]
+        last = n_frames - 1
+
+        # input position of each output frame, the centre of the input landing on centre + warp
+        t = torch.arange(n_frames, device = specs.device, dtype = torch.float32)[None]
+        moved = centres + warps
+        sources = torch.where(
+            t < moved, t * centres / moved, centres + (t - moved) * (last - centres) / (last - moved)
+        ).clamp(0, last)
+
+        below = sources.floor().long()
+        above = (below + 1).clamp(max = last)
+        weights = (sources - below).view(specs.shape[0], *[1] * (specs.dim() - 2), n_frames)
+        shape = (specs.shape[0], *[1] * (specs.dim() - 2), n_frames)
+        below = below.view(shape).expand(specs.shape)
+        above = above.view(shape).expand(specs.shape)
+        return specs.gather(-1, below) * (1 - weights) + specs.gather(-1, above) * weights
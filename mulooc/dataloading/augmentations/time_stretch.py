@@ -7,8 +7,68 @@ from typing import Optional
 import librosa
 import numpy as np
 import torch
+import math
 
 
+def phase_vocoder_stretch(samples: Tensor, rates, n_fft = 2048, hop_length = 512, n_output_samples = None) -> Tensor:
+    """
+    Time stretches every row of ``samples`` ([..., T]) by its own rate with a phase vocoder
+    (STFT, per-row frame interpolation with phase accumulation, iSTFT), following
+    ``librosa.effects.time_stretch``. The output has ``n_output_samples`` (by default the input
+    length): longer rows are truncated and shorter rows are zero-padded. Runs on the device of ``samples``.
+    """
+    shape = samples.shape
+    samples = samples.reshape(-1, shape[-1])
+    n_rows, n_samples = samples.shape
+    n_output_samples = n_samples if n_output_samples is None else int(n_output_samples)
+    rates = torch.as_tensor(rates, dtype = samples.dtype, device = samples.device).reshape(-1)
+    rates = rates.expand(n_rows) if rates.numel() == 1 else rates
+
+    window = torch.hann_window(n_fft, device = samples.device, dtype = samples.dtype)
+    stft = torch.stft(samples, n_fft, hop_length = hop_length, window = window, center = True,
+                      pad_mode = "constant", return_complex = True)
+    n_bins, n_frames = stft.shape[-2:]
+
+    # two zero frames so that interpolation past the last frame fades out, as in librosa
+    stft = torch.nn.functional.pad(stft, (0, 2))
+    magnitude, angle = stft.abs(), stft.angle()
+
+    # only the output frames that cover the output length are synthesised, plus the frames that
+    # overlap its last samples
+    n_output_frames = 1 + n_output_samples // hop_length + n_fft // hop_length
+    steps = torch.arange(n_output_frames, device = samples.device, dtype = samples.dtype)[None] * rates[:, None]
+    index = steps.long().clamp(max = n_frames)
+    alpha = (steps - index)[:, None]
+    index = index[:, None].expand(n_rows, n_bins, n_output_frames)
+
+    magnitude_0, magnitude_1 = magnitude.gather(2, index), magnitude.gather(2, index + 1)
+    angle_0, angle_1 = angle.gather(2, index), angle.gather(2, index + 1)
+    output_magnitude = (1 - alpha) * magnitude_0 + alpha * magnitude_1
+
+    # accumulate the phase advance. librosa adds the expected advance back after unwrapping the
+    # deviation from it, which is the same increment modulo 2 pi, so the wrapped difference is enough
+    # and keeps the running sum small
+    phase_delta = torch.remainder(angle_1 - angle_0 + math.pi, 2.0 * math.pi) - math.pi
+    phase = angle[..., :1] + torch.cumsum(phase_delta, dim = -1) - phase_delta
+
+    # frames past the end of the input do not exist in the stretched signal. The overlap-add is done
+    # by hand so that they are also left out of each row's window normalisation, as if every row had
+    # been inverted with its own number of frames
+    valid = (steps < n_frames)[:, None].to(samples.dtype)
+    frames = torch.fft.irfft(torch.polar(output_magnitude, phase), n = n_fft, dim = 1) * window[None, :, None] * valid
+    envelope = (window ** 2)[None, :, None] * valid
+    fold = lambda x: torch.nn.functional.fold(
+        x, output_size = (1, n_fft + hop_length * (n_output_frames - 1)), kernel_size = (1, n_fft), stride = (1, hop_length)
+    )[:, 0, 0, n_fft // 2:n_fft // 2 + n_output_samples]
+    envelope = fold(envelope.expand_as(frames).contiguous())
+    stretched = fold(frames) / torch.where(envelope > 1e-11, envelope, torch.ones_like(envelope))
+
+    # sped up rows are shorter than the input, zero everything past their end
+    out_lengths = torch.round(n_samples / rates)
+    stretched = stretched * (torch.arange(n_output_samples, device = samples.device)[None] < out_lengths[:, None])
+
+    return stretched.reshape(*shape[:-1], n_output_samples)
+
 
 class TimeStretchAudiomentation(BaseWaveformTransform):
     
@@ -20,6 +80,10 @@ class TimeStretchAudiomentation(BaseWaveformTransform):
     supports_target = True
     requires_target = False
 
+    # parameters recorded by CustomCompose, see CustomCompose.get_records
+    record_parameters = ["stretch_rates"]
+    identity_parameters = {"stretch_rates": 1.0}
+
     def __init__(
         self,
         max_stretch_rate: float = 1.2,
@@ -30,11 +94,13 @@ class TimeStretchAudiomentation(BaseWaveformTransform):
         sample_rate: int = None,
         target_rate: int = None,
         output_type: Optional[str] = None,
+        backend: str = "torch",
         ):
         """
         :param sample_rate:
         :param min_delay_ms: Minimum delay in milliseconds (default 20.0)
         :param max_delay_ms: Maximum delay in milliseconds (default 100.0)
+        :param backend: ``torch`` (batched phase vocoder on the batch device) or ``librosa`` (per example on CPU)
         :param mode: ``per_example``, ``per_channel``, or ``per_batch``. Default ``per_example``.
         :param p:
         :param p_mode:
@@ -57,6 +123,9 @@ class TimeStretchAudiomentation(BaseWaveformTransform):
         self._max_stretch_rate = max_stretch_rate
         self._min_stretch_rate = min_stretch_rate
         self._mode = mode
+        if backend not in ["torch", "librosa"]:
+            raise ValueError(f"Invalid backend: {backend}. Supported backends are: torch, librosa")
+        self._backend = backend
 
     def randomize_parameters(
         self,
@@ -99,7 +168,13 @@ class TimeStretchAudiomentation(BaseWaveformTransform):
             )
         sample_rate = self.sample_rate
 
-        if self._mode == "per_example":
+        if self._backend == "torch":
+            # one rate per example (or one for the batch), shared by the channels of an example
+            rates = torch.tensor(self.transform_parameters["stretch_rates"], dtype = samples.dtype, device = samples.device)
+            rates = rates.reshape(-1, 1).expand(batch_size, num_channels)
+            samples = phase_vocoder_stretch(samples, rates)
+
+        elif self._mode == "per_example":
             for i in range(batch_size):
                 samples[i, ...] = self.stretch(
                     samples[i][None],
@@ -129,9 +204,9 @@ class TimeStretchAudiomentation(BaseWaveformTransform):
         new_audio = torch.zeros_like(samples)
         samples = librosa.effects.time_stretch(y = samples.cpu().numpy(), rate =  stretch_rate)
         if samples.shape[-1] < new_audio.shape[-1]:
-            new_audio[...,:samples.shape[-1]] = torch.tensor(samples)
+            new_audio[...,:samples.shape[-1]] = torch.tensor(samples, device = new_audio.device)
         else:
-            new_audio = torch.tensor(samples[...,:new_audio.shape[-1]])
+            new_audio = torch.tensor(samples[...,:new_audio.shape[-1]], device = new_audio.device)
             
         return new_audio
        
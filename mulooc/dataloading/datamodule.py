@@ -1,13 +1,104 @@
-from mulooc.dataloading.dataset import AudioDataset, PrecomputedDataset
-from mulooc.dataloading.datamodule_splitter import DataModuleSplitter
+from mulooc.dataloading.dataset import AudioDataset, MixtureAudioDataset, PrecomputedDataset, PrerenderedDataset, render_dataset, get_render_path, log_stage
+from mulooc.dataloading.datamodule_splitter import DataModuleSplitter, MixtureSplitter
+from mulooc.dataloading.samplers import samplers, get_durations, ResumableDataLoader
+from mulooc.dataloading.augmentation_bank import AugmentationBank
+from mulooc.dataloading.tempo_stretch_cache import TempoStretchCache, get_cache_path, render_tempo_stretch_cache
+from mulooc.dataloading.augmentation_governor import AugmentationGovernor
+from mulooc.dataloading.feature_store import FeatureStore, get_store_path, is_rendered, render_feature_store
 import torch
 import pytorch_lightning as pl
 
 from torch_audiomentations import *
 from mulooc.dataloading.augmentations import *
 from mulooc.dataloading.augmentations.composition.custom_compose import CustomCompose
+from mulooc.dataloading.augmentations.composition.spectrogram_compose import SpectrogramCompose
 import os
 import pickle
+import time
+
+
+def get_augmentation_defaults(sample_rate):
+    # keyword arguments of each entry of augmentation_registry, updated with those of the augmentations config
+    return {
+        "gain": {"min_gain_in_db": -15.0, "max_gain_in_db": 5.0, "p": 0.5, "sample_rate": sample_rate},
+        "polarity_inversion": {"p": 0.5, "sample_rate": sample_rate},
+        "add_colored_noise": {"p": 0.5, "sample_rate": sample_rate, "min_snr_in_db": 3, "max_snr_in_db": 30, "min_f_decay": -2, "max_f_decay": 2},
+        "filtering": {
+            "bandpass": {"p": 0.5, "sample_rate": sample_rate, "min_center_frequency": 200, "max_center_frequency": 4000, "min_bandwidth_fraction": 0.5, "max_bandwidth_fraction": 1.99},
+            "bandstop": {"p": 0.5, "sample_rate": sample_rate, "min_center_frequency": 200, "max_center_frequency": 4000, "min_bandwidth_fraction": 0.5, "max_bandwidth_fraction": 1.99},
+            "highpass": {"p": 0.5, "sample_rate": sample_rate, "min_cutoff_freq": 200, "max_cutoff_freq": min(0.5 * sample_rate, 2400)},
+            "lowpass": {"p": 0.5, "sample_rate": sample_rate, "min_cutoff_freq": 75, "max_cutoff_freq": 7500}
+        },
+        "discrete_pitch_shift": {"p": 0.5, "sample_rate": sample_rate, "min_transpose_semitones": -4, "max_transpose_semitones": 4},
+        'pitch_shift': {"p": 0.5, "sample_rate": sample_rate, "min_semitones": -4, "max_semitones": 4},
+        "delay": {"p": 0.5, "sample_rate": sample_rate, "min_delay_ms": 100, "max_delay_ms": 500, "volume_factor": 0.5, "repeats": 2, "attenuation": 0.5},
+        "timestretch": {"p": 0.5, "sample_rate": sample_rate, "min_stretch_rate": 0.7, "max_stretch_rate": 1.3},
+        "discrete_timestretch": {"p": 0.5, "sample_rate": sample_rate, "min_stretch_rate": 0.7, "max_stretch_rate": 1.3},
+        "beta_timestretch": {"p": 0.5, "sample_rate": sample_rate, "min_stretch_rate": 0.7, "max_stretch_rate": 1.3},
+        "log_uniform_timestretch": {"p": 0.5, "sample_rate": sample_rate, "min_stretch_rate": 0.7, "max_stretch_rate": 1.3},
+        "reverb": {"p": 0.5, "sample_rate": sample_rate, "room_size": 0.2, "wet_level": 0.5, "dry_level": 0.5},
+        "convolution_reverb": {"p": 0.5, "sample_rate": sample_rate, "n_irs": 64, "min_rt60": 0.2, "max_rt60": 1.5, "wet_level": 0.5, "dry_level": 0.5},
+        "chorus": {"p": 0.5, "sample_rate": sample_rate, "mix": 1, "rate_hz": 5, "depth": 1},
+        "distortion": {"p": 0.5, "sample_rate": sample_rate, "drive_db": 9},
+        "compression": {"p": 0.5, "sample_rate": sample_rate, "threshold_db": -30, "ratio": 5},
+        "reverse": {"p": 0.5, "sample_rate": sample_rate},
+        "bitcrush": {"p": 0.5, "sample_rate": sample_rate, "bit_depth": 4},
+        "torch_distortion": {"p": 0.5, "sample_rate": sample_rate, "min_drive_db": 0, "max_drive_db": 18, "backend": "torch"},
+        "torch_compression": {"p": 0.5, "sample_rate": sample_rate, "min_threshold_db": -40, "max_threshold_db": -10, "ratio": 5, "backend": "torch"},
+        "torch_bitcrush": {"p": 0.5, "sample_rate": sample_rate, "min_bit_depth": 3, "max_bit_depth": 8, "backend": "torch"},
+        "mp3": {"p": 0.5, "sample_rate": sample_rate, "vbr_quality": 9},
+        "background": {"p": 0.5, "sample_rate": sample_rate, "min_snr_in_db": -3, "max_snr_in_db": 12, "background_paths": '/import/c4dm-datasets-ext/audioset-01/audioset/balanced_train_segments'}
+    }
+
+
+# builds a transform from its keyword arguments
+augmentation_registry = {
+    'gain': lambda kwargs: Gain(**kwargs),
+    'polarity_inversion': lambda kwargs: PolarityInversion(p=0.5, sample_rate=kwargs['sample_rate']),
+    'add_colored_noise': lambda kwargs: AddColoredNoise(**kwargs),
+    'filtering': lambda kwargs: OneOf([
+        BandPassFilter(**kwargs['bandpass']),
+        BandStopFilter(**kwargs['bandstop']),
+        HighPassFilter(**kwargs['highpass']),
+        LowPassFilter(**kwargs['lowpass']),
+    ]),
+    'pitch_shift': lambda kwargs: PitchShiftAudiomentation(**kwargs),
+    'timestretch': lambda kwargs: TimeStretch(**kwargs),
+    'discrete_timestretch': lambda kwargs: DiscreteTimeStretch(**kwargs),
+    'beta_timestretch': lambda kwargs: BetaTimeStretch(**kwargs),
+    'log_uniform_timestretch': lambda kwargs: LogUniformTimeStretch(**kwargs),
+    'reverb': lambda kwargs: ReverbAudiomentation(**kwargs),
+    'convolution_reverb': lambda kwargs: ConvolutionReverbAudiomentation(**kwargs),
+    'distortion': lambda kwargs: DistortionAudiomentation(**kwargs),
+    'background': lambda kwargs: AddBackgroundNoiseAudiomentation(**kwargs),
+    'delay': lambda kwargs: Delay(**kwargs),
+    'reverse': lambda kwargs: Reverse(**kwargs),
+    'chorus': lambda kwargs: ChorusAudiomentation(**kwargs),
+    'compression': lambda kwargs: CompressorAudiomentation(**kwargs),
+    'bitcrush': lambda kwargs: BitcrushAudiomentation(**kwargs),
+    'torch_distortion': lambda kwargs: DistortionAudiomentation(**kwargs),
+    'torch_compression': lambda kwargs: CompressorAudiomentation(**kwargs),
+    'torch_bitcrush': lambda kwargs: BitcrushAudiomentation(**kwargs),
+}
+
+
+def get_spectrogram_augmentation_defaults():
+    # keyword arguments of each entry of spectrogram_augmentation_registry, sizes in frontend frames and bins
+    return {
+        "time_masking": {"p": 0.5, "max_width": 20, "n_masks": 2},
+        "frequency_masking": {"p": 0.5, "max_width": 12, "n_masks": 2},
+        "frequency_shift": {"p": 0.5, "min_shift": -4, "max_shift": 4},
+        "time_warp": {"p": 0.5, "max_warp": 5},
+    }
+
+
+# spectrogram transforms of the "spec" augmentations, applied after the frontend
+spectrogram_augmentation_registry = {
+    'time_masking': lambda kwargs: TimeMasking(**kwargs),
+    'frequency_masking': lambda kwargs: FrequencyMasking(**kwargs),
+    'frequency_shift': lambda kwargs: FrequencyShift(**kwargs),
+    'time_warp': lambda kwargs: TimeWarp(**kwargs),
+}
 
 
 class AudioDataModule(pl.LightningDataModule):
@@ -38,16 +129,33 @@ class AudioDataModule(pl.LightningDataModule):
         val_split=0.1,
         frontend=None,
         keep_anchor=False, # to keep the clean anchor in the batch
-        tempo_stretching=False # for tempo estimation tasks only
+        tempo_stretching=False, # for tempo estimation tasks only
+        sampler=None, # name of a training sampler in mulooc.dataloading.samplers, None for a plain shuffle=True loader
+        sampler_kwargs=None,
+        val_render_path=None, # render the validation set once under this directory (per configuration) and stream it afterwards
+        val_render_frontend=True, # store frontend output in the rendered validation set rather than waveforms
+        sources=None, # list of {"task" or "audio_dir", "weight"} dicts to pretrain on a weighted mixture of corpora
+        batch_augment=None, # None, 'before_transfer' or 'after_transfer': run the augmentation chains and frontend on collated batches
+        augmentation_bank=None, # {"path": ..., "p": ...} of a store written by render_augmentation_bank.py
+        profile=False, # ship per-stage and per-transform wall-clock and call counts with each batch under "timings"
+        tempo_stretch_cache=None, # with tempo_stretching, directory of the train split stretched by tempo_stretch_factors, rendered once per configuration by prepare_data
+        tempo_stretch_factors=None, # defaults to 0.8 to 1.2 in steps of 0.05
+        batch_frontend=False, # run the frontend (and spec augmentations) on the collated batch after transfer, workers only ship waveforms
+        feature_store=None, # directory of frontend features of every crop, computed once by prepare_data and read by the datasets of clean crops
+        governor=None # kwargs of an AugmentationGovernor (substitutes as {"<stage>.<transform name>": {aug: kwargs}}), turns profile on
     ):
         super().__init__()
         self.task = task
         self.audio_dir = audio_dir
+        self.sources = sources
         assert (
-            self.audio_dir is not None or self.task is not None
-        ), "task and audio_dir cannot be None at the same time"
+            self.audio_dir is not None or self.task is not None or self.sources is not None
+        ), "task, audio_dir and sources cannot be None at the same time"
 
-        self.splitter = DataModuleSplitter(audio_dir, task, val_split)
+        if self.sources is not None:
+            self.splitter = MixtureSplitter(sources, val_split)
+        else:
+            self.splitter = DataModuleSplitter(audio_dir, task, val_split)
 
         self.target_len_s = target_len_s
         self.target_sr = target_sr
@@ -67,54 +175,14 @@ class AudioDataModule(pl.LightningDataModule):
             'p', augmentations.get('p', 0.75))
         self.var_augs = augmentations.get('var', {}).get('augs', [])
         self.var_p = augmentations.get('var', {}).get('p', 0)
+        self.spec_augs = augmentations.get('spec', {}).get('augs', {})
+        self.spec_p = augmentations.get('spec', {}).get('p', 0)
         self.tempo_stretching = tempo_stretching
+        self.tempo_stretch_cache = tempo_stretch_cache
+        self.tempo_stretch_factors = tempo_stretch_factors if tempo_stretch_factors is not None else [0.8, 0.85, 0.9, 0.95, 1.0, 1.05, 1.1, 1.15, 1.2]
 
-        defaults = {
-            "gain": {"min_gain_in_db": -15.0, "max_gain_in_db": 5.0, "p": 0.5, "sample_rate": self.target_sr},
-            "polarity_inversion": {"p": 0.5, "sample_rate": self.target_sr},
-            "add_colored_noise": {"p": 0.5, "sample_rate": self.target_sr, "min_snr_in_db": 3, "max_snr_in_db": 30, "min_f_decay": -2, "max_f_decay": 2},
-            "filtering": {
-                "bandpass": {"p": 0.5, "sample_rate": self.target_sr, "min_center_frequency": 200, "max_center_frequency": 4000, "min_bandwidth_fraction": 0.5, "max_bandwidth_fraction": 1.99},
-                "bandstop": {"p": 0.5, "sample_rate": self.target_sr, "min_center_frequency": 200, "max_center_frequency": 4000, "min_bandwidth_fraction": 0.5, "max_bandwidth_fraction": 1.99},
-                "highpass": {"p": 0.5, "sample_rate": self.target_sr, "min_cutoff_freq": 200, "max_cutoff_freq": min(0.5 * self.target_sr, 2400)},
-                "lowpass": {"p": 0.5, "sample_rate": self.target_sr, "min_cutoff_freq": 75, "max_cutoff_freq": 7500}
-            },
-            "discrete_pitch_shift": {"p": 0.5, "sample_rate": self.target_sr, "min_transpose_semitones": -4, "max_transpose_semitones": 4},
-            'pitch_shift': {"p": 0.5, "sample_rate": self.target_sr, "min_semitones": -4, "max_semitones": 4},
-            "delay": {"p": 0.5, "sample_rate": self.target_sr, "min_delay_ms": 100, "max_delay_ms": 500, "volume_factor": 0.5, "repeats": 2, "attenuation": 0.5},
-            "timestretch": {"p": 0.5, "sample_rate": self.target_sr, "min_stretch_rate": 0.7, "max_stretch_rate": 1.3},
-            "discrete_timestretch": {"p": 0.5, "sample_rate": self.target_sr, "min_stretch_rate": 0.7, "max_stretch_rate": 1.3},
-            "beta_timestretch": {"p": 0.5, "sample_rate": self.target_sr, "min_stretch_rate": 0.7, "max_stretch_rate": 1.3},
-            "log_uniform_timestretch": {"p": 0.5, "sample_rate": self.target_sr, "min_stretch_rate": 0.7, "max_stretch_rate": 1.3},
-            "reverb": {"p": 0.5, "sample_rate": self.target_sr, "room_size": 0.2, "wet_level": 0.5, "dry_level": 0.5},
-            "chorus": {"p": 0.5, "sample_rate": self.target_sr, "mix": 1, "rate_hz": 5, "depth": 1},
-            "distortion": {"p": 0.5, "sample_rate": self.target_sr, "drive_db": 9},
-            "compression": {"p": 0.5, "sample_rate": self.target_sr, "threshold_db": -30, "ratio": 5},
-            "reverse": {"p": 0.5, "sample_rate": self.target_sr},
-            "bitcrush": {"p": 0.5, "sample_rate": self.target_sr, "bit_depth": 4},
-            "mp3": {"p": 0.5, "sample_rate": self.target_sr, "vbr_quality": 9},
-            "background": {"p": 0.5, "sample_rate": self.target_sr, "min_snr_in_db": -3, "max_snr_in_db": 12, "background_paths": '/import/c4dm-datasets-ext/audioset-01/audioset/balanced_train_segments'}
-        }
-
-        self.augs = {
-            'gain': lambda kwargs: Gain(**kwargs),
-            'polarity_inversion': lambda p: PolarityInversion(p=0.5, sample_rate=self.target_sr),
-            'add_colored_noise': lambda kwargs: AddColoredNoise(**kwargs),
-            'filtering': lambda kwargs: OneOf([
-                BandPassFilter(**kwargs['bandpass']),
-                BandStopFilter(**kwargs['bandstop']),
-                HighPassFilter(**kwargs['highpass']),
-                LowPassFilter(**kwargs['lowpass']),
-            ]),
-            'pitch_shift': lambda kwargs: PitchShiftAudiomentation(**kwargs),
-            'timestretch': lambda kwargs: TimeStretch(**kwargs),
-            'discrete_timestretch': lambda kwargs: DiscreteTimeStretch(**kwargs),
-            'beta_timestretch': lambda kwargs: BetaTimeStretch(**kwargs),
-            'log_uniform_timestretch': lambda kwargs: LogUniformTimeStretch(**kwargs),
-            'reverb': lambda kwargs: ReverbAudiomentation(**kwargs),
-            'distortion': lambda kwargs: DistortionAudiomentation(**kwargs),
-            
-        }
+        defaults = get_augmentation_defaults(self.target_sr)
+        self.augs = augmentation_registry
 
         base_transforms = [self.augs[aug](
             {**defaults[aug], **self.base_augs[aug]}) for aug in self.base_augs]
@@ -138,6 +206,42 @@ class AudioDataModule(pl.LightningDataModule):
 
         self.frontend = frontend
 
+        if self.spec_augs:
+            # applied to the frontend output, labelled in augs like the var chain
+            if frontend is None:
+                raise ValueError("spec augmentations need a frontend")
+            spec_defaults = get_spectrogram_augmentation_defaults()
+            self.aug_chain["spec"] = SpectrogramCompose(
+                transforms=[spectrogram_augmentation_registry[aug]({**spec_defaults[aug], **self.spec_augs[aug]}) for aug in self.spec_augs],
+                p=self.spec_p,
+            )
+
+        if batch_augment not in [None, "before_transfer", "after_transfer"]:
+            raise ValueError(f"Invalid batch_augment: {batch_augment}. Supported values are: None, before_transfer, after_transfer")
+        self.batch_augment = batch_augment
+        self.batch_frontend = batch_frontend
+        self.feature_store = feature_store
+        if feature_store is not None:
+            if frontend is None:
+                raise ValueError("feature_store needs a frontend")
+            if sources is not None or batch_augment is not None or batch_frontend:
+                raise ValueError("feature_store is not supported with sources, batch_augment or batch_frontend")
+        self.augmentation_bank = AugmentationBank(**augmentation_bank) if augmentation_bank is not None else None
+        self.governor = None
+        if governor is not None:
+            # the governor weighs transforms by their timings
+            profile = True
+            substitutes = {
+                key: self.augs[aug]({**defaults[aug], **kwargs})
+                for key, spec in governor.get("substitutes", {}).items() for aug, kwargs in spec.items()
+            }
+            self.governor = AugmentationGovernor(**{**governor, "substitutes": substitutes})
+
+        self.profile = profile
+        if profile:
+            for chain in self.aug_chain.values():
+                chain.profile = True
+
         self.batch_size = batch_size
         self.num_workers = num_workers
         self.transform = transform
@@ -145,57 +249,131 @@ class AudioDataModule(pl.LightningDataModule):
         self.n_augmentations = n_augmentations
         self.strategy_probs = strategy_probs
         self.keep_anchor = keep_anchor
+        self.sampler = sampler
+        self.sampler_kwargs = sampler_kwargs if sampler_kwargs is not None else {}
+        self.train_sampler = None
+        self.val_render_path = val_render_path
+        self.val_render_frontend = val_render_frontend
 
-        self.annotations = self.splitter.annotations
-
-        self.train_annotations = self.annotations[self.annotations["split"] == "train"]
-        self.val_annotations = self.annotations[self.annotations["split"] == "val"]
-        self.test_annotations = self.annotations[self.annotations["split"] == "test"]
-        
         self.test_batch_size = 1
 
-        print("Train annotations:", len(self.train_annotations))
-        print("Val annotations:", len(self.val_annotations))
-        print("Test annotations:", len(self.test_annotations))
+        if self.sources is not None:
+            # no giant DataFrame for mixtures, the splitter only keeps per-source path arrays
+            if self.return_labels or self.tempo_stretching:
+                raise ValueError("sources have no annotations: a task (labels, test split) and tempo_stretching are not supported with them")
+            if self.sampler == "duration":
+                raise ValueError("sampler 'duration' reads file durations from the annotations, which sources do not have")
+            if self.sampler is None or self.sampler == "random":
+                self.sampler = "mixture"
+            self.annotations = None
+            for split in ["train", "val", "test"]:
+                print(f"{split.capitalize()} files per source:", dict(zip(self.splitter.names, map(len, self.splitter.paths[split]))))
+        else:
+            self.annotations = self.splitter.annotations
+
+            self.train_annotations = self.annotations[self.annotations["split"] == "train"]
+            self.val_annotations = self.annotations[self.annotations["split"] == "val"]
+            self.test_annotations = self.annotations[self.annotations["split"] == "test"]
+
+            print("Train annotations:", len(self.train_annotations))
+            print("Val annotations:", len(self.val_annotations))
+            print("Test annotations:", len(self.test_annotations))
 
     def set_test_batch_size(self, test_batch_size):
         self.test_batch_size = test_batch_size
 
+    def get_audio_dataset(self, split, **kwargs):
+        kwargs.setdefault("augmentation_bank", self.augmentation_bank)
+        kwargs.setdefault("profile", self.profile)
+        if self.sources is not None:
+            return MixtureAudioDataset(paths=self.splitter.paths[split], source_names=self.splitter.names, **kwargs)
+        return AudioDataset(annotations=getattr(self, f"{split}_annotations"), **kwargs)
+
+    def has_augmentations(self):
+        return any(len(chain.transforms) > 0 and chain.p > 0 for chain in self.aug_chain.values())
+
+    def get_feature_store(self, transform=False, train=False):
+        # features in place of audio and frontend, for the datasets whose crops stay clean
+        if self.feature_store is None or (transform and self.has_augmentations()) or (train and self.tempo_stretching):
+            return None
+        return FeatureStore(self.feature_store, self.frontend, self.target_n_samples, self.annotations["file_path"].tolist())
+
+    def get_val_audio_dataset(self, frontend=None, batch_augment=False, feature_store=None):
+        return self.get_audio_dataset(
+            "val",
+            target_len_s=self.target_len_s,
+            target_sr=self.target_sr,
+            target_n_samples=self.target_n_samples,
+            max_target_n_samples=self.max_target_n_samples,
+            augmentations=self.aug_chain if feature_store is None else None,
+            transform=True,
+            train=True,
+            return_labels=self.return_labels,
+            n_augmentations=self.n_augmentations,
+            strategy_probs=self.strategy_probs,
+            frontend=frontend if feature_store is None else None,
+            keep_anchor=self.keep_anchor,
+            tempo_stretching=self.tempo_stretching,
+            batch_augment=batch_augment,
+            feature_store=feature_store
+        )
+
+    def get_val_render_path(self):
+        # directory of the rendered validation set of the current configuration, None if it is not rendered yet
+        dataset = self.get_val_audio_dataset(frontend=self.frontend if self.val_render_frontend else None)
+        render_path = get_render_path(self.val_render_path, dataset)
+        return render_path if os.path.exists(os.path.join(render_path, "index.pkl")) else None
+
+    def prepare_data(self):
+        # one-time render of a fixed validation set, on a single process
+        if self.val_render_path is not None and self.get_val_render_path() is None:
+            frontend = self.frontend if self.val_render_frontend else None
+            render_dataset(self.get_val_audio_dataset(frontend=frontend), self.val_render_path)
+        # one-time render of the tempo stretches of the train split
+        if self.tempo_stretching and self.tempo_stretch_cache is not None and not os.path.exists(os.path.join(
+            get_cache_path(self.tempo_stretch_cache, self.train_annotations, self.target_sr, self.tempo_stretch_factors), "index.pkl"
+        )):
+            render_tempo_stretch_cache(self.train_annotations, self.tempo_stretch_cache, self.target_sr, self.tempo_stretch_factors)
+        # one-time computation of the frontend features, per frontend configuration and set of files
+        if self.feature_store is not None:
+            file_paths = self.annotations["file_path"].tolist()
+            if not is_rendered(get_store_path(self.feature_store, self.frontend, self.target_n_samples, file_paths)):
+                render_feature_store(file_paths, self.feature_store, self.frontend, self.target_sr, self.target_n_samples)
+
     def setup(self, stage=None, extracted=False):
         if not extracted:
-            self.train_dataset = AudioDataset(
-                annotations=self.train_annotations,
+            train_feature_store = self.get_feature_store(self.transform, train=True)
+            self.train_dataset = self.get_audio_dataset(
+                "train",
                 target_len_s=self.target_len_s,
                 target_sr=self.target_sr,
                 target_n_samples=self.target_n_samples,
                 max_target_n_samples=self.max_target_n_samples,
-                augmentations=self.aug_chain,
+                augmentations=self.aug_chain if train_feature_store is None else None,
                 transform=self.transform,
                 train=True,
                 return_labels=self.return_labels,
                 n_augmentations=self.n_augmentations,
                 strategy_probs=self.strategy_probs,
-                frontend=self.frontend,
+                frontend=None if self.batch_frontend or train_feature_store is not None else self.frontend,
                 keep_anchor=self.keep_anchor,
-                tempo_stretching=self.tempo_stretching
-            )
-            self.val_dataset = AudioDataset(
-                annotations=self.val_annotations,
-                target_len_s=self.target_len_s,
-                target_sr=self.target_sr,
-                target_n_samples=self.target_n_samples,
-                max_target_n_samples=self.max_target_n_samples,
-                augmentations=self.aug_chain,
-                transform=True,
-                train=True,
-                return_labels=self.return_labels,
-                n_augmentations=self.n_augmentations,
-                strategy_probs=self.strategy_probs,
-                frontend=self.frontend,
-                keep_anchor=self.keep_anchor,
-                tempo_stretching=self.tempo_stretching
+                tempo_stretching=self.tempo_stretching,
+                batch_augment=self.batch_augment is not None,
+                tempo_stretch_cache=TempoStretchCache(
+                    self.tempo_stretch_cache, self.train_annotations, self.target_sr, self.tempo_stretch_factors
+                ) if self.tempo_stretching and self.tempo_stretch_cache is not None else None,
+                feature_store=train_feature_store
             )
+            val_render_path = self.get_val_render_path() if self.val_render_path is not None else None
+            if val_render_path is not None:
+                self.val_dataset = PrerenderedDataset(val_render_path, frontend=self.frontend)
+            else:
+                self.val_dataset = self.get_val_audio_dataset(
+                    frontend=None if self.batch_frontend else self.frontend, batch_augment=self.batch_augment is not None,
+                    feature_store=self.get_feature_store(transform=True)
+                )
             if self.return_labels:
+                test_feature_store = self.get_feature_store()
                 self.test_dataset = AudioDataset(
                     annotations=self.test_annotations,
                     target_len_s=self.target_len_s,
@@ -209,18 +387,173 @@ class AudioDataModule(pl.LightningDataModule):
                     return_full=True,
                     n_augmentations=1,
                     strategy_probs=self.strategy_probs,
-                    frontend=self.frontend,
+                    frontend=self.frontend if test_feature_store is None else None,
                     keep_anchor=self.keep_anchor,
-                    tempo_stretching=self.tempo_stretching
+                    tempo_stretching=self.tempo_stretching,
+                    feature_store=test_feature_store
                 )
 
+    def apply_chain(self, chain, audio, n_augmentations):
+        # the chain-level p is drawn per item, as when the chain runs inside the dataset
+        n_items = audio.shape[0] // n_augmentations
+        selected = (torch.rand(n_items) < chain.p).repeat_interleave(n_augmentations).to(audio.device)
+        augs = {name: torch.zeros(audio.shape[0], dtype=torch.int, device=audio.device) for name in chain.transform_names}
+        if chain.profile:
+            chain.reset_timings()
+        if not selected.any():
+            return audio, augs
+
+        p, chain.p = chain.p, 1
+        try:
+            transformed, tfm_augs = chain(audio[selected])
+        finally:
+            chain.p = p
+        audio[selected] = transformed
+        for name, changed in tfm_augs.items():
+            # per_batch transforms report a single decision for the whole batch
+            augs[name][selected] = changed.to(audio.device).int().expand(transformed.shape[0])
+        return audio, augs
+
+    def augment_batch(self, batch, transform=True):
+        """
+        Applies the base and var chains and the frontend to a collated batch of [B, N, 1, T] crops
+        and fills in the [B, N] augs labels that the contrastive matrices are built from.
+        """
+        audio = batch["audio"]
+        B, N = audio.shape[:2]
+        audio = audio.reshape(B * N, *audio.shape[2:])
+        if self.profile:
+            # merged with the per-item loading timings, once per batch (and without device synchronisation)
+            timings = batch.setdefault("timings", {"time_s": {}, "calls": {}})
+            start = time.perf_counter()
+
+        if transform:
+            if self.keep_anchor and N > 1:
+                anchors = audio[::N].clone()
+            audio, _ = self.apply_chain(self.aug_chain["base"], audio, N)
+            if self.profile:
+                start = log_stage(timings, "base", start, self.aug_chain["base"])
+            audio, augs = self.apply_chain(self.aug_chain["var"], audio, N)
+            if self.profile:
+                start = log_stage(timings, "var", start, self.aug_chain["var"])
+            if self.keep_anchor and N > 1:
+                audio[::N] = anchors
+            # labels set by the dataset (e.g. pre-rendered bank variants) are kept, after the chain labels as in
+            # AudioDataset: the contrastive heads follow the order of the augs keys
+            dataset_augs = {name: changed for name, changed in batch["augs"].items() if name != "none"}
+            batch["augs"] = {**{name: changed.view(B, N) for name, changed in augs.items()}, **dataset_augs}
+
+        clean_audio = batch.get("clean_audio")
+        if self.max_target_n_samples:
+            audio = audio[..., :self.max_target_n_samples]
+            if clean_audio is not None:
+                clean_audio = clean_audio[..., :self.max_target_n_samples]
+
+        batch["audio"] = audio.view(B, N, *audio.shape[1:])
+        if clean_audio is not None:
+            batch["clean_audio"] = clean_audio
+        return self.frontend_batch(batch, transform=transform)
+
+    def frontend_batch(self, batch, transform=True):
+        """
+        Applies the frontend, and then the spec chain if ``transform``, to the [B, N, 1, T] audio
+        (and clean_audio) of a collated batch, in one call each on the batch's device.
+        """
+        audio = batch["audio"]
+        B, N = audio.shape[:2]
+        audio = audio.reshape(B * N, *audio.shape[2:])
+        clean_audio = batch.get("clean_audio")
+        if self.profile:
+            timings = batch.setdefault("timings", {"time_s": {}, "calls": {}})
+            start = time.perf_counter()
+
+        if self.frontend:
+            self.frontend.to(audio.device)
+            audio = self.frontend(audio)
+            if clean_audio is not None:
+                clean_audio = self.frontend(clean_audio.reshape(B * N, *clean_audio.shape[2:]))
+                clean_audio = clean_audio.view(B, N, *clean_audio.shape[1:])
+            if self.profile:
+                start = log_stage(timings, "frontend", start)
+
+        if transform and "spec" in self.aug_chain:
+            if self.keep_anchor and N > 1:
+                anchors = audio[::N].clone()
+            audio, spec_augs = self.apply_chain(self.aug_chain["spec"], audio, N)
+            if self.profile:
+                start = log_stage(timings, "spec", start, self.aug_chain["spec"])
+            if self.keep_anchor and N > 1:
+                audio[::N] = anchors
+            batch["augs"] = {name: changed for name, changed in batch["augs"].items() if name != "none"}
+            batch["augs"].update({name: changed.view(B, N) for name, changed in spec_augs.items()})
+
+        batch["audio"] = audio.view(B, N, *audio.shape[1:])
+        if clean_audio is not None:
+            batch["clean_audio"] = clean_audio
+        return batch
+
+    def needs_batch_augmentation(self):
+        # test batches and prerendered validation sets are already final
+        if (self.batch_augment is None and not self.batch_frontend) or self.trainer is None:
+            return False
+        if self.trainer.training:
+            return True
+        if self.trainer.validating or self.trainer.sanity_checking:
+            return not isinstance(self.val_dataset, PrerenderedDataset)
+        return False
+
+    def on_before_batch_transfer(self, batch, dataloader_idx):
+        if self.batch_augment == "before_transfer" and self.needs_batch_augmentation():
+            batch = self.augment_batch(batch, transform=self.transform or not self.trainer.training)
+        return batch
+
+    def on_after_batch_transfer(self, batch, dataloader_idx):
+        if self.batch_augment == "after_transfer" and self.needs_batch_augmentation():
+            batch = self.augment_batch(batch, transform=self.transform or not self.trainer.training)
+        elif self.batch_augment is None and self.batch_frontend and self.needs_batch_augmentation():
+            # the waveform chains ran in the workers, the spec chain follows them on the views they augmented
+            batch = self.frontend_batch(batch, transform="none" not in batch["augs"])
+        return batch
+
+    def get_train_sampler(self):
+        # built once so that sampler state (e.g. coverage) persists across dataloader reloads
+        if self.sampler is None:
+            return None
+        if self.train_sampler is None:
+            kwargs = dict(self.sampler_kwargs)
+            if self.sampler == "mixture":
+                kwargs.setdefault("weights", self.splitter.weights)
+            if self.sampler == "duration":
+                kwargs.setdefault("durations", get_durations(self.train_annotations))
+                kwargs.setdefault("crop_len_s", self.target_n_samples / self.target_sr)
+            self.train_sampler = samplers[self.sampler](self.train_dataset, **kwargs)
+        return self.train_sampler
+
+    def get_consumed_samples(self):
+        # samples of the current epoch this rank has consumed according to the trainer's progress, the sampler
+        # bounds it by what it actually yielded (a partial last batch)
+        if self.trainer is None:
+            return None
+        return self.trainer.fit_loop.epoch_loop.batch_progress.current.processed * self.batch_size
+
     def train_dataloader(self):
-        return torch.utils.data.DataLoader(
+        sampler = self.get_train_sampler()
+        if sampler is None:
+            return torch.utils.data.DataLoader(
+                self.train_dataset,
+                batch_size=self.batch_size,
+                num_workers=self.num_workers,
+                shuffle=True,
+                pin_memory=True,
+            )
+        # the sampler position is saved in checkpoints so a resumed run continues mid-epoch
+        return ResumableDataLoader(
             self.train_dataset,
             batch_size=self.batch_size,
             num_workers=self.num_workers,
-            shuffle=True,
+            sampler=sampler,
             pin_memory=True,
+            get_position=self.get_consumed_samples,
         )
 
     def val_dataloader(self):
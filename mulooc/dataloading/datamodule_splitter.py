@@ -1073,3 +1073,30 @@ class DataModuleSplitter:
         )
 
         return df, raw_df
+
+
+class MixtureSplitter:
+    """
+    Builds a DataModuleSplitter per source of a pretraining mixture and only keeps, per split,
+    one compact array of encoded file paths per source. Sources are dicts with a ``task`` or an
+    ``audio_dir``, and optionally a ``weight`` (default 1), a ``name`` and a ``val_split``.
+    """
+
+    def __init__(self, sources, val_split=0.1):
+        self.names = []
+        self.weights = []
+        self.paths = {"train": [], "val": [], "test": []}
+
+        for source in sources:
+            splitter = DataModuleSplitter(
+                source.get("audio_dir"), source.get("task"), source.get("val_split", val_split)
+            )
+            annotations = splitter.annotations
+            for split in self.paths:
+                paths = annotations.loc[annotations["split"] == split, "file_path"]
+                self.paths[split].append(np.array([path.encode() for path in paths], dtype=np.bytes_))
+
+            self.names.append(source.get("name", source.get("task") or source.get("audio_dir")))
+            self.weights.append(source.get("weight", 1.0))
+            # drop the per-source DataFrame as soon as its paths are extracted
+            del splitter, annotations
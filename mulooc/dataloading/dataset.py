@@ -1,22 +1,40 @@
 from torch.utils.data import Dataset
 import torch
-from mulooc.dataloading.loading_utils import load_audio_chunk, load_full_and_split
+from mulooc.dataloading.loading_utils import get_sample_rate, load_audio_chunk, load_full_and_split
+from mulooc.dataloading.feature_store import get_frontend_config
 from pedalboard import time_stretch
+from tqdm import tqdm
 import numpy as np
+import hashlib
+import json
+import os
 import pickle
+import random
+import time
 
-def load_same(path, target_n_samples, target_sr, n_augmentations):
-    audio = load_audio_chunk(path, target_n_samples, target_sr)
+def load_same(path, target_n_samples, target_sr, n_augmentations, start_s = None):
+    audio = load_audio_chunk(path, target_n_samples, target_sr, start_s = start_s)
     return torch.stack([audio] * n_augmentations)
 
-def load_adjacent(path, target_n_samples, target_sr, n_augmentations):
-    audio = load_audio_chunk(path, target_n_samples * n_augmentations, target_sr)
+def load_adjacent(path, target_n_samples, target_sr, n_augmentations, start_s = None):
+    audio = load_audio_chunk(path, target_n_samples * n_augmentations, target_sr, start_s = start_s)
     audio = audio.unfold(-1, target_n_samples, target_n_samples)
     return audio.permute(1, 0, 2)
 
-def load_random(path, target_n_samples, target_sr, n_augmentations):
+def load_random(path, target_n_samples, target_sr, n_augmentations, start_s = None):
+    # views are drawn independently, a sampler-provided start is ignored
     return torch.stack([load_audio_chunk(path, target_n_samples, target_sr) for _ in range(n_augmentations)])
 
+def log_stage(timings, stage, start, chain = None):
+    # wall-clock of a loading stage and of each transform of its chain (a profiled CustomCompose), returns the next start
+    timings["time_s"][stage] = time.perf_counter() - start
+    timings["calls"][stage] = 1
+    if chain is not None:
+        for key in ["time_s", "calls"]:
+            for name, value in chain.timings[key].items():
+                timings[key][f"{stage}.{name}"] = value
+    return time.perf_counter()
+
 
 class AudioDataset(Dataset):
     def __init__(
@@ -38,7 +56,12 @@ class AudioDataset(Dataset):
         tempo_stretching = False,
         return_tfm_parameters = False,
         return_clean_audio = False,
-        extract_features = False
+        extract_features = False,
+        batch_augment = False, # leave augmentations and frontend to the datamodule, applied on the collated batch
+        augmentation_bank = None, # AugmentationBank serving pre-rendered crops and variants of an expensive transform
+        profile = False, # return per-stage and per-transform wall-clock and call counts with each item
+        tempo_stretch_cache = None, # TempoStretchCache replacing the online time_stretching_module of tempo datasets
+        feature_store = None # FeatureStore of frontend features read in place of the audio, for datasets of clean crops
     ):
         self.annotations = annotations
         self.target_len_s = target_len_s
@@ -59,6 +82,12 @@ class AudioDataset(Dataset):
         self.return_clean_audio = return_clean_audio
         self.extract_features = extract_features
         self.max_target_n_samples = max_target_n_samples
+        self.batch_augment = batch_augment
+        self.augmentation_bank = augmentation_bank
+        self.profile = profile
+        if profile and augmentations is not None:
+            for chain in (augmentations.values() if isinstance(augmentations, dict) else [augmentations]):
+                chain.profile = True
         
         self.strategy = {
             "same": strategy_probs[0],
@@ -75,89 +104,181 @@ class AudioDataset(Dataset):
         }
         
         self.tempo_stretching = tempo_stretching
+        self.tempo_stretch_cache = tempo_stretch_cache
+        self.feature_store = feature_store
+        self.check_feature_store()
         self.mode = "per_example"
         
         self.strategy_values = torch.tensor(list(self.strategy.values())).float()
 
+    def check_feature_store(self):
+        # also on each item, as scripts like extraction.py set transform and augmentations after construction
+        if self.feature_store is not None and (
+            (self.transform and self.augmentations is not None) or (self.tempo_stretching and self.train) or self.frontend is not None
+        ):
+            raise ValueError("A feature store serves clean frontend output, it replaces the frontend and cannot be augmented or tempo-stretched")
+
     def __len__(self):
         return len(self.annotations)
+
+    def get_path(self, idx):
+        return self.annotations.iloc[idx]["file_path"]
+    
+    def sample_strategy(self):
+        strategy = torch.multinomial(self.strategy_values, 1).item()
+        return list(self.strategy.keys())[strategy]
     
     def set_aug_mode(self, mode = 'per_batch'):
         # modes per batch or per example
         for tfm in self.augmentations['var'].transforms:
+            if mode not in tfm.supported_modes:
+                print(f"{tfm.__class__.__name__} does not support {mode}, kept in {tfm.mode}")
+                continue
+            # the decision to apply follows the mode, so that per_batch transforms apply to every view or none
+            tfm.mode = mode
+            tfm.p_mode = mode
             tfm._mode = mode
             print(tfm._mode)
 
         self.mode = mode
 
     def __getitem__(self, idx):
-        path = self.annotations.iloc[idx]["file_path"]
+        # samplers can yield (index, start in seconds) to choose the crop position
+        start_s = None
+        if isinstance(idx, tuple):
+            idx, start_s = idx
+        
+        path = self.get_path(idx)
 
         if self.return_labels:
             labels = torch.tensor(self.annotations.iloc[idx]["labels"]).float()
+        bank_parameters = None
+        if self.profile:
+            # the stages that run are fixed for a dataset, so items always have the same keys and collate
+            timings = {"time_s": {}, "calls": {}}
+            start = time.perf_counter()
+        augment = self.transform and self.train and self.augmentations is not None and not self.batch_augment
+        # a frontend with native_sr converts the audio at the file's sample rate, when nothing between loading and
+        # the frontend expects target_sr
+        native_sr = (
+            self.frontend is not None and getattr(self.frontend, "native_sr", False) and not self.batch_augment and not augment
+            and self.feature_store is None and self.augmentation_bank is None and not (self.return_labels and self.tempo_stretching and self.train)
+        )
+        sample_rate = self.target_sr
+        target_n_samples = self.target_n_samples
+        self.check_feature_store()
         try:
-            if self.return_full:
-                audio = load_full_and_split(path, self.target_sr, self.target_n_samples)
-                audio = audio.mean(dim=1, keepdim=True)
-                if self.frontend and not self.extract_features:
-                    audio = audio.unsqueeze(1)
+            if native_sr:
+                sample_rate = get_sample_rate(path)
+                target_n_samples = round(self.target_n_samples * sample_rate / self.target_sr)
+            
+            if self.feature_store is not None:
+                # frontend output of clean crops, nothing to decode
+                audio = self.feature_store.load(path, None if self.return_full else self.n_augmentations, self.sample_strategy())
+                
+            elif self.augmentation_bank is not None:
+                # crops and their expensive-transform variants are pre-rendered, only the variant is drawn here
+                n_views = None if self.return_full else self.n_augmentations
+                audio, bank_parameters = self.augmentation_bank.load(path, n_views, apply = self.transform and self.train)
+                
+            elif self.return_full:
+                audio = load_full_and_split(path, sample_rate, target_n_samples)
+                
+            elif self.tempo_stretch_cache is not None and self.return_labels and self.tempo_stretching and self.train:
+                # crops of a pre-rendered stretch of the file, the labels follow the stretched tempo
+                audio, labels = self.tempo_stretch_cache.load(path, labels, self.n_augmentations, self.target_n_samples, self.sample_strategy())
                 
             else:
                 
-                strategy = torch.multinomial(self.strategy_values, 1).item()
-                strategy = list(self.strategy.keys())[strategy]
-                audio = self.strategy_funcs[strategy](path, self.target_n_samples, self.target_sr, self.n_augmentations)
-                audio = audio.mean(dim=1, keepdim=True)
+                strategy = self.sample_strategy()
+                audio = self.strategy_funcs[strategy](path, target_n_samples, sample_rate, self.n_augmentations, start_s = start_s)
+                
+            audio = audio.mean(dim=1, keepdim=True)
+            if self.return_full and (self.frontend or self.feature_store is not None) and not self.extract_features:
+                audio = audio.unsqueeze(1)
         except Exception as e:
             print("Error loading file:", e)
             return self[idx + 1]
         
         clean_audio = audio.clone()
+        if self.profile:
+            start = log_stage(timings, "load", start)
         
-        if self.transform and self.train and self.augmentations is not None:
+        if augment:
             if self.keep_anchor and self.n_augmentations > 1:
                 anchor = audio[0:1,...]
             if isinstance(self.augmentations, dict):
                 audio,_ = self.augmentations['base'](audio)
+                if self.profile:
+                    start = log_stage(timings, "base", start, self.augmentations['base'])
                 audio, augs = self.augmentations['var'](audio)
+                if self.profile:
+                    start = log_stage(timings, "var", start, self.augmentations['var'])
             else:
                 audio, augs = self.augmentations(audio)
+                if self.profile:
+                    start = log_stage(timings, "augmentations", start, self.augmentations)
             if self.keep_anchor and self.n_augmentations > 1:
                 audio[0:1,...] = anchor
 
-        augs = augs if self.transform and self.train and self.augmentations is not None else {
+        augs = augs if augment else {
             "none": torch.tensor([0]*self.n_augmentations)
         }
         
-        if self.return_labels and self.tempo_stretching and self.train: #only for tempo datasets augmentation
+        if bank_parameters is not None and self.transform and self.train:
+            # the contrastive heads follow the order of the augs keys, "none" would take the bank's head
+            augs = {name: changed for name, changed in augs.items() if name != "none"}
+            augs[self.augmentation_bank.name] = bank_parameters["should_apply"].int()
+        
+        if self.return_labels and self.tempo_stretching and self.train and self.tempo_stretch_cache is None: #only for tempo datasets augmentation
             audio, labels = time_stretching_module(audio, self.target_sr, self.target_n_samples, labels)
             if audio is None:
                 return self[idx + 1]
             
-        if self.max_target_n_samples:
-            audio = audio[:,:,:self.max_target_n_samples]
+        if self.max_target_n_samples and not self.batch_augment:
+            max_target_n_samples = round(self.max_target_n_samples * sample_rate / self.target_sr)
+            audio = audio[:,:,:max_target_n_samples]
             if self.return_clean_audio:
-                clean_audio = clean_audio[:,:,:self.max_target_n_samples]
+                clean_audio = clean_audio[:,:,:max_target_n_samples]
             
         
-        if self.frontend:
-            audio = self.frontend(audio)
-            if self.return_clean_audio:
-                clean_audio = self.frontend(clean_audio)
+        if self.frontend and not self.batch_augment:
+            if native_sr:
+                audio = self.frontend(audio, sample_rate = sample_rate)
+                if self.return_clean_audio:
+                    clean_audio = self.frontend(clean_audio, sample_rate = sample_rate)
+            else:
+                audio = self.frontend(audio)
+                if self.return_clean_audio:
+                    clean_audio = self.frontend(clean_audio)
             if audio.dim() == 3:
                 audio = audio.unsqueeze(0)
                 if self.return_clean_audio:
                     clean_audio = clean_audio.unsqueeze(0)
+            if self.profile:
+                start = log_stage(timings, "frontend", start)
+            
+            if augment and isinstance(self.augmentations, dict) and "spec" in self.augmentations:
+                # spectrogram transforms, labelled in augs like the var chain
+                if self.keep_anchor and self.n_augmentations > 1:
+                    anchor = audio[0:1,...].clone()
+                audio, spec_augs = self.augmentations['spec'](audio)
+                augs.update(spec_augs)
+                if self.profile:
+                    start = log_stage(timings, "spec", start, self.augmentations['spec'])
+                if self.keep_anchor and self.n_augmentations > 1:
+                    audio[0:1,...] = anchor
             
     
                 
-        if self.augmentations and self.return_tfm_parameters:
-            transform_parameters = {tfm.__class__.__name__  : tfm.transform_parameters for tfm in self.augmentations['var'].transforms}
-            # recursively go through the dict and turn lists into tensors
-            for key in transform_parameters:
-                for key2 in transform_parameters[key]:
-                    if isinstance(transform_parameters[key][key2], list):
-                        transform_parameters[key][key2] = torch.tensor(transform_parameters[key][key2])
+        if self.return_tfm_parameters:
+            # flat {"<transform>.<parameter>": tensor} records, collated with one stack per key
+            transform_parameters = dict(self.augmentations['var'].records) if augment else {}
+            if augment and "spec" in self.augmentations and self.frontend:
+                transform_parameters.update(self.augmentations['spec'].records)
+            if bank_parameters is not None:
+                for key, value in bank_parameters.items():
+                    transform_parameters[f"{self.augmentation_bank.name}.{key}"] = value
         
         #truncate audio to max_target_n_samples
         
@@ -174,9 +295,39 @@ class AudioDataset(Dataset):
             
         if self.return_clean_audio:
             output_["clean_audio"] = clean_audio
+            
+        if self.profile:
+            output_["timings"] = timings
         
         return output_
 
+class MixtureAudioDataset(AudioDataset):
+    """
+    AudioDataset over several corpora at once. File paths are kept as one compact array of
+    encoded paths per source instead of a DataFrame, and a global index maps arithmetically
+    to (source, file) through the cumulative source lengths.
+    """
+
+    def __init__(self, paths, source_names = None, **kwargs):
+        kwargs["return_labels"] = False
+        super().__init__(annotations = None, **kwargs)
+        self.paths = paths
+        self.source_names = source_names if source_names is not None else list(range(len(paths)))
+        self.source_lengths = np.array([len(p) for p in paths], dtype=np.int64)
+        self.source_offsets = np.concatenate([[0], np.cumsum(self.source_lengths)])
+
+    def __len__(self):
+        return int(self.source_offsets[-1])
+
+    def get_source(self, idx):
+        source = np.searchsorted(self.source_offsets, idx, side="right") - 1
+        return source, idx - self.source_offsets[source]
+
+    def get_path(self, idx):
+        source, file_idx = self.get_source(idx)
+        return self.paths[source][file_idx].decode()
+
+
 def time_stretching_module(input_audio, samplerate, factor, labels):
     
     factor = np.random.uniform(0.8, 1.2)
@@ -248,4 +399,155 @@ class PrecomputedDataset(Dataset):
             "clean_audio": clean_embeddings,
             "audio": transformed_embeddings,
             "transform_parameters": transform_parameters,
-        }
\ No newline at end of file
+        }
+
+
+def get_transform_config(transform):
+    # class and scalar attributes of a transform (private ones too, e.g. the _p of torch_audiomentations),
+    # and of those it composes (e.g. the chains, OneOf)
+    config = {
+        key: value for key, value in vars(transform).items()
+        if key not in ["training", "profile"] and isinstance(value, (bool, int, float, str))
+    }
+    config["class"] = transform.__class__.__name__
+    if hasattr(transform, "transforms"):
+        config["transforms"] = [get_transform_config(tfm) for tfm in transform.transforms]
+    return config
+
+
+def get_render_config(dataset, seed = 0):
+    # everything that changes the items of a rendered set
+    paths = "\n".join(dataset.get_path(i) for i in range(len(dataset)))
+    augmentations = dataset.augmentations if dataset.transform and dataset.train else None
+    if isinstance(augmentations, dict):
+        augmentations = {stage: get_transform_config(chain) for stage, chain in augmentations.items()}
+    elif augmentations is not None:
+        augmentations = get_transform_config(augmentations)
+    return {
+        "files": hashlib.sha1(paths.encode()).hexdigest(),
+        "target_sr": dataset.target_sr,
+        "target_n_samples": int(dataset.target_n_samples),
+        "max_target_n_samples": dataset.max_target_n_samples,
+        "n_augmentations": dataset.n_augmentations,
+        "strategy": dataset.strategy,
+        "keep_anchor": dataset.keep_anchor,
+        "tempo_stretching": dataset.tempo_stretching,
+        "return_labels": dataset.return_labels,
+        "return_clean_audio": dataset.return_clean_audio,
+        "return_tfm_parameters": dataset.return_tfm_parameters,
+        "frontend": get_frontend_config(dataset.frontend, dataset.target_n_samples) if dataset.frontend is not None else None,
+        "augmentations": augmentations,
+        "seed": seed,
+    }
+
+
+def get_render_path(path, dataset, seed = 0):
+    # sets rendered with another configuration go to another directory
+    config = json.dumps(get_render_config(dataset, seed), sort_keys = True, default = str)
+    return os.path.join(path, hashlib.sha1(config.encode()).hexdigest()[:12])
+
+
+def flatten_item(item, prefix = ""):
+    # {"augs": {"Gain": tensor}} to {"augs/Gain": tensor}, leaving out the timings of profiled datasets
+    flat = {}
+    for key, value in item.items():
+        if prefix == "" and key == "timings":
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten_item(value, f"{prefix}{key}/"))
+        else:
+            flat[f"{prefix}{key}"] = torch.as_tensor(value)
+    return flat
+
+
+def render_dataset(dataset, path, seed = 0):
+    """
+    Renders every item of an augmenting dataset once (crops, views, augs, labels, clean audio)
+    into ``path/<config hash>``: one ``.npy`` array per item key, written item by item, and
+    ``index.pkl``. Items are rendered sequentially with seeded RNGs so that the rendered set is
+    reproducible. Returns the directory.
+    """
+    if len(dataset) == 0:
+        raise ValueError("Cannot render an empty dataset")
+    render_path = get_render_path(path, dataset, seed)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    
+    os.makedirs(render_path, exist_ok = True)
+    arrays = None
+    for i in tqdm(range(len(dataset)), desc="Rendering dataset"):
+        item = flatten_item(dataset[i])
+        if arrays is None:
+            files = {key: f"{n}.npy" for n, key in enumerate(item)}
+            arrays = {
+                key: np.lib.format.open_memmap(
+                    os.path.join(render_path, files[key]), mode = "w+", shape = (len(dataset), *value.shape),
+                    dtype = np.float16 if key in ["audio", "clean_audio"] else value.numpy().dtype
+                )
+                for key, value in item.items()
+            }
+        if item.keys() != arrays.keys() or any(value.shape != arrays[key].shape[1:] for key, value in item.items()):
+            raise ValueError(f"Item {i} does not have the keys and shapes of the first item, it cannot be rendered")
+        for key, value in item.items():
+            arrays[key][i] = value.numpy()
+    
+    for array in arrays.values():
+        array.flush()
+    index = {
+        "arrays": files,
+        "n_items": len(dataset),
+        "frontend_applied": dataset.frontend is not None,
+        "config": get_render_config(dataset, seed),
+    }
+    with open(os.path.join(render_path, "index.pkl"), "wb") as f:
+        pickle.dump(index, f)
+    print(f"Rendered {len(dataset)} items to {render_path}")
+    return render_path
+
+
+class PrerenderedDataset(Dataset):
+    """
+    Streams a set rendered by render_dataset into ``path`` (the directory returned by
+    render_dataset), e.g. a fixed validation set, with the keys of the live dataset.
+    If the set was rendered without a frontend, ``frontend`` is applied to audio and clean_audio on load.
+    """
+    
+    def __init__(self, path, frontend = None):
+        if not os.path.exists(os.path.join(path, "index.pkl")):
+            raise FileNotFoundError(f"No rendered set in {path}, see render_dataset")
+        self.path = path
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            self.index = pickle.load(f)
+        self.frontend = None if self.index['frontend_applied'] else frontend
+        self.arrays = None
+        print(f'length of dataset: {len(self)}')
+    
+    def __getstate__(self):
+        # workers open their own memory maps
+        state = self.__dict__.copy()
+        state["arrays"] = None
+        return state
+        
+    def __len__(self):
+        return self.index['n_items']
+    
+    def __getitem__(self, idx):
+        if self.arrays is None:
+            self.arrays = {key: np.load(os.path.join(self.path, file), mmap_mode = "r") for key, file in self.index["arrays"].items()}
+        
+        output_ = {}
+        for key, array in self.arrays.items():
+            value = torch.from_numpy(np.array(array[idx]))
+            if key in ["audio", "clean_audio"]:
+                value = value.float()
+                if self.frontend:
+                    value = self.frontend(value)
+            # nested keys, e.g. augs/<transform name>
+            *parents, name = key.split("/")
+            item = output_
+            for parent in parents:
+                item = item.setdefault(parent, {})
+            item[name] = value
+            
+        return output_
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import torch
+from tqdm import tqdm
+
+from mulooc.dataloading.augmentation_bank import get_crops
+from mulooc.dataloading.loading_utils import get_audio_duration, get_files_hash
+
+
+# Melgram attributes that change its output
+frontend_parameters = ["n_mels", "n_fft", "window_len", "hop_length", "sample_rate", "f_min", "f_max", "power"]
+
+
+def get_frontend_config(frontend, target_n_samples):
+    config = {key: getattr(frontend, key) for key in frontend_parameters}
+    return {"frontend": frontend.__class__.__name__, **config, "target_n_samples": int(target_n_samples)}
+
+
+def get_store_hash(frontend, target_n_samples, file_paths):
+    # features of another frontend configuration, crop length or set of files go to another directory of the store
+    config = json.dumps({**get_frontend_config(frontend, target_n_samples), "files": get_files_hash(file_paths)}, sort_keys = True)
+    return hashlib.sha1(config.encode()).hexdigest()[:12]
+
+
+def get_store_path(path, frontend, target_n_samples, file_paths):
+    return os.path.join(path, get_store_hash(frontend, target_n_samples, file_paths))
+
+
+def is_rendered(store_path):
+    # the index is written last, a directory without it is an interrupted render
+    return os.path.exists(os.path.join(store_path, "index.pkl"))
+
+
+def render_feature_store(file_paths, path, frontend, target_sr, target_n_samples, device = "cpu"):
+    """
+    Computes ``frontend`` (a Melgram) on every consecutive crop of ``file_paths`` (as
+    load_full_and_split) into ``path/<hash>``, keyed on the frontend configuration, the crop
+    length and the files: ``features.npy`` (float16, [n_crops_total, 1, n_mels, n_frames]) and
+    ``index.pkl``. Returns the directory.
+    """
+    store_path = get_store_path(path, frontend, target_n_samples, file_paths)
+    frontend = frontend.to(device)
+
+    # first pass over the files to size the store
+    counts = [max(int(get_audio_duration(file_path) * target_sr) // int(target_n_samples), 0) for file_path in tqdm(file_paths, desc = "Counting crops")]
+    row_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    with torch.no_grad():
+        feature_shape = frontend(torch.zeros(1, 1, int(target_n_samples), device = device)).shape[1:]
+
+    os.makedirs(store_path, exist_ok = True)
+    feature_store = np.lib.format.open_memmap(
+        os.path.join(store_path, "features.npy"), mode = "w+", dtype = np.float16,
+        shape = (int(row_offsets[-1]), *feature_shape)
+    )
+
+    # crops actually decoded per file, the duration estimate can be one crop off
+    n_rows = np.zeros(len(file_paths), dtype = np.int64)
+    for i, file_path in enumerate(tqdm(file_paths, desc = "Computing features")):
+        if counts[i] == 0:
+            continue
+        try:
+            crops = get_crops(file_path, target_n_samples, target_sr)[:counts[i]]
+        except Exception as e:
+            print("Error loading file:", e)
+            continue
+        with torch.no_grad():
+            features = frontend(crops.to(device))
+        feature_store[row_offsets[i]:row_offsets[i] + len(crops)] = features.cpu().numpy().astype(np.float16)
+        n_rows[i] = len(crops)
+
+    feature_store.flush()
+    index = {
+        "file_paths": list(file_paths),
+        "row_offsets": row_offsets,
+        "n_rows": n_rows,
+        "config": get_frontend_config(frontend, target_n_samples),
+    }
+    with open(os.path.join(store_path, "index.pkl"), "wb") as f:
+        pickle.dump(index, f)
+    print(f"Computed {int(n_rows.sum())} crops of features to {store_path}")
+    return store_path
+
+
+class FeatureStore:
+    """
+    Reads the features of a ``frontend`` for ``file_paths`` from a store written by
+    render_feature_store under ``path``, in place of decoding the audio and running the frontend.
+    Only clean crops are stored, at fixed positions. The features are memory-mapped lazily, once per worker.
+    """
+
+    def __init__(self, path, frontend, target_n_samples, file_paths):
+        self.path = get_store_path(path, frontend, target_n_samples, file_paths)
+        if not is_rendered(self.path):
+            raise FileNotFoundError(f"No complete features for this frontend configuration and these files in {path}, see render_feature_store")
+        with open(os.path.join(self.path, "index.pkl"), "rb") as f:
+            self.index = pickle.load(f)
+        missing = set(file_paths) - set(self.index["file_paths"])
+        if missing:
+            raise ValueError(f"{len(missing)} files are not in the feature store at {self.path}, e.g. {next(iter(missing))}")
+        self.row_offsets = self.index["row_offsets"]
+        self.n_rows = self.index["n_rows"]
+        self.file_rows = {file_path: i for i, file_path in enumerate(self.index["file_paths"])}
+        self.features = None
+
+    def __getstate__(self):
+        # workers open their own memory map
+        state = self.__dict__.copy()
+        state["features"] = None
+        return state
+
+    def __contains__(self, path):
+        return path in self.file_rows
+
+    def load(self, path, n_views = None, strategy = "same"):
+        """
+        Returns ``[n_views, 1, n_mels, n_frames]`` features of stored crops of ``path``, picked as the
+        dataset's loading ``strategy``: one random crop repeated over the views (same, identical
+        positives as with audio), consecutive crops (adjacent) or independent random crops (random).
+        Returns every crop of the file if ``n_views`` is None.
+        """
+        if self.features is None:
+            self.features = np.load(os.path.join(self.path, "features.npy"), mmap_mode = "r")
+        if path not in self.file_rows:
+            raise KeyError(f"{path} is not in the feature store at {self.path}")
+        i = self.file_rows[path]
+        rows = np.arange(self.row_offsets[i], self.row_offsets[i] + self.n_rows[i])
+        if len(rows) == 0:
+            raise ValueError(f"{path} has no crops in the feature store")
+        if n_views is not None:
+            if strategy == "adjacent":
+                # as many consecutive crops as the file has, the last one repeated if it has fewer than n_views
+                start = np.random.randint(0, max(len(rows) - n_views, 0) + 1)
+                rows = rows[np.minimum(start + np.arange(n_views), len(rows) - 1)]
+            elif strategy == "random":
+                rows = np.random.choice(rows, n_views)
+            else:
+                rows = np.full(n_views, np.random.choice(rows))
+        return torch.from_numpy(self.features[rows].astype(np.float32))
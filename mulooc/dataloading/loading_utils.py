@@ -1,9 +1,25 @@
+import hashlib
 import torchaudio
 import soundfile as sf
 import numpy as np
 import torch
 
-def load_audio_chunk(path, target_n_samples, target_sr, start = None):
+def get_audio_duration(path):
+    # duration in seconds, with the same mp3 padding margin as load_audio_chunk
+    info = torchaudio.info(path, backend='soundfile')
+    frames = info.num_frames
+    if path.split('.')[-1] == 'mp3':
+        frames = frames - 8192
+    return max(frames, 0) / info.sample_rate
+
+def get_files_hash(file_paths):
+    # short hash of a set of files, whatever their order, to key the stores rendered from them
+    return hashlib.sha1("\n".join(sorted(file_paths)).encode()).hexdigest()[:12]
+
+def get_sample_rate(path):
+    return torchaudio.info(path, backend='soundfile').sample_rate
+
+def load_audio_chunk(path, target_n_samples, target_sr, start = None, start_s = None):
     # info = sf.info(path)
     # frames = info.frames
     # sr = info.samplerate
@@ -18,6 +34,11 @@ def load_audio_chunk(path, target_n_samples, target_sr, start = None):
     
     new_target_n_samples = int(target_n_samples * sr / target_sr)
     
+    if start is None and start_s is not None:
+        # start time chosen by a sampler, clamped so the chunk stays inside the file
+        start = min(int(start_s * sr), frames - new_target_n_samples)
+        start = max(start, 0)
+    
     if start is None:
         # random
         start = np.random.randint(0, frames - new_target_n_samples)
@@ -0,0 +1,373 @@
+import math
+import os
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.utils.data import DistributedSampler
+from tqdm import tqdm
+
+from mulooc.dataloading.loading_utils import get_audio_duration
+
+
+def get_dist_info(num_replicas=None, rank=None):
+    # resolve world size and rank without requiring an initialised process group
+    initialized = dist.is_available() and dist.is_initialized()
+    if num_replicas is None:
+        num_replicas = dist.get_world_size() if initialized else 1
+    if rank is None:
+        rank = dist.get_rank() if initialized else 0
+    return num_replicas, rank
+
+
+def get_durations(annotations):
+    # per-file durations in seconds, read from the annotations when available
+    if "duration" in annotations.columns:
+        return annotations["duration"].to_numpy(dtype=np.float64)
+
+    durations = []
+    for path in tqdm(annotations["file_path"], desc="Reading durations"):
+        try:
+            durations.append(get_audio_duration(path))
+        except Exception as e:
+            print("Error reading duration:", e)
+            durations.append(0.0)
+    return np.array(durations, dtype=np.float64)
+
+
+class ResumableSampler(DistributedSampler):
+    """
+    Base class for the training samplers. Subclasses implement ``plan_epoch``, which returns the
+    full epoch order; this class pads it, keeps this rank's shard and can resume mid-epoch.
+
+    Subclasses DistributedSampler so Lightning keeps it as is under DDP: every rank builds the
+    same epoch plan from ``seed + epoch`` and keeps its own shard of it.
+    """
+
+    # shard the epoch plan as contiguous slices rather than strided across ranks
+    contiguous_shards = False
+
+    def __init__(self, dataset, num_replicas = None, rank = None, seed = 0, drop_last = False):
+        num_replicas, rank = get_dist_info(num_replicas, rank)
+        super().__init__(dataset, num_replicas = num_replicas, rank = rank, shuffle = True, seed = seed, drop_last = drop_last)
+        self.resume_state = None
+        # samples of this rank's shard of the current epoch handed out so far, including those skipped on resume
+        self.yielded = 0
+
+    def plan_epoch(self):
+        raise NotImplementedError
+
+    def shard(self, plan):
+        if not self.drop_last:
+            padding_size = self.total_size - len(plan)
+            if isinstance(plan, np.ndarray):
+                # large plans stay numpy arrays rather than lists of python ints
+                plan = np.resize(plan, self.total_size)
+            else:
+                plan += (plan * math.ceil(padding_size / len(plan)))[:padding_size]
+        else:
+            plan = plan[:self.total_size]
+
+        if self.contiguous_shards:
+            return plan[self.rank * self.num_samples:(self.rank + 1) * self.num_samples]
+        return plan[self.rank:self.total_size:self.num_replicas]
+
+    def __iter__(self):
+        position = 0
+        if self.resume_state is not None:
+            if self.resume_state["epoch"] == self.epoch:
+                position = self.resume_state["position"]
+            elif self.resume_state["epoch"] < self.epoch:
+                # the saved epoch had ended, replay its plan so stateful samplers catch up
+                epoch = self.epoch
+                self.epoch = self.resume_state["epoch"]
+                self.plan_epoch()
+                self.epoch = epoch
+            self.resume_state = None
+
+        plan = self.shard(self.plan_epoch())
+
+        if position > 0:
+            print(f"Resuming sampler at epoch {self.epoch}, skipping {position} of {len(plan)} samples")
+
+        self.yielded = min(position, len(plan))
+        for index in plan[position:]:
+            self.yielded += 1
+            yield int(index) if isinstance(plan, np.ndarray) else index
+
+    def set_epoch(self, epoch):
+        if epoch != self.epoch:
+            self.yielded = 0
+        super().set_epoch(epoch)
+
+    def state_dict(self, position = None):
+        # position is the number of samples this rank consumed in the current epoch. The sampler's own count runs
+        # ahead of it by what the loader prefetched, and bounds it when the last batch is partial
+        return {
+            "seed": self.seed,
+            "epoch": self.epoch,
+            "position": self.yielded if position is None else min(position, self.yielded),
+            "yielded": self.yielded,
+            "num_replicas": self.num_replicas,
+        }
+
+    def load_state_dict(self, state_dict):
+        state_dict = dict(state_dict)
+        if state_dict["seed"] != self.seed:
+            print(f"Warning: resuming sampler with seed {state_dict['seed']} instead of {self.seed}")
+            self.seed = state_dict["seed"]
+        if state_dict["num_replicas"] != self.num_replicas:
+            # shards differ with the world size, so the resumed position is approximate
+            print(f"Warning: resuming on {self.num_replicas} replicas from a run on {state_dict['num_replicas']}, the data position is approximate")
+            state_dict["position"] = state_dict["position"] * state_dict["num_replicas"] // self.num_replicas
+        self.epoch = state_dict["epoch"]
+        self.resume_state = state_dict
+
+
+class ResumableDataLoader(torch.utils.data.DataLoader):
+    """
+    DataLoader exposing its sampler state. Lightning stores the ``state_dict`` of such loaders
+    in the fit loop of its checkpoints and loads it back before iterating on resume.
+
+    ``get_position`` returns how many samples of the current epoch this rank has consumed,
+    which the loader cannot know itself because of worker prefetching. Without it, the count
+    of samples the sampler yielded is saved, prefetched samples included.
+    """
+
+    def __init__(self, *args, get_position = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.get_position = get_position
+
+    def state_dict(self):
+        position = self.get_position() if self.get_position is not None else None
+        return {"sampler": self.sampler.state_dict(position)}
+
+    def load_state_dict(self, state_dict):
+        self.sampler.load_state_dict(state_dict["sampler"])
+
+
+class ShuffleSampler(ResumableSampler):
+    """
+    Uniform random order, equivalent to ``shuffle=True`` with a DistributedSampler.
+    """
+
+    def plan_epoch(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        return rng.permutation(len(self.dataset)).tolist()
+
+
+class DurationSampler(ResumableSampler):
+    """
+    Samples crops proportionally to file duration (``mode="proportional"``) or once per
+    crop-sized region of every file (``mode="stratified"``).
+    Yields ``(index, start_s)`` tuples that AudioDataset uses to place its crop.
+
+    A per-file coverage bitmap (one bit per crop-sized region) records which regions have been
+    scheduled; proportional sampling prefers unseen regions of a file and starts a new pass over
+    it once all of its regions are covered.
+    """
+
+    def __init__(self, dataset, durations, crop_len_s, mode = "proportional", epoch_hours = None,
+                 num_replicas = None, rank = None, seed = 0, drop_last = False):
+
+        super().__init__(dataset, num_replicas = num_replicas, rank = rank, seed = seed, drop_last = drop_last)
+
+        if mode not in ["proportional", "stratified"]:
+            raise ValueError(f"Invalid mode: {mode}. Supported modes are: proportional, stratified")
+        if len(durations) != len(dataset):
+            raise ValueError("durations and dataset must have the same length")
+
+        self.mode = mode
+        self.crop_len_s = crop_len_s
+        self.epoch_hours = epoch_hours
+        self.durations = np.asarray(durations, dtype=np.float64)
+
+        # one bin per crop-sized region of each file, stored as a single flat bitmap
+        self.n_bins = np.maximum(np.ceil(self.durations / crop_len_s), 1).astype(np.int64)
+        self.bin_offsets = np.concatenate([[0], np.cumsum(self.n_bins)])
+        self.coverage = np.zeros(self.bin_offsets[-1], dtype=bool)
+        # coverage before the current epoch was planned, needed to rebuild the same plan on resume
+        self.epoch_start_coverage = self.coverage.copy()
+
+        self.set_num_samples()
+
+    def set_num_samples(self):
+        if self.epoch_hours is not None:
+            total = int(self.epoch_hours * 3600 / self.crop_len_s)
+        elif self.mode == "stratified":
+            total = int(self.n_bins.sum())
+        else:
+            total = len(self.dataset)
+        self.epoch_samples = total
+
+        if self.drop_last:
+            self.num_samples = total // self.num_replicas
+        else:
+            self.num_samples = math.ceil(total / self.num_replicas)
+        self.total_size = self.num_samples * self.num_replicas
+
+    def get_start(self, file_idx, bin_idx, rng):
+        # jitter the crop around its region, keeping it inside the file
+        start_s = (bin_idx + rng.uniform(-0.5, 0.5)) * self.crop_len_s
+        return float(np.clip(start_s, 0, max(self.durations[file_idx] - self.crop_len_s, 0)))
+
+    def pick_unseen_bin(self, file_idx, rng):
+        bins = self.coverage[self.bin_offsets[file_idx]:self.bin_offsets[file_idx + 1]]
+        unseen = np.flatnonzero(~bins)
+        if len(unseen) == 0:
+            # every region of this file has been seen, start a new pass over it
+            bins[:] = False
+            unseen = np.arange(len(bins))
+        bin_idx = rng.choice(unseen)
+        bins[bin_idx] = True
+        return bin_idx
+
+    def plan_epoch(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch_start_coverage = self.coverage.copy()
+
+        if self.mode == "proportional":
+            weights = self.durations / self.durations.sum()
+            files = rng.choice(len(self.durations), size = self.epoch_samples, p = weights)
+            plan = [(int(f), self.get_start(f, self.pick_unseen_bin(f, rng), rng)) for f in files]
+
+        else:
+            # every region of every file once, in random order, cycled if the epoch is longer
+            files = np.repeat(np.arange(len(self.durations)), self.n_bins)
+            bins = np.arange(len(files)) - np.repeat(self.bin_offsets[:-1], self.n_bins)
+            order = np.concatenate([rng.permutation(len(files)) for _ in range(math.ceil(self.epoch_samples / len(files)))])
+            order = order[:self.epoch_samples]
+            self.coverage[order] = True
+            plan = [(int(files[i]), self.get_start(files[i], bins[i], rng)) for i in order]
+
+        print(f"Sampler epoch {self.epoch}: {self.epoch_samples * self.crop_len_s / 3600:.2f} audio hours scheduled, {self.coverage_fraction() * 100:.1f}% of the corpus covered")
+
+        return plan
+
+    def coverage_fraction(self):
+        return self.coverage.mean()
+
+    def covered_hours(self):
+        # a bin covers at most one crop length and never more than the file itself
+        covered = np.add.reduceat(self.coverage.astype(np.int64), self.bin_offsets[:-1])
+        return np.minimum(covered * self.crop_len_s, self.durations).sum() / 3600
+
+    def state_dict(self, position = None):
+        state_dict = super().state_dict(position)
+        state_dict["coverage"] = np.packbits(self.epoch_start_coverage)
+        return state_dict
+
+    def load_state_dict(self, state_dict):
+        super().load_state_dict(state_dict)
+        self.coverage = np.unpackbits(state_dict["coverage"], count = len(self.coverage)).astype(bool)
+        self.epoch_start_coverage = self.coverage.copy()
+
+
+class BlockShuffleSampler(ResumableSampler):
+    """
+    Shuffles at block level to keep reads local on HDD and network storage.
+
+    Files are grouped into blocks of contiguous files, either per directory (``group_by="directory"``,
+    directories larger than ``block_size`` are split) or by position in the annotations, e.g. the
+    offset in a packed shard (``group_by="offset"``). Each epoch the block order is shuffled, then
+    files are shuffled within windows of ``window`` consecutive blocks.
+    ``window=1`` only shuffles inside a block (most local), large windows approach a full shuffle.
+    Each rank reads a contiguous slice of the epoch order, so it also keeps its locality.
+    """
+
+    contiguous_shards = True
+
+    def __init__(self, dataset, file_paths = None, group_by = "directory", block_size = 256, window = 4,
+                 num_replicas = None, rank = None, seed = 0, drop_last = False):
+
+        super().__init__(dataset, num_replicas = num_replicas, rank = rank, seed = seed, drop_last = drop_last)
+
+        if group_by not in ["directory", "offset"]:
+            raise ValueError(f"Invalid group_by: {group_by}. Supported values are: directory, offset")
+        if file_paths is None and group_by == "directory":
+            file_paths = [dataset.get_path(i) for i in range(len(dataset))]
+
+        self.group_by = group_by
+        self.block_size = block_size
+        self.window = max(int(window), 1)
+        self.blocks = self.build_blocks(file_paths)
+
+        print(f"BlockShuffleSampler: {len(self.blocks)} blocks, window of {self.window} blocks")
+
+    def build_blocks(self, file_paths):
+        if self.group_by == "offset":
+            indices = np.arange(len(self.dataset))
+            return [indices[i:i + self.block_size] for i in range(0, len(indices), self.block_size)]
+
+        # sort by path so that files of a directory (and its neighbours) are contiguous
+        file_paths = np.asarray(file_paths)
+        order = np.argsort(file_paths, kind = "stable")
+        directories = np.array([os.path.dirname(path) for path in file_paths[order]])
+        boundaries = np.flatnonzero(directories[1:] != directories[:-1]) + 1
+
+        blocks = []
+        for directory in np.split(order, boundaries):
+            blocks += [directory[i:i + self.block_size] for i in range(0, len(directory), self.block_size)]
+        return blocks
+
+    def plan_epoch(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        block_order = rng.permutation(len(self.blocks))
+
+        plan = []
+        for i in range(0, len(block_order), self.window):
+            window = np.concatenate([self.blocks[b] for b in block_order[i:i + self.window]])
+            plan.append(rng.permutation(window))
+
+        return np.concatenate(plan).tolist()
+
+
+class MixtureSampler(ResumableSampler):
+    """
+    Samples from a MixtureAudioDataset by source weight: each draw picks a source with
+    probability proportional to its weight, then a file uniformly within it. The epoch plan is
+    a flat array of global indices, so memory does not grow with the number of files.
+
+    ``epoch_size`` defaults to the total number of files across sources.
+    """
+
+    def __init__(self, dataset, weights = None, epoch_size = None,
+                 num_replicas = None, rank = None, seed = 0, drop_last = False):
+
+        super().__init__(dataset, num_replicas = num_replicas, rank = rank, seed = seed, drop_last = drop_last)
+
+        self.source_offsets = dataset.source_offsets
+        self.source_lengths = dataset.source_lengths
+        if weights is None:
+            weights = np.ones(len(self.source_lengths))
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(weights) != len(self.source_lengths):
+            raise ValueError("weights and dataset sources must have the same length")
+        # empty sources (e.g. no val files) can never be drawn
+        weights = np.where(self.source_lengths > 0, weights, 0)
+        if weights.sum() <= 0:
+            raise ValueError("At least one non-empty source needs a positive weight")
+        self.weights = weights / weights.sum()
+
+        self.epoch_samples = epoch_size if epoch_size is not None else len(dataset)
+        if self.drop_last:
+            self.num_samples = self.epoch_samples // self.num_replicas
+        else:
+            self.num_samples = math.ceil(self.epoch_samples / self.num_replicas)
+        self.total_size = self.num_samples * self.num_replicas
+
+        for name, weight, length in zip(getattr(dataset, "source_names", range(len(weights))), self.weights, self.source_lengths):
+            print(f"MixtureSampler: {name}: {length} files, sampled {weight * 100:.1f}% of the time")
+
+    def plan_epoch(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        sources = rng.choice(len(self.weights), size = self.epoch_samples, p = self.weights)
+        files = (rng.random(self.epoch_samples) * self.source_lengths[sources]).astype(np.int64)
+        return self.source_offsets[sources] + files
+
+
+samplers = {
+    "random": ShuffleSampler,
+    "duration": DurationSampler,
+    "block": BlockShuffleSampler,
+    "mixture": MixtureSampler,
+}
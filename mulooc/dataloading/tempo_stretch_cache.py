@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import pickle
+import random
+
+import numpy as np
+import torch
+from pedalboard import time_stretch
+from tqdm import tqdm
+
+from mulooc.dataloading.loading_utils import get_files_hash, load_full_audio
+
+
+def get_valid_factors(tempo, factors, n_classes):
+    # as in time_stretching_module, the stretched tempo has to stay inside the one-hot label
+    return [factor for factor in factors if int(tempo * factor) < n_classes]
+
+
+def get_n_classes(annotations):
+    # width of the one-hot labels, the same for every file
+    return len(annotations["labels"].iloc[0]) if len(annotations) > 0 else 0
+
+
+def get_cache_config(annotations, target_sr, factors):
+    return {
+        "files": get_files_hash(annotations["file_path"].tolist()),
+        "sample_rate": target_sr,
+        "factors": [float(factor) for factor in factors],
+        "n_classes": get_n_classes(annotations),
+    }
+
+
+def get_cache_path(path, annotations, target_sr, factors):
+    # renders of other files, sample rate, factors or label width go to another directory
+    config = json.dumps(get_cache_config(annotations, target_sr, factors), sort_keys = True)
+    return os.path.join(path, hashlib.sha1(config.encode()).hexdigest()[:12])
+
+
+def is_rendered(cache_path):
+    # the index is written last, a directory without it is an interrupted render
+    return os.path.exists(os.path.join(cache_path, "index.pkl"))
+
+
+def render_tempo_stretch_cache(annotations, path, target_sr, factors):
+    """
+    Renders every file of ``annotations`` (with one-hot tempo ``labels``) time-stretched by each of
+    ``factors`` that keeps its tempo label valid, into ``path/<hash>`` (see get_cache_path):
+    ``audio.f16`` (raw float16, all renders end to end) and ``index.pkl`` with the offset and
+    length of each render. Returns the directory.
+    """
+    factors = [float(factor) for factor in factors]
+    n_classes = get_n_classes(annotations)
+    path = get_cache_path(path, annotations, target_sr, factors)
+    os.makedirs(path, exist_ok = True)
+
+    files = {}
+    offset = 0
+    with open(os.path.join(path, "audio.f16"), "wb") as f:
+        for file_path, labels in tqdm(zip(annotations["file_path"], annotations["labels"]), total = len(annotations), desc = "Rendering tempo stretches"):
+            labels = np.asarray(labels)
+            tempo = int(labels.argmax())
+            try:
+                audio = load_full_audio(file_path, target_sr).float().mean(dim = 0, keepdim = True).numpy()
+            except Exception as e:
+                # kept without renders, its items are skipped as unreadable files are when loading audio
+                print("Error loading file:", e)
+                files[file_path] = {"tempo": tempo, "renders": {}}
+                continue
+
+            renders = {}
+            for factor in get_valid_factors(tempo, factors, n_classes):
+                stretched = audio if factor == 1.0 else time_stretch(input_audio = audio, samplerate = target_sr, stretch_factor = factor)
+                stretched[0].astype(np.float16).tofile(f)
+                renders[factor] = (offset, stretched.shape[-1])
+                offset += stretched.shape[-1]
+            files[file_path] = {"tempo": tempo, "renders": renders}
+
+    index = {"files": files, "factors": factors, "n_classes": n_classes, "sample_rate": target_sr}
+    with open(os.path.join(path, "index.pkl"), "wb") as f:
+        pickle.dump(index, f)
+    print(f"Rendered {len(files)} files x {len(factors)} factors ({offset / target_sr / 3600:.2f} hours) to {path}")
+    return path
+
+
+class TempoStretchCache:
+    """
+    Serves crops of the pre-rendered time stretches of render_tempo_stretch_cache with their tempo
+    labels. Each item draws one of the factors valid for its file, so loading is a lookup in the
+    memory-mapped renders and never has to skip an item. The renders are mapped lazily, once per worker.
+
+    With ``annotations``, ``target_sr`` and ``factors``, ``path`` is the directory passed to
+    render_tempo_stretch_cache and the renders of that configuration are checked to cover them.
+    Otherwise ``path`` is the rendered directory itself.
+    """
+
+    def __init__(self, path, annotations = None, target_sr = None, factors = None):
+        if annotations is not None:
+            path = get_cache_path(path, annotations, target_sr, factors)
+        if not is_rendered(path):
+            raise FileNotFoundError(f"No complete tempo stretch cache in {path}, see render_tempo_stretch_cache")
+        self.path = path
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            index = pickle.load(f)
+        if annotations is not None:
+            config = get_cache_config(annotations, target_sr, factors)
+            for key in ["sample_rate", "factors", "n_classes"]:
+                if index[key] != config[key]:
+                    raise ValueError(f"The tempo stretch cache at {path} has {key} {index[key]}, not {config[key]}")
+            missing = set(annotations["file_path"]) - set(index["files"])
+            if missing:
+                raise ValueError(f"{len(missing)} files are not in the tempo stretch cache at {path}, e.g. {next(iter(missing))}")
+        self.files = index["files"]
+        self.factors = index["factors"]
+        self.sample_rate = index["sample_rate"]
+        self.audio = None
+
+    def __getstate__(self):
+        # workers open their own memory map
+        state = self.__dict__.copy()
+        state["audio"] = None
+        return state
+
+    def crop(self, offset, length, start, n_samples):
+        chunk = torch.from_numpy(self.audio[offset + start:offset + min(start + n_samples, length)].astype(np.float32))
+        return torch.nn.functional.pad(chunk, (0, n_samples - chunk.shape[0]))
+
+    def load(self, path, labels, n_views, target_n_samples, strategy = "same"):
+        """
+        Returns ``[n_views, 1, T]`` crops of ``path`` stretched by a random valid factor, cropped as
+        the dataset's loading ``strategy`` (same, adjacent or random), and the stretched one-hot labels.
+        """
+        if self.audio is None:
+            self.audio = np.memmap(os.path.join(self.path, "audio.f16"), dtype = np.float16, mode = "r")
+        if path not in self.files:
+            raise KeyError(f"{path} is not in the tempo stretch cache at {self.path}")
+        entry = self.files[path]
+        if len(entry["renders"]) == 0:
+            raise ValueError(f"{path} has no valid tempo stretch in the cache")
+
+        factor = random.choice(list(entry["renders"]))
+        offset, length = entry["renders"][factor]
+        target_n_samples = int(target_n_samples)
+
+        if strategy == "adjacent":
+            start = np.random.randint(0, max(length - target_n_samples * n_views, 0) + 1)
+            audio = self.crop(offset, length, start, target_n_samples * n_views).view(n_views, target_n_samples)
+        elif strategy == "random":
+            audio = torch.stack([
+                self.crop(offset, length, np.random.randint(0, max(length - target_n_samples, 0) + 1), target_n_samples)
+                for _ in range(n_views)
+            ])
+        else:
+            start = np.random.randint(0, max(length - target_n_samples, 0) + 1)
+            audio = torch.stack([self.crop(offset, length, start, target_n_samples)] * n_views)
+
+        stretched_labels = torch.zeros_like(labels)
+        stretched_labels[int(entry["tempo"] * factor)] = 1
+        return audio.unsqueeze(1), stretched_labels
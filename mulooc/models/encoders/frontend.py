@@ -2,9 +2,27 @@ import torch
 import torchaudio
 from torch import nn
 
+
+def get_fft_size(n):
+    # smallest size of at least n with no prime factor above 5, fast for torch.fft
+    size = n
+    while True:
+        m = size
+        for p in [2, 3, 5]:
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return size
+        size += 1
+
+
 class Melgram(nn.Module):
     
-    def __init__(self, n_mels = 96, n_fft = 2048, window_len = 400, hop_length = 160, sample_rate = 16000, f_min = 0, f_max = 8000, power = 2):
+    def __init__(self, n_mels = 96, n_fft = 2048, window_len = 400, hop_length = 160, sample_rate = 16000, f_min = 0, f_max = 8000, power = 2, native_sr = False):
+        """
+        :param native_sr: let datasets hand over audio at the file's own sample rate (see forward), which is
+            then converted directly instead of being resampled to sample_rate first
+        """
         super(Melgram, self).__init__()
         self.n_mels = n_mels
         self.n_fft = n_fft
@@ -28,7 +46,63 @@ class Melgram(nn.Module):
         stype = 'power' if self.power == 2 else 'magnitude'
         self.compressor = torchaudio.transforms.AmplitudeToDB(stype)
         
-    def  forward(self, x):
+        self.native_sr = native_sr
+        # STFT sizes, window and mel filterbank of each native sample rate and device
+        self.native_stfts = {}
+    
+    def get_native_stft(self, sample_rate, device):
+        key = (sample_rate, str(device))
+        if key not in self.native_stfts:
+            # window and hop scaled to the same durations as at self.sample_rate. The FFT only needs to sample the
+            # power spectrum of the window finely enough to be interpolated (twice the window length), at a fast size
+            ratio = sample_rate / self.sample_rate
+            window_len = round(self.window_len * ratio)
+            n_fft = get_fft_size(min(round(self.n_fft * ratio), 2 * window_len))
+            
+            # the filterbank of self.sample_rate applied to the native spectrum linearly interpolated on its bins,
+            # band-limited to f_max as the resampled path is
+            frequencies = torch.linspace(0, self.sample_rate / 2, self.n_fft // 2 + 1, dtype = torch.float64)
+            positions = frequencies * n_fft / sample_rate
+            below = positions.floor().long()
+            weights = positions - below
+            interpolation = torch.zeros(self.n_fft // 2 + 1, n_fft // 2 + 2, dtype = torch.float64)
+            rows = torch.arange(len(frequencies))
+            interpolation[rows, below.clamp(max = n_fft // 2 + 1)] += 1 - weights
+            interpolation[rows, (below + 1).clamp(max = n_fft // 2 + 1)] += weights
+            # above the native Nyquist frequency there is nothing to interpolate, as after resampling
+            interpolation = interpolation[:, :n_fft // 2 + 1] * (positions <= n_fft // 2)[:, None]
+            filterbank = (interpolation.T @ self.mel.mel_scale.fb.double().cpu()).float().to(device)
+            
+            window = torch.hann_window(window_len, device = device)
+            self.native_stfts[key] = (ratio, n_fft, round(self.hop_length * ratio), window, filterbank)
+        return self.native_stfts[key]
+    
+    def native_mel(self, x, sample_rate):
+        ratio, n_fft, hop_length, window, filterbank = self.get_native_stft(sample_rate, x.device)
+        shape = x.shape
+        spec = torch.stft(
+            x.reshape(-1, shape[-1]), n_fft, hop_length = hop_length, win_length = window.shape[0], window = window,
+            center = True, pad_mode = "reflect", return_complex = True
+        ).abs() ** self.power
+        # a window ratio times longer sums ratio times more samples, whatever the FFT size
+        spec = spec / ratio ** self.power
+        mel = torch.matmul(spec.transpose(-1, -2), filterbank).transpose(-1, -2)
+        
+        # as many frames as the resampled audio would give, rounded hops can drift by a frame or so
+        n_frames = 1 + round(shape[-1] / ratio) // self.hop_length
+        if mel.shape[-1] < n_frames:
+            mel = torch.nn.functional.pad(mel, (0, n_frames - mel.shape[-1]), mode = "replicate")
+        return mel[..., :n_frames].reshape(*shape[:-1], self.n_mels, n_frames)
+    
+    def  forward(self, x, sample_rate = None):
+        """
+        :param sample_rate: sample rate of x if not self.sample_rate. With native_sr, x is converted at that rate,
+            otherwise it is resampled to self.sample_rate first.
+        """
+        if sample_rate is not None and sample_rate != self.sample_rate:
+            if self.native_sr:
+                return self.compressor(self.native_mel(x, sample_rate))
+            x = torchaudio.functional.resample(x, sample_rate, self.sample_rate)
         x = self.mel(x)
         x = self.compressor(x)
         return x
\ No newline at end of file
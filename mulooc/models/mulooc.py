@@ -266,6 +266,7 @@ class LightningMuLOOC(MuLOOC,pl.LightningModule):
                  accumulate = None,
                  schedule = False,
                  plusplus = False,
+                 log_timings_every = None,
                  **kwargs):
         super().__init__(encoder, head_dims,temperature=temperature,feat_extract_head=feat_extract_head,plusplus=plusplus,**kwargs)
         
@@ -274,6 +275,11 @@ class LightningMuLOOC(MuLOOC,pl.LightningModule):
         self.mixup = mixup
         self.schedule = schedule
         
+        # input pipeline cost breakdown from the "timings" of batches (AudioDataModule(profile=True)), logged every n steps
+        self.log_timings_every = log_timings_every
+        self.timing_totals = {"time_s": {}, "calls": {}}
+        self.timing_steps = 0
+        
         if accumulate:
             print(f'accumulating loss over {accumulate} steps')
             self.losses = [NTXent(temperature = temperature,accumulate = accumulate) for _ in range(len(self.heads))]
@@ -297,6 +303,9 @@ class LightningMuLOOC(MuLOOC,pl.LightningModule):
     
     def training_step(self, batch, batch_idx):
         
+        if self.log_timings_every and "timings" in batch:
+            self.accumulate_timings(batch["timings"])
+        
         if self.mixup:
             batch['audio'] = mixup(batch['audio'])
             
@@ -324,13 +333,37 @@ class LightningMuLOOC(MuLOOC,pl.LightningModule):
         return loss
     
     
+    def accumulate_timings(self, timings):
+        # summed where they are, only synchronised when logged
+        for key in ["time_s", "calls"]:
+            for name, value in timings[key].items():
+                total = torch.as_tensor(value, dtype = torch.float64).sum()
+                self.timing_totals[key][name] = self.timing_totals[key].get(name, 0) + total
+        
+        self.timing_steps += 1
+        if self.timing_steps % self.log_timings_every == 0:
+            self.log_timings()
+    
+    def log_timings(self):
+        time_s = {name: float(value) for name, value in self.timing_totals["time_s"].items()}
+        calls = {name: float(value) for name, value in self.timing_totals["calls"].items()}
+        # stages ("load", "var", ...) partition the pipeline, transforms ("var.Gain", ...) are nested in them
+        total = sum(value for name, value in time_s.items() if "." not in name)
+        
+        for name in time_s:
+            self.log(f'timings/{name}_ms_per_call', 1000 * time_s[name] / max(calls[name], 1), on_step=True, on_epoch=False, logger=True)
+            self.log(f'timings/{name}_calls', calls[name], on_step=True, on_epoch=False, logger=True)
+            self.log(f'timings/{name}_share', time_s[name] / total if total > 0 else 0.0, on_step=True, on_epoch=False, logger=True)
+        
+        self.timing_totals = {"time_s": {}, "calls": {}}
+    
     def validation_step(self,batch,batch_idx):
         
         out_ = self.forward_losses(batch)
         loss = out_['loss']
         
         loss = loss.mean()
-        # self.log('val_loss', loss, on_step=True, on_epoch=True, prog_bar=True, logger=True,sync_dist=True)
+        self.log('val_loss', loss, on_step=False, on_epoch=True, prog_bar=True, logger=True,sync_dist=True)
         
         return loss
     
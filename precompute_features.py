@@ -0,0 +1,41 @@
+from mulooc.dataloading.datamodule_splitter import DataModuleSplitter
+from mulooc.dataloading.feature_store import render_feature_store
+from mulooc.models.encoders.frontend import Melgram
+
+import yaml
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    
+    parser.add_argument('--task', type=str, help='Task whose annotations to compute features for', default = None)
+    parser.add_argument('--audio_dir', type=str, help='Directory of audio files to compute features for', default = None)
+    parser.add_argument('--val_split', type=float, help='Validation split, as passed to the datamodule', default = 0.1)
+    parser.add_argument('--splits', type=str, nargs='+', help='Splits to compute features for, the datamodule reads a store of all of them', default = ['train', 'val', 'test'])
+    parser.add_argument('--frontend', type=str, help='YAML file of Melgram keyword arguments, the defaults of Melgram if not given', default = None)
+    parser.add_argument('--target_sr', type=int, help='Sample rate of the crops', default = 16000)
+    parser.add_argument('--target_len_s', type=float, help='Crop length in seconds', default = 5)
+    parser.add_argument('--device', type=str, help='Device to compute the features on', default = 'cpu')
+    parser.add_argument('--output', type=str, help='Directory of the feature store, as passed to the datamodule', required = True)
+    
+    args = parser.parse_args()
+    
+    frontend_kwargs = {}
+    if args.frontend is not None:
+        with open(args.frontend) as f:
+            frontend_kwargs = yaml.safe_load(f)
+    frontend = Melgram(**frontend_kwargs)
+    
+    annotations = DataModuleSplitter(args.audio_dir, args.task, args.val_split).annotations
+    file_paths = annotations.loc[annotations['split'].isin(args.splits), 'file_path'].tolist()
+    print(f'Computing features of {len(file_paths)} files')
+    
+    render_feature_store(
+        file_paths,
+        args.output,
+        frontend,
+        target_sr = args.target_sr,
+        target_n_samples = int(args.target_len_s * args.target_sr),
+        device = args.device,
+    )
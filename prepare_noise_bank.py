@@ -0,0 +1,15 @@
+from mulooc.dataloading.augmentations.background import prepare_noise_bank
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    
+    parser.add_argument('--background_paths', type=str, help='Directory of background noise files (wav or mp3)', required = True)
+    parser.add_argument('--output', type=str, help='Output directory of the noise bank', required = True)
+    parser.add_argument('--sample_rate', type=int, help='Sample rate of the bank, must match the training sample rate', default = 16000)
+    parser.add_argument('--min_duration_s', type=float, help='Skip clips shorter than this', default = 0.0)
+    
+    args = parser.parse_args()
+    
+    prepare_noise_bank(args.background_paths, args.output, args.sample_rate, min_duration_s = args.min_duration_s)
@@ -89,6 +89,9 @@ if __name__ == "__main__":
     if cli.config.log:
         cli.trainer.callbacks = cli.trainer.callbacks+callbacks
         print("logging")
+    
+    if cli.datamodule.governor is not None:
+        cli.trainer.callbacks = cli.trainer.callbacks+[cli.datamodule.governor]
 
     try:
         if not os.path.exists(os.path.join(ckpt_path, experiment_name)):
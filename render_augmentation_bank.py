@@ -0,0 +1,41 @@
+from mulooc.dataloading.datamodule_splitter import DataModuleSplitter
+from mulooc.dataloading.augmentation_bank import render_augmentation_bank, bank_augmentations
+
+import numpy as np
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    
+    parser.add_argument('--task', type=str, help='Task whose annotations to render', default = None)
+    parser.add_argument('--audio_dir', type=str, help='Directory of audio files to render', default = None)
+    parser.add_argument('--val_split', type=float, help='Validation split, as passed to the datamodule', default = 0.1)
+    parser.add_argument('--splits', type=str, nargs='+', help='Splits to render', default = ['train', 'val'])
+    parser.add_argument('--augmentation', type=str, help='Augmentation to render', choices = list(bank_augmentations), default = 'pitch_shift')
+    parser.add_argument('--values', type=float, nargs='+', help='Parameter values to render', default = None)
+    parser.add_argument('--min_value', type=float, help='Smallest parameter value, used with --n_variants', default = -4)
+    parser.add_argument('--max_value', type=float, help='Largest parameter value, used with --n_variants', default = 4)
+    parser.add_argument('--n_variants', type=int, help='Number of evenly spaced values between min_value and max_value', default = 9)
+    parser.add_argument('--target_sr', type=int, help='Sample rate of the rendered crops', default = 16000)
+    parser.add_argument('--target_len_s', type=float, help='Crop length in seconds', default = 5)
+    parser.add_argument('--n_crops', type=int, help='Crops per file, all consecutive crops if not given', default = None)
+    parser.add_argument('--output', type=str, help='Output directory of the bank', required = True)
+    
+    args = parser.parse_args()
+    
+    values = args.values if args.values is not None else np.linspace(args.min_value, args.max_value, args.n_variants).round(4).tolist()
+    
+    annotations = DataModuleSplitter(args.audio_dir, args.task, args.val_split).annotations
+    file_paths = annotations.loc[annotations['split'].isin(args.splits), 'file_path'].tolist()
+    print(f'Rendering {len(file_paths)} files with {args.augmentation} values {values}')
+    
+    render_augmentation_bank(
+        file_paths,
+        args.output,
+        args.augmentation,
+        values,
+        target_sr = args.target_sr,
+        target_n_samples = int(args.target_len_s * args.target_sr),
+        n_crops = args.n_crops,
+    )
@@ -0,0 +1,36 @@
+import pandas as pd
+import torch
+
+import mulooc.dataloading.augmentation_bank as augmentation_bank_module
+from mulooc.dataloading.augmentation_bank import AugmentationBank, render_augmentation_bank
+from mulooc.dataloading.augmentations import Delay
+from mulooc.dataloading.augmentations.composition.custom_compose import CustomCompose
+from mulooc.dataloading.dataset import AudioDataset
+
+
+def get_bank(tmp_path, monkeypatch, p = 1.0):
+    monkeypatch.setattr(augmentation_bank_module, "get_crops", lambda path, target_n_samples, target_sr, n_crops = None: 0.1 * torch.randn(2, 1, int(target_n_samples)))
+    monkeypatch.setattr(augmentation_bank_module, "get_audio_duration", lambda path: 2.0)
+    render_augmentation_bank(["a.wav", "b.wav"], tmp_path, "reverb", [0.3, 0.6], 8000, 8000)
+    return AugmentationBank(str(tmp_path), p = p)
+
+
+def get_dataset(bank, augmentations = None):
+    annotations = pd.DataFrame({"file_path": ["a.wav", "b.wav"]})
+    return AudioDataset(annotations, None, 8000, target_n_samples = 8000, augmentations = augmentations, transform = True, augmentation_bank = bank)
+
+
+def test_bank_label_takes_the_first_head_without_a_chain(tmp_path, monkeypatch):
+    # the contrastive heads follow the order of the augs keys
+    augs = get_dataset(get_bank(tmp_path, monkeypatch))[0]["augs"]
+    assert list(augs) == ["ReverbAudiomentation"]
+    assert augs["ReverbAudiomentation"].tolist() == [1, 1]
+
+
+def test_bank_label_follows_the_chain_labels(tmp_path, monkeypatch):
+    augmentations = {
+        "base": CustomCompose(transforms = [], p = 0),
+        "var": CustomCompose(transforms = [Delay(p = 0.5, sample_rate = 8000)], p = 1, return_tfms = True),
+    }
+    augs = get_dataset(get_bank(tmp_path, monkeypatch), augmentations)[0]["augs"]
+    assert list(augs) == ["Delay", "ReverbAudiomentation"]
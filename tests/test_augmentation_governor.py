@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+from mulooc.dataloading.augmentation_governor import AugmentationGovernor
+from mulooc.dataloading.augmentations import Delay, Reverse
+from mulooc.dataloading.augmentations.composition.custom_compose import CustomCompose
+
+
+def start(governor):
+    chain = CustomCompose(transforms = [Delay(p = 0.5, sample_rate = 8000), Reverse(p = 0.5, sample_rate = 8000)], p = 1, return_tfms = True)
+    trainer = SimpleNamespace(datamodule = SimpleNamespace(aug_chain = {"var": chain}, batch_augment = "after_transfer"))
+    governor.on_fit_start(trainer, None)
+    governor.costs = {"var.Delay": 2.0, "var.Reverse": 1.0}
+    return chain
+
+
+def test_substitutes_are_not_shared():
+    first, second = AugmentationGovernor(10), AugmentationGovernor(10)
+    first.substitutes["var.Delay"] = Reverse(p = 0.5)
+    assert second.substitutes == {}
+
+
+def test_throttle_substitutes_then_lowers_p_and_relax_undoes_it():
+    governor = AugmentationGovernor(10, p_factor = 0.5, min_p = 0.2, substitutes = {"var.Delay": Reverse(p = 0.5, sample_rate = 8000)})
+    chain = start(governor)
+    context = {"step": 0, "steps_per_s": 1.0, "wait_share": 0.5}
+
+    governor.throttle(context)
+    assert isinstance(chain.transforms[0], Reverse)
+    assert chain.transform_names[0] == "Delay"
+    governor.throttle(context)
+    governor.throttle(context)
+    assert governor.get_p("var.Delay") == pytest.approx(0.2)
+    # the most expensive transform is at its floor, the next one is throttled
+    governor.throttle(context)
+    assert governor.get_p("var.Reverse") == pytest.approx(0.25)
+
+    # cheapest first, p before the substitution
+    for _ in range(3):
+        governor.relax(context)
+    assert governor.get_p("var.Delay") == pytest.approx(0.5)
+    assert governor.get_p("var.Reverse") == pytest.approx(0.5)
+    assert isinstance(chain.transforms[0], Reverse)
+    governor.relax(context)
+    assert isinstance(chain.transforms[0], Delay)
+    assert [decision["action"] for decision in governor.decisions] == ["substitute", "p", "p", "p", "p", "p", "p", "restore"]
@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+import pytest
+import torch
+from pedalboard import Compressor, Pedalboard
+
+from mulooc.dataloading.augmentations.compression import compress
+
+
+def get_parameters(batch_size, threshold_db = -20.0, ratio = 4.0, attack_ms = 1.0, release_ms = 100.0):
+    return [torch.full((batch_size,), value) for value in [threshold_db, ratio, attack_ms, release_ms]]
+
+
+@pytest.mark.parametrize("ratio", [1.0, 4.0])
+def test_silence_stays_silent(ratio):
+    samples = torch.zeros(2, 1, 8000)
+    out = compress(samples, 16000, *get_parameters(2, ratio = ratio))
+    assert torch.isfinite(out).all()
+    assert torch.equal(out, samples)
+
+
+def test_silent_prefix_and_unit_ratio_leave_audio_unchanged():
+    samples = torch.zeros(2, 1, 16000)
+    samples[..., 8000:] = 0.5 * torch.sin(2 * math.pi * 440 * torch.arange(8000) / 16000)
+    out = compress(samples, 16000, *get_parameters(2, ratio = 1.0))
+    assert torch.isfinite(out).all()
+    assert torch.allclose(out, samples)
+
+
+def test_close_to_pedalboard():
+    sample_rate = 16000
+    t = torch.arange(sample_rate) / sample_rate
+    samples = (0.8 * torch.sin(2 * math.pi * 220 * t) * torch.exp(-2 * t))[None, None]
+    out = compress(samples, sample_rate, *get_parameters(1))
+
+    board = Pedalboard([Compressor(threshold_db = -20, ratio = 4, attack_ms = 1, release_ms = 100)])
+    reference = board(samples[0].numpy(), sample_rate)
+
+    def rms_db(x):
+        return 10 * np.log10(np.mean(np.asarray(x) ** 2))
+
+    # the compressed level, not its exact envelope
+    assert rms_db(out[0].numpy()) == pytest.approx(rms_db(reference), abs = 0.5)
+    assert rms_db(out[0].numpy()) < rms_db(samples[0].numpy()) - 1
@@ -0,0 +1,22 @@
+import torch
+
+from mulooc.dataloading.augmentations.convolution_reverb import ConvolutionReverbAudiomentation
+
+
+def test_fft_convolution_matches_direct_convolution():
+    reverb = ConvolutionReverbAudiomentation(n_irs = 4, min_rt60 = 0.05, max_rt60 = 0.1, wet_level = 1.0, dry_level = 0.0, p = 1.0, sample_rate = 8000)
+    reverb.train()
+    samples = torch.randn(3, 1, 2000)
+    out = reverb(samples)
+
+    for i, ir_id in enumerate(reverb.transform_parameters["ir_ids"].tolist()):
+        ir = reverb.irs[ir_id]
+        # conv1d is a correlation, flip the IR and keep the first num_samples of the linear convolution
+        reference = torch.nn.functional.conv1d(torch.nn.functional.pad(samples[i:i + 1], (ir.shape[0] - 1, 0)), ir.flip(0)[None, None])
+        assert torch.allclose(out[i], reference[0], atol = 1e-4)
+
+
+def test_dry_level_only_leaves_audio_unchanged():
+    reverb = ConvolutionReverbAudiomentation(n_irs = 2, wet_level = 0.0, dry_level = 1.0, p = 1.0, sample_rate = 8000)
+    samples = torch.randn(2, 1, 1000)
+    assert torch.allclose(reverb(samples), samples)
@@ -0,0 +1,47 @@
+import torch
+
+import mulooc.dataloading.dataset as dataset_module
+from mulooc.dataloading.datamodule import AudioDataModule
+from mulooc.models.encoders.frontend import Melgram
+
+
+def load_audio_chunk(path, target_n_samples, target_sr, start = None, start_s = None):
+    return 0.1 * torch.randn(1, int(target_n_samples))
+
+
+def get_datamodule(tmp_path, batch_augment = None):
+    for i in range(4):
+        (tmp_path / f"{i}.wav").touch()
+    datamodule = AudioDataModule(
+        audio_dir = str(tmp_path), target_sr = 8000, target_n_samples = 8000, transform = True,
+        augmentations = {
+            "var": {"augs": {"delay": {"p": 1.0}}, "p": 1},
+            "spec": {"augs": {"time_masking": {"p": 1.0}}, "p": 1},
+        },
+        frontend = Melgram(sample_rate = 8000, f_max = 4000), batch_augment = batch_augment, num_workers = 0,
+    )
+    datamodule.setup()
+    return datamodule
+
+
+def test_batch_augs_follow_the_item_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_module, "load_audio_chunk", load_audio_chunk)
+    item_augs = list(get_datamodule(tmp_path).train_dataset[0]["augs"])
+
+    datamodule = get_datamodule(tmp_path, batch_augment = "after_transfer")
+    batch = torch.utils.data.default_collate([datamodule.train_dataset[i] for i in range(2)])
+    batch = datamodule.augment_batch(batch)
+    assert list(batch["augs"]) == item_augs == ["Delay", "TimeMasking"]
+    assert batch["audio"].shape[:2] == (2, 2)
+
+
+def test_batch_augs_keep_dataset_labels_between_chain_and_spec(tmp_path, monkeypatch):
+    # AudioDataset emits the chain labels, then those of the augmentation bank, then the spec labels
+    monkeypatch.setattr(dataset_module, "load_audio_chunk", load_audio_chunk)
+    datamodule = get_datamodule(tmp_path, batch_augment = "after_transfer")
+    batch = torch.utils.data.default_collate([datamodule.train_dataset[i] for i in range(2)])
+    batch["augs"]["PitchShiftAudiomentation"] = torch.ones(2, 2, dtype = torch.int)
+
+    batch = datamodule.augment_batch(batch)
+    assert list(batch["augs"]) == ["Delay", "PitchShiftAudiomentation", "TimeMasking"]
+    assert torch.equal(batch["augs"]["PitchShiftAudiomentation"], torch.ones(2, 2, dtype = torch.int))
@@ -0,0 +1,109 @@
+import os
+
+import pandas as pd
+import pytest
+import torch
+
+import mulooc.dataloading.feature_store as feature_store_module
+from mulooc.dataloading.augmentations.composition.custom_compose import CustomCompose
+from mulooc.dataloading.datamodule import AudioDataModule
+from mulooc.dataloading.dataset import AudioDataset
+from mulooc.dataloading.feature_store import FeatureStore, get_store_path, is_rendered, render_feature_store
+from mulooc.models.encoders.frontend import Melgram
+
+N_CROPS = 4
+FILES = ["a.wav", "b.wav"]
+
+
+def get_crops(path, target_n_samples, target_sr):
+    # distinct crops, so that views can be told apart
+    return torch.stack([torch.full((1, int(target_n_samples)), 0.1 * (i + 1)) * torch.randn(1, int(target_n_samples)) for i in range(N_CROPS)])
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(feature_store_module, "get_crops", get_crops)
+    monkeypatch.setattr(feature_store_module, "get_audio_duration", lambda path: N_CROPS)
+    frontend = Melgram(sample_rate = 8000, f_max = 4000)
+    render_feature_store(FILES, tmp_path, frontend, 8000, 8000)
+    return FeatureStore(tmp_path, frontend, 8000, FILES)
+
+
+def test_store_path_follows_the_frontend_crop_length_and_files(tmp_path):
+    frontend = Melgram(sample_rate = 8000, f_max = 4000)
+    path = get_store_path(tmp_path, frontend, 8000, FILES)
+    assert get_store_path(tmp_path, Melgram(sample_rate = 8000, f_max = 4000), 8000, FILES) == path
+    # the order of the files (e.g. a reshuffled val split) does not matter, the set does
+    assert get_store_path(tmp_path, frontend, 8000, FILES[::-1]) == path
+    assert get_store_path(tmp_path, frontend, 8000, FILES[:1]) != path
+    assert get_store_path(tmp_path, frontend, 16000, FILES) != path
+    assert get_store_path(tmp_path, Melgram(sample_rate = 8000, f_max = 4000, n_mels = 64), 8000, FILES) != path
+    assert get_store_path(tmp_path, Melgram(sample_rate = 8000, f_max = 4000, hop_length = 80), 8000, FILES) != path
+
+
+def test_other_configuration_is_not_served(store, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        FeatureStore(tmp_path, Melgram(sample_rate = 8000, f_max = 4000, n_mels = 64), 8000, FILES)
+    # a store of some of the files is not one of all of them
+    with pytest.raises(FileNotFoundError):
+        FeatureStore(tmp_path, Melgram(sample_rate = 8000, f_max = 4000), 8000, FILES + ["c.wav"])
+
+
+def test_interrupted_render_is_not_served(tmp_path):
+    frontend = Melgram(sample_rate = 8000, f_max = 4000)
+    store_path = get_store_path(tmp_path, frontend, 8000, FILES)
+    (tmp_path / store_path).mkdir(parents = True)
+    (tmp_path / store_path / "features.npy").touch()
+    assert not is_rendered(store_path)
+    with pytest.raises(FileNotFoundError):
+        FeatureStore(tmp_path, frontend, 8000, FILES)
+
+
+def test_load_follows_the_strategy(store):
+    full = store.load("a.wav")
+    assert full.shape[:2] == (N_CROPS, 1)
+
+    same = store.load("a.wav", 3, "same")
+    assert all(torch.equal(view, same[0]) for view in same)
+
+    adjacent = store.load("a.wav", 3, "adjacent")
+    first = next(i for i in range(N_CROPS) if torch.equal(full[i], adjacent[0]))
+    assert all(torch.equal(adjacent[k], full[first + k]) for k in range(3))
+
+    # more views than crops, each view is one of the crops
+    for view in store.load("a.wav", 8, "random"):
+        assert any(torch.equal(view, crop) for crop in full)
+
+
+def test_dataset_refuses_augmentations_set_after_construction(store):
+    annotations = pd.DataFrame({"file_path": ["a.wav", "b.wav"]})
+    dataset = AudioDataset(annotations, None, 8000, target_n_samples = 8000, feature_store = store)
+    assert dataset[0]["audio"].shape[:2] == (2, 1)
+
+    dataset.transform = True
+    dataset.augmentations = {"base": CustomCompose(transforms = [], p = 0), "var": CustomCompose(transforms = [], p = 0, return_tfms = True)}
+    with pytest.raises(ValueError):
+        dataset[0]
+
+
+def test_datamodule_renders_over_an_interrupted_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(feature_store_module, "get_crops", get_crops)
+    monkeypatch.setattr(feature_store_module, "get_audio_duration", lambda path: N_CROPS)
+    audio_dir = tmp_path / "audio"
+    audio_dir.mkdir()
+    for i in range(4):
+        (audio_dir / f"{i}.wav").touch()
+    frontend = Melgram(sample_rate = 8000, f_max = 4000)
+    datamodule = AudioDataModule(
+        audio_dir = str(audio_dir), target_sr = 8000, target_n_samples = 8000, frontend = frontend,
+        feature_store = str(tmp_path / "store"), num_workers = 0,
+    )
+    file_paths = datamodule.annotations["file_path"].tolist()
+    store_path = get_store_path(tmp_path / "store", frontend, 8000, file_paths)
+    os.makedirs(store_path)
+
+    datamodule.prepare_data()
+    assert is_rendered(store_path)
+    datamodule.setup()
+    assert datamodule.train_dataset.feature_store.path == store_path
+    assert datamodule.train_dataset[0]["audio"].shape[:2] == (2, 1)
@@ -0,0 +1,37 @@
+import math
+
+import pytest
+import torch
+import torchaudio
+
+from mulooc.dataloading.augmentations.custom_pitch_shift import batch_pitch_shift, get_resample_kernel, resample
+
+
+def get_peak_frequency(samples, sample_rate):
+    spectrum = torch.fft.rfft(samples * torch.hann_window(samples.shape[-1]))
+    return spectrum.abs().argmax().item() * sample_rate / samples.shape[-1]
+
+
+@pytest.mark.parametrize("orig_freq, new_freq", [(160, 441), (441, 160), (3, 2)])
+def test_resample_matches_torchaudio(orig_freq, new_freq):
+    samples = torch.randn(2, 4000)
+    out = resample(samples, orig_freq, new_freq, *get_resample_kernel(orig_freq, new_freq))
+    reference = torchaudio.functional.resample(samples, orig_freq, new_freq)
+    assert out.shape == reference.shape
+    assert torch.allclose(out, reference, atol = 1e-4)
+
+
+def test_rows_are_shifted_by_their_own_semitones():
+    sample_rate = 16000
+    t = torch.arange(sample_rate) / sample_rate
+    samples = (0.5 * torch.sin(2 * math.pi * 440 * t))[None].repeat(3, 1)
+    kernels = {}
+    out = batch_pitch_shift(samples, [-3.0, 0.0, 4.0], kernels = kernels)
+
+    assert out.shape == samples.shape
+    assert torch.equal(out[1], samples[1])
+    for row, semitones in [(0, -3), (2, 4)]:
+        expected = 440 * 2 ** (semitones / 12)
+        assert get_peak_frequency(out[row], sample_rate) == pytest.approx(expected, abs = 2)
+    # kernels are kept for the next calls
+    assert len(kernels) == 2
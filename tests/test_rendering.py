@@ -0,0 +1,57 @@
+import pandas as pd
+import torch
+
+import mulooc.dataloading.dataset as dataset_module
+from mulooc.dataloading.augmentations import Delay
+from mulooc.dataloading.augmentations.composition.custom_compose import CustomCompose
+from mulooc.dataloading.dataset import AudioDataset, PrerenderedDataset, get_render_path, render_dataset
+from mulooc.models.encoders.frontend import Melgram
+
+
+def load_audio_chunk(path, target_n_samples, target_sr, start = None, start_s = None):
+    return 0.1 * torch.randn(2, int(target_n_samples))
+
+
+def get_dataset(monkeypatch, target_n_samples = 4000, frontend = None, p = 0.5):
+    monkeypatch.setattr(dataset_module, "load_audio_chunk", load_audio_chunk)
+    annotations = pd.DataFrame({"file_path": [f"{i}.wav" for i in range(3)], "labels": [[0.0, 1.0]] * 3})
+    augmentations = {
+        "base": CustomCompose(transforms = [], p = 0),
+        "var": CustomCompose(transforms = [Delay(p = p, sample_rate = 8000)], p = 1, return_tfms = True),
+    }
+    return AudioDataset(
+        annotations, None, 8000, target_n_samples = target_n_samples, augmentations = augmentations, transform = True,
+        return_labels = True, return_clean_audio = True, frontend = frontend
+    )
+
+
+def test_render_path_follows_the_configuration(monkeypatch, tmp_path):
+    path = get_render_path(tmp_path, get_dataset(monkeypatch))
+    assert get_render_path(tmp_path, get_dataset(monkeypatch)) == path
+    assert get_render_path(tmp_path, get_dataset(monkeypatch, target_n_samples = 8000)) != path
+    assert get_render_path(tmp_path, get_dataset(monkeypatch, p = 0.9)) != path
+    assert get_render_path(tmp_path, get_dataset(monkeypatch, frontend = Melgram(sample_rate = 8000, f_max = 4000))) != path
+    assert get_render_path(tmp_path, get_dataset(monkeypatch), seed = 1) != path
+
+
+def test_rendered_set_has_the_keys_of_the_live_set(monkeypatch, tmp_path):
+    dataset = get_dataset(monkeypatch)
+    render_path = render_dataset(dataset, tmp_path)
+    assert render_path == get_render_path(tmp_path, dataset)
+
+    rendered = PrerenderedDataset(render_path)
+    assert len(rendered) == len(dataset)
+    item, live_item = rendered[1], dataset[1]
+    assert set(item) == set(live_item)
+    assert set(item["augs"]) == set(live_item["augs"])
+    assert item["audio"].shape == live_item["audio"].shape
+    assert item["clean_audio"].shape == live_item["clean_audio"].shape
+    assert torch.equal(item["labels"], live_item["labels"])
+
+
+def test_rendered_set_is_reproducible(monkeypatch, tmp_path):
+    first = PrerenderedDataset(render_dataset(get_dataset(monkeypatch), tmp_path / "first"))
+    second = PrerenderedDataset(render_dataset(get_dataset(monkeypatch), tmp_path / "second"))
+    for i in range(len(first)):
+        assert torch.equal(first[i]["audio"], second[i]["audio"])
+        assert torch.equal(first[i]["augs"]["Delay"], second[i]["augs"]["Delay"])
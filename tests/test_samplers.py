@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from mulooc.dataloading.samplers import DurationSampler, ResumableDataLoader, ShuffleSampler
+
+
+def get_bins(plan, crop_len_s):
+    # the jittered start of a crop stays within half a crop of its region
+    return [(f, int(round(start_s / crop_len_s))) for f, start_s in plan]
+
+
+def test_duration_stratified_covers_every_region_once():
+    durations = [40.0, 10.0, 25.0]
+    sampler = DurationSampler(range(3), durations, crop_len_s = 10, mode = "stratified", num_replicas = 1, rank = 0)
+    plan = list(sampler)
+
+    assert len(plan) == 4 + 1 + 3
+    assert sorted(get_bins(plan, 10)) == [(0, 0), (0, 1), (0, 2), (0, 3), (1, 0), (2, 0), (2, 1), (2, 2)]
+    for f, start_s in plan:
+        assert 0 <= start_s <= max(durations[f] - 10, 0)
+    assert sampler.coverage_fraction() == 1
+
+
+def test_duration_proportional_prefers_unseen_regions():
+    sampler = DurationSampler(range(1), [40.0], crop_len_s = 10, epoch_hours = 4 * 10 / 3600, num_replicas = 1, rank = 0)
+
+    first = get_bins(list(sampler), 10)
+    assert sorted(first) == [(0, 0), (0, 1), (0, 2), (0, 3)]
+    assert sampler.coverage_fraction() == 1
+
+    # once covered, the file starts a new pass
+    sampler.set_epoch(1)
+    second = get_bins(list(sampler), 10)
+    assert sorted(second) == sorted(first)
+
+
+def test_duration_proportional_follows_durations():
+    durations = np.array([90.0, 10.0])
+    sampler = DurationSampler(range(2), durations, crop_len_s = 10, epoch_hours = 2000 * 10 / 3600, num_replicas = 1, rank = 0)
+    files = np.array([f for f, _ in sampler])
+    assert np.mean(files == 0) == pytest.approx(0.9, abs = 0.03)
+
+
+def test_duration_requires_one_duration_per_file():
+    with pytest.raises(ValueError):
+        DurationSampler(range(3), [10.0, 20.0], crop_len_s = 10, num_replicas = 1, rank = 0)
+
+
+def test_resume_mid_epoch_continues_the_same_plan():
+    sampler = ShuffleSampler(range(10), num_replicas = 1, rank = 0, seed = 3)
+    plan = list(sampler)
+
+    iterator = iter(sampler)
+    consumed = [next(iterator) for _ in range(4)]
+    state_dict = sampler.state_dict()
+    assert state_dict["position"] == 4
+
+    resumed = ShuffleSampler(range(10), num_replicas = 1, rank = 0, seed = 3)
+    resumed.load_state_dict(state_dict)
+    assert consumed + list(resumed) == plan
+
+
+def test_position_is_bounded_by_the_yielded_count():
+    # 10 samples in batches of 4: the last batch holds 2, the trainer's count of 3 batches says 12
+    sampler = ShuffleSampler(range(10), num_replicas = 1, rank = 0)
+    list(sampler)
+    assert sampler.state_dict(position = 12)["position"] == 10
+    assert sampler.state_dict(position = 4)["position"] == 4
+
+    # a new epoch starts from the beginning
+    sampler.set_epoch(1)
+    assert sampler.state_dict()["position"] == 0
+
+
+def test_resume_after_epoch_end_replays_coverage():
+    sampler = DurationSampler(range(2), [40.0, 20.0], crop_len_s = 10, num_replicas = 1, rank = 0)
+    list(sampler)
+    state_dict = sampler.state_dict()
+
+    resumed = DurationSampler(range(2), [40.0, 20.0], crop_len_s = 10, num_replicas = 1, rank = 0)
+    resumed.load_state_dict(state_dict)
+    resumed.set_epoch(1)
+    sampler.set_epoch(1)
+    assert list(resumed) == list(sampler)
+    assert np.array_equal(resumed.coverage, sampler.coverage)
+
+
+def test_loader_state_uses_the_sampler_count():
+    sampler = ShuffleSampler(range(10), num_replicas = 1, rank = 0)
+    loader = ResumableDataLoader(range(10), batch_size = 4, sampler = sampler)
+    batches = list(loader)
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert loader.state_dict()["sampler"]["position"] == 10
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+import mulooc.dataloading.tempo_stretch_cache as tempo_stretch_cache_module
+from mulooc.dataloading.tempo_stretch_cache import TempoStretchCache, get_cache_path, render_tempo_stretch_cache
+
+FACTORS = [0.9, 1.0, 1.1]
+
+
+def one_hot(tempo, n_classes = 300):
+    labels = np.zeros(n_classes)
+    labels[tempo] = 1
+    return labels
+
+
+@pytest.fixture
+def annotations(monkeypatch):
+    monkeypatch.setattr(tempo_stretch_cache_module, "load_full_audio", lambda path, target_sr: 0.1 * torch.randn(1, 8000))
+    return pd.DataFrame({"file_path": ["slow.wav", "fast.wav"], "labels": [one_hot(100), one_hot(280)]})
+
+
+def test_render_empty_annotations(tmp_path):
+    empty = pd.DataFrame({"file_path": [], "labels": []})
+    render_tempo_stretch_cache(empty, tmp_path, 8000, [0.9, 1.0])
+    assert TempoStretchCache(tmp_path, empty, 8000, [0.9, 1.0]).files == {}
+
+
+def test_factors_keep_the_tempo_inside_the_labels(tmp_path, annotations):
+    render_tempo_stretch_cache(annotations, tmp_path, 8000, FACTORS)
+
+    cache = TempoStretchCache(tmp_path, annotations, 8000, FACTORS)
+    assert list(cache.files["slow.wav"]["renders"]) == [0.9, 1.0, 1.1]
+    assert list(cache.files["fast.wav"]["renders"]) == [0.9, 1.0]
+
+    audio, labels = cache.load("fast.wav", torch.tensor(one_hot(280)), 2, 4000)
+    assert audio.shape == (2, 1, 4000)
+    assert labels.argmax().item() in [int(280 * 0.9), 280]
+
+
+def test_cache_path_follows_the_configuration(tmp_path, annotations):
+    path = get_cache_path(tmp_path, annotations, 8000, FACTORS)
+    assert get_cache_path(tmp_path, annotations.iloc[::-1], 8000, FACTORS) == path
+    assert get_cache_path(tmp_path, annotations.iloc[:1], 8000, FACTORS) != path
+    assert get_cache_path(tmp_path, annotations, 16000, FACTORS) != path
+    assert get_cache_path(tmp_path, annotations, 8000, FACTORS[:2]) != path
+    wider = annotations.assign(labels = [one_hot(100, 400), one_hot(280, 400)])
+    assert get_cache_path(tmp_path, wider, 8000, FACTORS) != path
+
+
+def test_other_configuration_is_not_served(tmp_path, annotations):
+    render_tempo_stretch_cache(annotations, tmp_path, 8000, FACTORS)
+    with pytest.raises(FileNotFoundError):
+        TempoStretchCache(tmp_path, annotations, 16000, FACTORS)
+    with pytest.raises(FileNotFoundError):
+        TempoStretchCache(tmp_path, annotations, 8000, FACTORS[:2])
+
+
+def test_loaded_index_is_checked(tmp_path, annotations):
+    path = render_tempo_stretch_cache(annotations, tmp_path, 8000, FACTORS)
+    # a cache moved under the key of another configuration
+    other = get_cache_path(tmp_path, annotations, 16000, FACTORS)
+    os.rename(path, other)
+    with pytest.raises(ValueError):
+        TempoStretchCache(tmp_path, annotations, 16000, FACTORS)
+
+
+def test_interrupted_render_is_not_served(tmp_path, annotations):
+    path = get_cache_path(tmp_path, annotations, 8000, FACTORS)
+    os.makedirs(path)
+    open(os.path.join(path, "audio.f16"), "wb").close()
+    with pytest.raises(FileNotFoundError):
+        TempoStretchCache(tmp_path, annotations, 8000, FACTORS)
+
+
+def test_unreadable_files_are_kept_without_renders(tmp_path, annotations, monkeypatch):
+    def load_full_audio(path, target_sr):
+        if path == "fast.wav":
+            raise RuntimeError("unreadable")
+        return 0.1 * torch.randn(1, 8000)
+    monkeypatch.setattr(tempo_stretch_cache_module, "load_full_audio", load_full_audio)
+    render_tempo_stretch_cache(annotations, tmp_path, 8000, FACTORS)
+
+    cache = TempoStretchCache(tmp_path, annotations, 8000, FACTORS)
+    with pytest.raises(ValueError):
+        cache.load("fast.wav", torch.tensor(one_hot(280)), 2, 4000)
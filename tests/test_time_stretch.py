@@ -0,0 +1,43 @@
+import math
+
+import librosa
+import numpy as np
+import pytest
+import torch
+
+from mulooc.dataloading.augmentations.time_stretch import phase_vocoder_stretch
+
+
+def get_signal(n_samples = 22050, sample_rate = 22050):
+    t = torch.arange(n_samples) / sample_rate
+    return 0.3 * torch.sin(2 * math.pi * 440 * t) + 0.2 * torch.sin(2 * math.pi * 660 * t) * torch.exp(-t)
+
+
+@pytest.mark.parametrize("rate", [0.8, 1.25])
+def test_close_to_librosa(rate):
+    samples = get_signal()
+    out = phase_vocoder_stretch(samples[None], [rate])[0].numpy()
+
+    reference = librosa.effects.time_stretch(samples.numpy(), rate = rate, n_fft = 2048, hop_length = 512)
+    n = min(len(reference), len(out))
+    reference = np.pad(reference, (0, max(len(out) - len(reference), 0)))[:len(out)]
+    # away from the edges, where librosa's output length differs
+    error = np.abs(out[2048:n - 2048] - reference[2048:n - 2048]).max()
+    assert error < 1e-3
+
+
+def test_rows_are_stretched_by_their_own_rate():
+    samples = get_signal()[None].repeat(3, 1)
+    out = phase_vocoder_stretch(samples, [0.8, 1.0, 1.25])
+    assert out.shape == samples.shape
+    # sped up rows end early, the others fill the output
+    assert out[2, -100:].abs().max() == 0
+    assert out[0, -4096:-2048].abs().max() > 0.1
+    for i, rate in enumerate([0.8, 1.0, 1.25]):
+        assert torch.allclose(out[i], phase_vocoder_stretch(samples[i:i + 1], [rate])[0], atol = 1e-5)
+
+
+def test_output_length():
+    out = phase_vocoder_stretch(get_signal()[None], [0.5], n_output_samples = 44100)
+    assert out.shape == (1, 44100)
+    assert out[0, 40000:42000].abs().max() > 0.1